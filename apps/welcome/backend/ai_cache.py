@@ -0,0 +1,298 @@
+"""
+Content-addressed cache for AI generations.
+
+The key is a hash of the endpoint, its normalized inputs (strings trimmed,
+whitespace collapsed and case-folded; manual text reduced to a content
+hash), the model, generation config and prompt-template version, so an
+identical request is answered without calling Gemini again.
+
+Two tiers: an in-memory LRU in front of a SQLite file that survives
+restarts. Both expire entries after AI_CACHE_SECONDS; the SQLite tier also
+evicts least recently used entries beyond AI_CACHE_MAX_ENTRIES or
+AI_CACHE_MAX_BYTES. Values are stored as JSON, so every hit returns a fresh
+copy that callers may modify.
+
+Concurrent misses for the same key are coalesced: the first request runs
+the generation and the others await its result.
+
+    key = ai_cache.cache_key("suggest-child-assets", inputs, model=..., template_version=...)
+    suggestions = await ai_cache.get_or_generate(key, generate, bypass=input_data.bypass_cache)
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cache import TTLCache
+from llm_gateway import PrioritySingleFlight, config_key
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_SECONDS = float(os.getenv("AI_CACHE_SECONDS", str(7 * 24 * 3600)))
+AI_CACHE_MEMORY_SIZE = int(os.getenv("AI_CACHE_MEMORY_SIZE", "256"))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+AI_CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# Set to an empty string to keep the cache in memory only
+AI_CACHE_PATH = os.getenv(
+    "AI_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ai_responses.sqlite3"),
+)
+
+def normalize(value: Any) -> Any:
+    """Canonical form of request inputs for keying"""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in sorted(value.items()) if v not in (None, "")}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    return value
+
+def content_hash(text: Optional[str]) -> Optional[str]:
+    """Hash of a document (e.g. manual text) for use as a key input"""
+    if not text:
+        return None
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def cache_key(
+    endpoint: str,
+    inputs: Dict[str, Any],
+    *,
+    model: str,
+    template_version: str,
+    generation_config: Any = None,
+    system_instruction: Optional[str] = None,
+) -> str:
+    material = json.dumps(
+        {
+            "endpoint": endpoint,
+            "inputs": normalize(inputs),
+            "model": model,
+            "generation_config": config_key(generation_config),
+            "system_instruction": system_instruction,
+            "template_version": template_version,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class SQLiteResponseStore:
+    """Persistent tier: one table of JSON values with expiry and LRU eviction"""
+    def __init__(self, path: str, max_entries: int = AI_CACHE_MAX_ENTRIES, max_bytes: int = AI_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ai_responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ai_responses_accessed ON ai_responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM ai_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM ai_responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE ai_responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM ai_responses WHERE expires_at <= ?", (now,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM ai_responses ORDER BY accessed_at").fetchall()
+        doomed = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM ai_responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_responses"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "size": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class AIResponseCache:
+    def __init__(self, path: str = AI_CACHE_PATH, ttl: float = AI_CACHE_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=AI_CACHE_MEMORY_SIZE, ttl=ttl)
+        self.store: Optional[SQLiteResponseStore] = None
+        self._store_failed = False
+        self._flights = PrioritySingleFlight()
+        self.bypasses = 0
+
+    def _get_store(self) -> Optional[SQLiteResponseStore]:
+        # Opened on first use so importing the app doesn't touch the filesystem
+        if self.store is None and self.path and not self._store_failed:
+            try:
+                self.store = SQLiteResponseStore(self.path)
+            except (OSError, sqlite3.Error) as e:
+                self._store_failed = True
+                logger.warning(f"⚠️ AI response cache is memory-only, could not open {self.path}: {e}")
+        return self.store
+
+    async def get(self, key: str) -> Any:
+        encoded = self.memory.get(key)
+        store = self._get_store() if encoded is None else None
+        if store is not None:
+            try:
+                encoded = await asyncio.to_thread(store.get, key)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ AI response cache read failed: {e}")
+            if encoded is not None:
+                self.memory.set(key, encoded)
+        return None if encoded is None else json.loads(encoded)
+
+    async def set(self, key: str, value: Any) -> None:
+        encoded = json.dumps(value)
+        self.memory.set(key, encoded)
+        store = self._get_store()
+        if store is not None:
+            try:
+                await asyncio.to_thread(store.set, key, encoded, self.ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ AI response cache write failed: {e}")
+
+    async def get_or_generate(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[Any]],
+        *,
+        bypass: bool = False,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Cached value for key, or the result of generate() (stored unless None,
+        or cacheable(value) is false, e.g. for a partial result).
+        Concurrent callers with the same key share one generate() call.
+        bypass=True skips the lookup but still stores the fresh result.
+        """
+        if bypass:
+            self.bypasses += 1
+        else:
+            cached = await self.get(key)
+            if cached is not None:
+                logger.info(f"🗃️ AI response cache hit {key[:12]}")
+                return cached
+
+        async def generate_and_store() -> str:
+            value = await generate()
+            if value is not None and (cacheable is None or cacheable(value)):
+                await self.set(key, value)
+            return json.dumps(value)
+
+        if self._flights.is_in_flight(key):
+            logger.info(f"🔗 Joined in-flight AI generation {key[:12]}")
+        encoded = await self._flights.do(key, generate_and_store)
+        # Every caller gets its own copy of the shared result
+        return json.loads(encoded)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.store.stats() if self.store is not None else None,
+            "bypasses": self.bypasses,
+            # "shared" = generations saved by joining an identical in-flight request
+            "single_flight": self._flights.stats(),
+        }
+
+ai_cache = AIResponseCache()
+
+async def get_or_generate(
+    key: str,
+    generate: Callable[[], Awaitable[Any]],
+    *,
+    bypass: bool = False,
+    cacheable: Optional[Callable[[Any], bool]] = None,
+) -> Any:
+    return await ai_cache.get_or_generate(key, generate, bypass=bypass, cacheable=cacheable)
+
+async def get_cached(key: str) -> Any:
+    """Cached value for key without generating on a miss"""
+    return await ai_cache.get(key)
+
+async def store(key: str, value: Any) -> None:
+    await ai_cache.set(key, value)
+
+def close() -> None:
+    """Close the SQLite tier (called from the app lifespan)"""
+    ai_cache.close()
+
+def get_ai_cache_stats() -> Dict[str, Any]:
+    return ai_cache.stats()
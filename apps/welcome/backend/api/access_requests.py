@@ -9,8 +9,11 @@ from typing import Optional, List
 import uuid
 
 # Reuse existing auth and database infrastructure
-from auth import verify_supabase_token, AuthenticatedUser
-from database import get_service_supabase_client
+from api.resend_client import send_email
+from auth import verify_supabase_token, verify_supabase_token_remote, require_super_admin, AuthenticatedUser
+from database import get_service_supabase_client, run_db
+from repositories import AccessRequestsRepository, PMLeadsRepository
+from memberships import invalidate_user_memberships
 # Email templates import removed - using Supabase invite system
 
 router = APIRouter()
@@ -44,8 +47,6 @@ class RejectionRequest(BaseModel):
 
 async def send_notification_email(email: str, full_name: str, company_name: str = None):
     """Send email notification to support when user requests access"""
-    import resend
-
     # Check if RESEND_KEY is configured
     if not os.getenv("RESEND_KEY"):
         print("Warning: RESEND_KEY not configured, simulating access request notification")
@@ -54,9 +55,6 @@ async def send_notification_email(email: str, full_name: str, company_name: str
         print(f"  Company: {company_name or 'Not specified'}")
         return {"status": "simulated"}
 
-    # Initialize Resend
-    resend.api_key = os.getenv("RESEND_KEY")
-
     # Create access request notification email
     subject = f"New Access Request - {full_name} from {company_name or 'Unknown Company'}"
 
@@ -114,12 +112,12 @@ async def send_notification_email(email: str, full_name: str, company_name: str
 
     try:
         # Send email using Resend
-        response = resend.Emails.send({
+        response = await send_email({
             "from": "ArcTecFox PM Planner <notifications@arctecfox.ai>",
             "to": ["support@arctecfox.ai"],
             "subject": subject,
             "html": html_content
-        })
+        }, api_key=os.getenv("RESEND_KEY"))
 
         print(f"✅ Access request notification sent to support@arctecfox.co: {response}")
         return {"status": "sent", "email_id": response.get("id")}
@@ -134,16 +132,17 @@ async def create_access_request(request: AccessRequestCreate):
     """Public endpoint to create access request - linked to test plan"""
     try:
         supabase = get_service_supabase_client()
+        access_requests = AccessRequestsRepository()
         
         # Check if email already has a pending request
-        existing_request = supabase.table("access_requests").select("*").eq("email", request.email).eq("status", "pending").execute()
+        existing_requests = await access_requests.find_pending_by_email(request.email)
         
-        if existing_request.data:
+        if existing_requests:
             raise HTTPException(status_code=400, detail="An access request is already pending for this email")
         
         # Check if user already exists in auth
         try:
-            existing_user = supabase.auth.admin.get_user_by_email(request.email)
+            existing_user = await run_db(supabase.auth.admin.get_user_by_email, request.email)
             if existing_user.data:
                 raise HTTPException(status_code=400, detail="An account with this email already exists")
         except Exception:
@@ -154,8 +153,8 @@ async def create_access_request(request: AccessRequestCreate):
         company_name = None
         if request.lead_id:
             try:
-                lead_data = supabase.table("pm_leads").select("org_name").eq("id", str(request.lead_id)).single().execute()
-                company_name = lead_data.data.get("org_name") if lead_data.data else None
+                lead = await PMLeadsRepository().first("org_name", id=str(request.lead_id))
+                company_name = lead.get("org_name") if lead else None
             except Exception:
                 pass
         
@@ -167,9 +166,9 @@ async def create_access_request(request: AccessRequestCreate):
             "status": "pending"
         }
         
-        result = supabase.table("access_requests").insert(access_request_data).execute()
+        created = await access_requests.insert(access_request_data)
         
-        if not result.data:
+        if not created:
             raise HTTPException(status_code=500, detail="Failed to create access request")
         
         # Send notification email to support
@@ -193,35 +192,15 @@ async def get_access_requests(
 ):
     """Get access requests - super admin only"""
     try:
-        supabase = get_service_supabase_client()
-        
-        # Check if user is super admin - reuse existing auth pattern
-        user_roles = supabase.table("company_users")\
-            .select("roles!inner(name)")\
-            .eq("user_id", current_user.id)\
-            .execute()
-        
-        is_super_admin = any(
-            role["roles"]["name"] == "super_admin" 
-            for role in user_roles.data
-        )
-        
-        if not is_super_admin:
-            raise HTTPException(status_code=403, detail="Super admin access required")
+        # Check if user is super admin - cached membership lookup
+        await require_super_admin(current_user)
         
         # Get access requests - simplified without pm_leads join since schema changed
-        query = supabase.table("access_requests")\
-            .select("*")\
-            .order("requested_at", desc=True)
-        
-        if status:
-            query = query.eq("status", status)
-        
-        result = query.execute()
+        rows = await AccessRequestsRepository().list_by_status(status)
         
         # Format response
         requests = []
-        for req in result.data:
+        for req in rows:
             lead_data = req.get("pm_leads")
             requests.append(AccessRequestResponse(
                 id=req["id"],
@@ -243,43 +222,26 @@ async def get_access_requests(
 @router.post("/approve-access")
 async def approve_access_request(
     approval: ApprovalRequest,
-    current_user: AuthenticatedUser = Depends(verify_supabase_token)
+    current_user: AuthenticatedUser = Depends(verify_supabase_token_remote)
 ):
     """Approve access request and create user account - super admin only"""
     try:
         supabase = get_service_supabase_client()
+        access_requests = AccessRequestsRepository()
         
         # Check super admin permission
-        user_roles = supabase.table("company_users")\
-            .select("roles!inner(name)")\
-            .eq("user_id", current_user.id)\
-            .execute()
-        
-        is_super_admin = any(
-            role["roles"]["name"] == "super_admin" 
-            for role in user_roles.data
-        )
-        
-        if not is_super_admin:
-            raise HTTPException(status_code=403, detail="Super admin access required")
+        await require_super_admin(current_user)
         
         # Get access request
-        request_result = supabase.table("access_requests")\
-            .select("*")\
-            .eq("id", approval.request_id)\
-            .eq("status", "pending")\
-            .single()\
-            .execute()
+        access_request = await access_requests.get_pending(approval.request_id)
         
-        if not request_result.data:
+        if not access_request:
             raise HTTPException(status_code=404, detail="Access request not found or already processed")
-        
-        access_request = request_result.data
 
         # Create Supabase auth user with invite
         try:
             # Create auth user and send Supabase invite email
-            auth_response = supabase.auth.admin.create_user({
+            auth_response = await run_db(supabase.auth.admin.create_user, {
                 "email": access_request["email"],
                 "email_confirm": False,  # Will be confirmed when user sets password via invite
                 "user_metadata": {
@@ -297,41 +259,34 @@ async def approve_access_request(
             print(f"❌ Failed to create auth user: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to create account: {str(e)}")
 
-        # Create user record
-        user_data = {
-            "id": user_id,
-            "email": access_request["email"],
-            "full_name": access_request.get("full_name")
-        }
-        supabase.table("users").insert(user_data).execute()
-
-        # Create company_users record
-        company_user_data = {
-            "user_id": user_id,
-            "company_id": approval.company_id,
-            "role_id": approval.role_id
-        }
-        supabase.table("company_users").insert(company_user_data).execute()
-
-        # Update access request status
-        supabase.table("access_requests")\
-            .update({
-                "status": "approved",
-                "approved_at": datetime.now().isoformat(),
-                "approved_by": current_user.id,
-                "assigned_company_id": approval.company_id,
-                "assigned_role_id": approval.role_id,
-                "notes": approval.notes
-            })\
-            .eq("id", approval.request_id)\
-            .execute()
+        # Create the users and company_users records and mark the request
+        # approved in one transaction (approve_access_request RPC)
+        try:
+            await access_requests.approve(
+                request_id=approval.request_id,
+                user_id=user_id,
+                company_id=approval.company_id,
+                role_id=approval.role_id,
+                approved_by=current_user.id,
+                notes=approval.notes
+            )
+        except Exception as e:
+            print(f"❌ Failed to record approval, removing auth user {user_id}: {str(e)}")
+            # Nothing was written by the RPC; undo the auth user so the request can be retried
+            try:
+                await run_db(supabase.auth.admin.delete_user, user_id)
+            except Exception as cleanup_error:
+                print(f"⚠️ Failed to remove auth user {user_id}: {str(cleanup_error)}")
+            raise HTTPException(status_code=500, detail="Failed to approve access request")
+        invalidate_user_memberships(user_id)
 
         # Send Supabase invite email with correct redirect URL
         try:
             # Get frontend URL from environment (production URL)
             frontend_url = os.getenv("FRONTEND_URL", "https://arctecfox-mono.vercel.app")
 
-            invite_response = supabase.auth.admin.invite_user_by_email(
+            invite_response = await run_db(
+                supabase.auth.admin.invite_user_by_email,
                 access_request["email"],
                 {"redirect_to": f"{frontend_url}/login"}
             )
@@ -356,38 +311,21 @@ async def approve_access_request(
 @router.post("/reject-access")
 async def reject_access_request(
     rejection: RejectionRequest,
-    current_user: AuthenticatedUser = Depends(verify_supabase_token)
+    current_user: AuthenticatedUser = Depends(verify_supabase_token_remote)
 ):
     """Reject access request - super admin only"""
     try:
-        supabase = get_service_supabase_client()
-        
         # Check super admin permission
-        user_roles = supabase.table("company_users")\
-            .select("roles!inner(name)")\
-            .eq("user_id", current_user.id)\
-            .execute()
-        
-        is_super_admin = any(
-            role["roles"]["name"] == "super_admin" 
-            for role in user_roles.data
-        )
-        
-        if not is_super_admin:
-            raise HTTPException(status_code=403, detail="Super admin access required")
+        await require_super_admin(current_user)
         
         # Update access request status
-        result = supabase.table("access_requests")\
-            .update({
-                "status": "rejected",
-                "approved_by": current_user.id,
-                "rejection_reason": rejection.rejection_reason
-            })\
-            .eq("id", rejection.request_id)\
-            .eq("status", "pending")\
-            .execute()
+        updated = await AccessRequestsRepository().update({
+            "status": "rejected",
+            "approved_by": current_user.id,
+            "rejection_reason": rejection.rejection_reason
+        }, id=rejection.request_id, status="pending")
         
-        if not result.data:
+        if not updated:
             raise HTTPException(status_code=404, detail="Access request not found or already processed")
         
         return {
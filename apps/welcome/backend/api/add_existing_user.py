@@ -10,6 +10,10 @@ from fastapi import HTTPException, Depends
 from pydantic import BaseModel, EmailStr
 from auth import AuthenticatedUser, verify_supabase_token
 from database import get_user_supabase_client
+from memberships import get_user_memberships, invalidate_user_memberships
+from reference_data import get_role, get_site
+from repositories import InvitationsRepository, SiteUsersRepository, UsersRepository
+from timing import StepTimer
 
 logger = logging.getLogger(__name__)
 
@@ -52,24 +56,36 @@ async def add_existing_user_to_site(
         HTTPException: If validation fails or operation is not permitted
     """
     
+    timer = StepTimer("add_existing_user")
     try:
         logger.info(f"Admin {admin_user.email} requesting to add existing user {request.email} to site {request.site_id}")
         
         # Get user-scoped Supabase client (respects RLS)
         supabase = get_user_supabase_client(admin_user.token)
-        
-        # 1. Validate admin has permission for this site
-        admin_check = await supabase.table('site_users').select(
-            'id, role_id, roles(name)'
-        ).eq('user_id', admin_user.user_id).eq('site_id', request.site_id).execute()
-        
-        if not admin_check.data:
+        site_users = SiteUsersRepository(supabase)
+        
+        # Lookups that only need the request run concurrently:
+        #   admin memberships, target user, target site, default role (cached reference data)
+        #   -> target memberships + existing site link (need the target user id)
+        #   -> invitation history (only if the target has no company yet)
+        # Results are still checked in the original order so errors are unchanged.
+        admin_task = timer.start("admin_memberships", get_user_memberships(admin_user.id))
+        user_task = timer.start("target_user", UsersRepository(supabase).find_by_email(request.email, 'id, email, full_name'))
+        site_task = timer.start("site", get_site(request.site_id))
+        role_task = None
+        if not request.role_id:
+            role_task = timer.start("default_role", get_role('user'))
+        
+        # 1. Validate admin has permission for this site (cached membership lookup)
+        admin_memberships = await admin_task
+        
+        if not admin_memberships.has_site(request.site_id):
             raise HTTPException(
                 status_code=403, 
                 detail="You do not have permission to manage users for this site"
             )
         
-        admin_role = admin_check.data[0]['roles']['name']
+        admin_role = admin_memberships.site_role(request.site_id)
         if admin_role not in ['company_admin', 'super_admin']:
             raise HTTPException(
                 status_code=403,
@@ -77,27 +93,25 @@ async def add_existing_user_to_site(
             )
         
         # 2. Find the existing user by email
-        existing_user_check = await supabase.table('users').select(
-            'id, email, full_name'
-        ).eq('email', request.email).execute()
+        target_user = await user_task
         
-        if not existing_user_check.data:
+        if not target_user:
             raise HTTPException(
                 status_code=404,
                 detail=f"No user found with email {request.email}. Use the invitation system for new users."
             )
         
-        target_user = existing_user_check.data[0]
         target_user_id = target_user['id']
         
         logger.info(f"Found existing user: {target_user_id} ({target_user['email']})")
         
+        membership_task = timer.start("existing_membership", site_users.find_membership(target_user_id, request.site_id))
+        target_memberships_task = timer.start("target_memberships", get_user_memberships(target_user_id))
+        
         # 3. Check if user is already a member of this site
-        existing_membership = await supabase.table('site_users').select(
-            'id'
-        ).eq('user_id', target_user_id).eq('site_id', request.site_id).execute()
+        existing_membership = await membership_task
         
-        if existing_membership.data:
+        if existing_membership:
             raise HTTPException(
                 status_code=409,
                 detail="This user is already a member of the selected site"
@@ -105,39 +119,30 @@ async def add_existing_user_to_site(
         
         # 4. Validate company scope - ensure target user is within same company
         # Get the target site's company
-        site_info = await supabase.table('sites').select(
-            'company_id, companies(name)'
-        ).eq('id', request.site_id).execute()
+        site_info = await site_task
         
-        if not site_info.data:
+        if not site_info:
             raise HTTPException(status_code=404, detail="Site not found")
         
-        target_company_id = site_info.data[0]['company_id']
-        target_company_name = site_info.data[0]['companies']['name']
+        target_company_id = site_info['company_id']
+        target_company_name = site_info['companies']['name']
         
         logger.info(f"Target site belongs to company: {target_company_id} ({target_company_name})")
         
         # Check if target user belongs to the same company (through any site membership)
-        user_company_check = await supabase.table('site_users').select(
-            'sites(company_id, companies(name))'
-        ).eq('user_id', target_user_id).execute()
-        
-        user_companies = set()
-        if user_company_check.data:
-            for membership in user_company_check.data:
-                if membership['sites'] and membership['sites']['company_id']:
-                    user_companies.add(membership['sites']['company_id'])
+        target_memberships = await target_memberships_task
+        user_companies = set(target_memberships.site_company_ids)
         
         # If user has no company associations, check invitation history
         if not user_companies:
             logger.info("User has no current company associations, checking invitation history...")
             
-            invitation_check = await supabase.table('invitations').select(
-                'invited_by, sites(company_id)'
-            ).eq('email', request.email).eq('accepted_at', None, operator='is not').execute()
+            accepted_invitations = await timer.run("invitation_history", InvitationsRepository(supabase).accepted_for_email(
+                request.email, 'invited_by, sites(company_id)'
+            ))
             
-            if invitation_check.data:
-                for invitation in invitation_check.data:
+            if accepted_invitations:
+                for invitation in accepted_invitations:
                     if invitation['sites'] and invitation['sites']['company_id']:
                         user_companies.add(invitation['sites']['company_id'])
         
@@ -155,29 +160,28 @@ async def add_existing_user_to_site(
         # 5. Get default role if not specified
         role_id = request.role_id
         if not role_id:
-            default_role = await supabase.table('roles').select(
-                'id'
-            ).eq('name', 'user').execute()
+            default_role = await role_task
             
-            if default_role.data:
-                role_id = default_role.data[0]['id']
+            if default_role:
+                role_id = default_role['id']
             else:
                 raise HTTPException(status_code=500, detail="Default user role not found")
         
         # 6. Add user to site
-        new_membership = await supabase.table('site_users').insert([{
+        new_membership = await timer.run("insert_site_user", site_users.insert([{
             'user_id': target_user_id,
             'site_id': request.site_id,
             'role_id': role_id,
             'can_edit': request.can_edit,
-            'added_by': admin_user.user_id,  # Audit trail
+            'added_by': admin_user.id,  # Audit trail
             'added_method': 'direct_addition'  # Track how they were added vs invitation
-        }]).execute()
+        }]))
         
-        if not new_membership.data:
+        if not new_membership:
             raise HTTPException(status_code=500, detail="Failed to add user to site")
         
-        site_user_id = new_membership.data[0]['id']
+        site_user_id = new_membership[0]['id']
+        invalidate_user_memberships(target_user_id)
         
         logger.info(f"✅ Successfully added user {target_user_id} to site {request.site_id} as site_user {site_user_id}")
         
@@ -196,4 +200,7 @@ async def add_existing_user_to_site(
         raise HTTPException(
             status_code=500,
             detail=f"Failed to add user to site: {str(e)}"
-        )
\ No newline at end of file
+        )
+    finally:
+        timer.close()
+        logger.info(timer.summary())
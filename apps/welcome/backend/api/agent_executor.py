@@ -2,29 +2,43 @@
 Generic Agent Executor for AI-powered agents
 """
 import os
-import json
 import logging
 from typing import Dict, Any, Optional
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, Field
-import google.generativeai as genai
+from pydantic import BaseModel, Field, validator
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth import verify_supabase_token, AuthenticatedUser
 from prompts.agent_prompts import get_agent_prompt
+import llm_gateway
+from llm_json import loads_tolerant
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Models a client may ask for; each one gets its own gateway limiter
+AGENT_DEFAULT_MODEL = "gemini-1.5-flash"
+AGENT_MODELS = tuple(
+    name.strip()
+    for name in os.getenv("AGENT_MODELS", "gemini-1.5-flash,gemini-1.5-pro,gemini-2.0-flash-exp").split(",")
+    if name.strip()
+)
+
 
 class AgentRequest(BaseModel):
     """Generic agent request model"""
     agent_type: str = Field(..., description="Type of agent to use (MVP_PLANNER, PM_TASK_GENERATOR, etc.)")
     parameters: Dict[str, Any] = Field(..., description="Parameters for the agent prompt")
-    model: Optional[str] = Field("gemini-1.5-flash", description="AI model to use")
+    model: Optional[str] = Field(AGENT_DEFAULT_MODEL, description="AI model to use (one of AGENT_MODELS)")
     temperature: Optional[float] = Field(0.7, ge=0, le=1, description="Creativity level (0=deterministic, 1=creative)")
+
+    @validator('model', always=True)
+    def validate_model(cls, v):
+        if v is None:
+            return AGENT_DEFAULT_MODEL
+        if v not in AGENT_MODELS:
+            raise ValueError(f"Unsupported model; use one of: {', '.join(AGENT_MODELS)}")
+        return v
     
 class AgentResponse(BaseModel):
     """Generic agent response model"""
@@ -48,9 +62,10 @@ async def execute_agent(
         # Get the formatted prompt
         prompt = get_agent_prompt(request.agent_type, **request.parameters)
         
-        # Initialize the AI model
-        model = genai.GenerativeModel(
-            model_name=request.model,
+        # Generate response
+        response = await llm_gateway.generate(
+            prompt,
+            model=request.model,
             generation_config={
                 "temperature": request.temperature,
                 "top_p": 0.95,
@@ -58,26 +73,15 @@ async def execute_agent(
                 "max_output_tokens": 8192,
             }
         )
-        
-        # Generate response
-        response = model.generate_content(prompt)
         raw_response = response.text
         
         # Try to extract JSON data if present
         structured_data = None
         try:
-            # Look for JSON blocks in the response
-            import re
-            json_pattern = r'```json\s*([\s\S]*?)\s*```'
-            json_matches = re.findall(json_pattern, raw_response)
-            
-            if json_matches:
-                # Parse the first JSON block found
-                structured_data = json.loads(json_matches[0])
-            elif raw_response.strip().startswith('[') or raw_response.strip().startswith('{'):
-                # Try parsing the whole response as JSON
-                structured_data = json.loads(raw_response)
-        except json.JSONDecodeError:
+            # Parse a ```json block, or the whole response if it is JSON
+            if "```" in raw_response or raw_response.strip()[:1] in ("[", "{"):
+                structured_data, _ = loads_tolerant(raw_response)
+        except ValueError:
             # JSON extraction failed, that's okay
             logger.debug("No valid JSON found in response")
         
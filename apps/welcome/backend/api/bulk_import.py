@@ -8,6 +8,9 @@ from pydantic import BaseModel, Field, validator
 from fastapi import APIRouter, HTTPException, Depends
 
 from auth import verify_supabase_token, AuthenticatedUser, get_user_supabase_client
+from memberships import get_user_memberships
+from reference_data import get_asset_categories
+from repositories import ParentAssetsRepository
 
 logger = logging.getLogger(__name__)
 
@@ -82,16 +85,9 @@ class BulkValidationResponse(BaseModel):
 async def validate_site_access(site_id: str, user: AuthenticatedUser) -> None:
     """Verify user has access to the specified site"""
     try:
-        client = get_user_supabase_client(user.token)
+        memberships = await get_user_memberships(user.id)
         
-        # Check if user has access to this site via site_users table
-        result = client.table('site_users')\
-            .select("role_id")\
-            .eq('user_id', user.id)\
-            .eq('site_id', site_id)\
-            .execute()
-        
-        if not result.data:
+        if not memberships.has_site(site_id):
             raise HTTPException(
                 status_code=403, 
                 detail=f"No access to site {site_id}"
@@ -108,23 +104,16 @@ async def validate_site_access(site_id: str, user: AuthenticatedUser) -> None:
             detail="Error verifying site access"
         )
 
-async def validate_categories(categories: List[str], user_token: str) -> Dict[str, bool]:
-    """Check which categories exist in asset_categories table"""
+async def validate_categories(categories: List[str]) -> Dict[str, bool]:
+    """Check which categories exist in the dim_assets reference table"""
     try:
-        client = get_user_supabase_client(user_token)
+        # Cached lookup for case-insensitive matching (lower-cased name -> name)
+        valid_categories = await get_asset_categories()
         
-        # Get all asset categories the user can access
-        result = client.table('dim_assets')\
-            .select('asset_name')\
-            .execute()
-        
-        if not result.data:
+        if not valid_categories:
             logger.warning("No asset categories found")
             return {}
         
-        # Create lookup for case-insensitive matching
-        valid_categories = {cat['asset_name'].lower(): cat['asset_name'] for cat in result.data}
-        
         # Check each requested category
         category_validation = {}
         for cat in categories:
@@ -168,14 +157,10 @@ async def check_duplicate_serials(assets: List[ParentAssetData], site_id: str, u
         
         # Check against existing assets in the database
         if batch_serials:
-            result = client.table('parent_assets')\
-                .select('serial_number')\
-                .eq('site_id', site_id)\
-                .in_('serial_number', batch_serials)\
-                .execute()
+            existing_assets = await ParentAssetsRepository(client).existing_serials(site_id, batch_serials)
             
-            if result.data:
-                for existing_asset in result.data:
+            if existing_assets:
+                for existing_asset in existing_assets:
                     existing_serial = existing_asset['serial_number']
                     if existing_serial in serial_to_rows:
                         duplicates.append({
@@ -221,7 +206,7 @@ async def validate_parent_assets(
         
         # Validate categories
         categories_to_check = [asset.category for asset in request.assets if asset.category]
-        category_validation = await validate_categories(categories_to_check, user.token) if categories_to_check else {}
+        category_validation = await validate_categories(categories_to_check) if categories_to_check else {}
         
         # Check for duplicate serials
         duplicate_serials = await check_duplicate_serials(request.assets, request.site_id, user.token)
@@ -2,16 +2,19 @@
 
 from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel, Field
-import google.generativeai as genai
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 import logging
-import json
 import os
 import sys
 
 # Add parent directory to path to import auth module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth import verify_supabase_token, AuthenticatedUser
+import llm_gateway
+import ai_cache
+import asset_details
+import reference_data
+from llm_json import loads_tolerant
 
 # Optional rate limiting
 try:
@@ -24,8 +27,10 @@ except ImportError:
 router = APIRouter()
 logger = logging.getLogger("main")
 
-# Configure Google AI (same setup as main.py)
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+EXTRACTION_MODEL = "gemini-1.5-flash"
+# Bump whenever the prompt below changes so cached extractions are redone
+EXTRACTION_PROMPT_VERSION = "1"
+
 
 # Rate limiter (optional)
 if RATE_LIMITING_AVAILABLE:
@@ -39,6 +44,7 @@ else:
 # =============================
 class ExtractionInput(BaseModel):
     manual_content: str = Field(..., description="User manual content to extract details from")
+    bypass_cache: bool = Field(False, description="Skip the AI response cache and extract again")
 
 
 class ExtractedDetails(BaseModel):
@@ -60,6 +66,26 @@ class ExtractionResponse(BaseModel):
     confidence: ExtractionConfidence
 
 
+async def _reference_names() -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Known manufacturers and asset categories (empty if the database can't be read)"""
+    try:
+        return await reference_data.get_manufacturers(), await reference_data.get_asset_categories()
+    except Exception as e:
+        logger.warning(f"⚠️ Reference data unavailable for local extraction: {e}")
+        return {}, {}
+
+
+def _local_response(local: asset_details.LocalExtraction, llm_response: Optional[ExtractionResponse] = None) -> ExtractionResponse:
+    """Local values where they are confident (or beat the model's), the model's elsewhere"""
+    extracted = llm_response.extracted.dict() if llm_response else {}
+    confidence = llm_response.confidence.dict() if llm_response else {}
+    for name in asset_details.FIELDS:
+        if local.confidence[name] >= asset_details.LOCAL_EXTRACTION_THRESHOLD or local.confidence[name] > confidence.get(name, 0):
+            extracted[name] = local.values[name]
+            confidence[name] = local.confidence[name]
+    return ExtractionResponse(extracted=ExtractedDetails(**extracted), confidence=ExtractionConfidence(**confidence))
+
+
 # =============================
 # Asset Details Extraction Endpoint
 # =============================
@@ -71,11 +97,21 @@ async def extract_asset_details(
 ):
     """
     Extract asset details (Make, Model, Serial Number, Category) from user manual content.
-    Uses Google Gemini AI for intelligent extraction.
+    Labelled values are read locally first; Google Gemini is only asked when a
+    field is still below LOCAL_EXTRACTION_THRESHOLD confidence.
     Requires authentication.
     """
     logger.info(f"🔍 User {user.email} requesting asset details extraction")
 
+    manufacturers, categories = await _reference_names()
+    local = asset_details.extract_local(input_data.manual_content, manufacturers, categories)
+    llm_fields = local.fields_needing_llm()
+    asset_details.record_extraction(local, llm_fields)
+    if not llm_fields:
+        logger.info(f"⚡ Asset details extracted locally for {user.email}: {local.confidence}")
+        return _local_response(local)
+    logger.info(f"🧠 Asking Gemini for low-confidence fields: {', '.join(llm_fields)}")
+
     # Truncate content if too long (keep first 10000 chars for extraction)
     content = input_data.manual_content[:10000] if len(input_data.manual_content) > 10000 else input_data.manual_content
 
@@ -164,35 +200,34 @@ REVISED CONFIDENCE SCORING (Conservative Approach):
 REMEMBER: Partial extraction with high confidence is MUCH better than complete extraction with low confidence.
 """
 
-    try:
+    async def extract():
         # Call Gemini API
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
+        response = await llm_gateway.generate(prompt, model=EXTRACTION_MODEL)
 
         if not response or not response.text:
             logger.error("No response from Gemini API")
             raise HTTPException(status_code=500, detail="AI service did not return a response")
 
-        # Parse the JSON response
-        response_text = response.text.strip()
-
-        # Clean up response if it contains markdown code blocks
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-
+        # Parse the JSON response, repairing fences, trailing commas and truncation
         try:
-            result = json.loads(response_text)
-        except json.JSONDecodeError as e:
+            details, _ = loads_tolerant(response.text)
+            return details
+        except ValueError as e:
             logger.error(f"Failed to parse AI response as JSON: {e}")
-            logger.error(f"AI Response: {response_text}")
+            logger.error(f"AI Response: {response.text}")
+            return None  # not cached
 
-            # Return empty extraction on parse failure
-            return ExtractionResponse(
-                extracted=ExtractedDetails(),
-                confidence=ExtractionConfidence()
-            )
+    try:
+        cache_key = ai_cache.cache_key(
+            "extract-asset-details",
+            {"manual": ai_cache.content_hash(content)},
+            model=EXTRACTION_MODEL,
+            template_version=EXTRACTION_PROMPT_VERSION,
+        )
+        result = await ai_cache.get_or_generate(cache_key, extract, bypass=input_data.bypass_cache)
+        if not isinstance(result, dict):
+            # Only the local extraction on parse failure
+            return _local_response(local)
 
         # Validate and structure the response
         extracted = result.get("extracted", {})
@@ -215,7 +250,7 @@ REMEMBER: Partial extraction with high confidence is MUCH better than complete e
         )
 
         logger.info(f"✅ Successfully extracted asset details for {user.email}")
-        return extraction_response
+        return _local_response(local, extraction_response)
 
     except HTTPException:
         raise
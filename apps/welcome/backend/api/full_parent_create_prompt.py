@@ -1,11 +1,12 @@
 # full_parent_create_prompt.py
 
 from fastapi import APIRouter, HTTPException, Request, Depends
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 import google.generativeai as genai
-from typing import Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 import logging
-import json
+import asyncio
+import time
 import os
 import sys
 from datetime import date
@@ -13,6 +14,11 @@ from datetime import date
 # Add parent directory to path to import auth module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth import verify_supabase_token, AuthenticatedUser
+import llm_gateway
+import ai_cache
+import plan_streaming
+import manual_sections
+from llm_json import TaskParseResult, extract_tasks
 
 # Optional rate limiting
 try:
@@ -25,8 +31,14 @@ except ImportError:
 router = APIRouter()
 logger = logging.getLogger("main")
 
-# Configure Google AI (same setup as main.py)
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+PARENT_PLAN_MODEL = "gemini-2.0-flash-exp"
+# Bump whenever the prompt below changes so cached plans are regenerated
+PARENT_PLAN_PROMPT_VERSION = "1"
+# Fan-out (task list and critical spares in concurrent calls) is opt-in: per request with
+# fan_out / subsystems, or for every request with PARENT_PLAN_FANOUT=true
+PARENT_PLAN_FANOUT = os.getenv("PARENT_PLAN_FANOUT", "false").lower() == "true"
+PARENT_PLAN_MAX_SUBSYSTEMS = int(os.getenv("PARENT_PLAN_MAX_SUBSYSTEMS", "6"))
+
 
 # Rate limiter (optional)
 if RATE_LIMITING_AVAILABLE:
@@ -50,23 +62,44 @@ class ParentPlanInput(BaseModel):
     operating_hours: Optional[str] = Field(None, max_length=100, description="Operating hours")
     pm_frequency: Optional[str] = Field(None, max_length=100, description="PM frequency")
     criticality: Optional[str] = Field(None, max_length=50, description="Criticality level")
-
-
-# =============================
-# Parent Asset Maintenance Plan Endpoint
-# =============================
-@router.post("/generate-parent-plan")
-async def generate_parent_plan(
-    request: Request,
-    input_data: ParentPlanInput,
-    user: AuthenticatedUser = Depends(verify_supabase_token)
-):
-    """
-    Generate AI-powered parent asset maintenance plan and critical spare parts list.
-    Requires authentication.
-    """
-    logger.info(f"🧩 User {user.email} requesting parent plan for: {input_data.parent_asset_name}")
-
+    bypass_cache: bool = Field(False, description="Skip the AI response cache and generate a fresh plan")
+    fan_out: Optional[bool] = Field(None, description="Generate tasks and critical spares in concurrent calls (server default if unset)")
+    subsystems: Optional[List[str]] = Field(None, description="With fan_out, generate each subsystem's tasks in its own call")
+
+    @validator('subsystems')
+    def validate_subsystems(cls, v):
+        if v is None:
+            return v
+        v = list(dict.fromkeys(name.strip()[:100] for name in v if name and name.strip()))
+        if len(v) > PARENT_PLAN_MAX_SUBSYSTEMS:
+            raise ValueError(f"At most {PARENT_PLAN_MAX_SUBSYSTEMS} subsystems")
+        return v
+
+    @property
+    def use_fan_out(self) -> bool:
+        if self.fan_out is not None:
+            return self.fan_out
+        return PARENT_PLAN_FANOUT or bool(self.subsystems)
+
+
+PARENT_PLAN_GENERATION_CONFIG = genai.types.GenerationConfig(
+    temperature=0.4,               # more deterministic for schema-like output
+    max_output_tokens=8192,
+    response_mime_type="application/json",
+)
+PARENT_PLAN_SYSTEM_INSTRUCTION = "Always return pure JSON, no markdown, no prose outside the JSON."
+
+
+def plan_from_result(result: TaskParseResult) -> Dict[str, Any]:
+    """The parsed plan document with its task list replaced by the salvaged tasks"""
+    plan = dict(result.document) if isinstance(result.document, dict) else {}
+    plan["maintenance_plan"] = result.tasks
+    plan.setdefault("critical_spares", [])
+    return plan
+
+
+def _universal_context(input_data: ParentPlanInput) -> Tuple[str, str, Dict[str, Any]]:
+    """Role, universal context and policies shared by every prompt, plus the manual excerpt and its usage"""
     # Build parent asset label
     parent_label = f"{input_data.parent_asset_name}"
     if input_data.parent_asset_make:
@@ -84,18 +117,21 @@ async def generate_parent_plan(
     criticality = input_data.criticality if input_data.criticality else "Medium"
     additional_context = input_data.additional_context if input_data.additional_context else "Not applicable"
 
+    # Only the most maintenance-relevant sections of a long manual go into the prompt
+    excerpts, manual_usage = manual_sections.fit_manuals(
+        {"manual": input_data.user_manual_content},
+        [input_data.parent_asset_name, input_data.parent_asset_category, input_data.parent_asset_model],
+    )
+    manual_content = excerpts.get("manual", "")
     manual_section = ""
-    if input_data.user_manual_content:
+    if manual_content:
         manual_section = f"""
 
 User Manual Content (for reference):
-{input_data.user_manual_content}
+{manual_content}
 """
 
-    # =============================
-    # Gemini-aligned Prompt (weeks-based, few-shot, output prefix)
-    # =============================
-    prompt = f"""
+    context = f"""
 ROLE & SCOPE
 You are an expert in enterprise asset management, industrial machinery, and preventive maintenance planning. 
 You have deep knowledge of rotating equipment, mechanical systems, electrical systems, and control systems across 
@@ -142,14 +178,29 @@ TASK NAMING CONVENTION
 HALLUCINATION GUARDRAILS
 - Never fabricate part numbers or brand-specific specs. If not known credibly, pick a conservative, widely-accepted default and record the rationale in "assumptions".
 - If any universal field is unknown, proceed with best practices and add a brief assumption.
+"""
+    return context, manual_content, manual_usage
 
-OUTPUT SECTIONS
-1) "maintenance_plan": parent-oversight tasks ONLY.
-   - Include at least:
+
+def _tasks_section(number: int = 1, subsystem: Optional[str] = None, other_subsystems: Sequence[str] = ()) -> str:
+    if subsystem:
+        coverage = (
+            f"   - Scope: the {subsystem} subsystem ONLY. System-wide health checks and other subsystems "
+            "are generated separately; do not include them.\n"
+        )
+    else:
+        coverage = """   - Include at least:
      - "Parent Asset Weekly Health Check" — maintenance_interval: 1
      - "Parent Asset Monthly Health Audit" — maintenance_interval: 4
    - Add additional system-level checks when best practice applies (controls/PLC status, alarms review, utilities, safety interlocks, vibration across assemblies, housekeeping for safety compliance, corrosion survey) — but obey TASK TYPE RESTRICTIONS.
-   - REQUIRED FIELDS for each task (never omit; use "Not applicable" where needed):
+"""
+        if other_subsystems:
+            coverage += (
+                f"   - Tasks specific to {', '.join(other_subsystems)} are generated separately; "
+                "do not include them.\n"
+            )
+    return f"""{number}) "maintenance_plan": parent-oversight tasks ONLY.
+{coverage}   - REQUIRED FIELDS for each task (never omit; use "Not applicable" where needed):
      "parent_asset", "child_asset", "task_name", "maintenance_interval",
      "instructions" (array of steps),
      "reason", "engineering_rationale",
@@ -165,9 +216,11 @@ OUTPUT SECTIONS
      "assumptions" (array),
      "citations" (array),
      "inherits_parent_context" (bool),
-     "context_overrides" (object with allowed keys: site_location, environment, operating_hours, criticality; empty if none)
+     "context_overrides" (object with allowed keys: site_location, environment, operating_hours, criticality; empty if none)"""
+
 
-2) "critical_spares": for the PARENT ASSET ONLY (not child components).
+def _spares_section(number: int = 2) -> str:
+    return f"""{number}) "critical_spares": for the PARENT ASSET ONLY (not child components).
    - REQUIRED FIELDS for each spare:
      "parent_asset", "child_asset",
      "part_name", "part_number", "manufacturer", "preferred_brand",
@@ -180,15 +233,14 @@ OUTPUT SECTIONS
      "storage_conditions",
      "citations" (array),
      "notes"
-   - If manual content exists, extract exact part names/numbers/specs and cite sections/pages. Otherwise cite standards/suppliers.
+   - If manual content exists, extract exact part names/numbers/specs and cite sections/pages. Otherwise cite standards/suppliers."""
 
-FEW-SHOT EXAMPLES (ABBREVIATED)
 
-Example task (one item):
-{{
-  "parent_asset": "{input_data.parent_asset_name}",
+def _task_example(name: str) -> str:
+    return f"""{{
+  "parent_asset": "{name}",
   "child_asset": "Not applicable",
-  "task_name": "{input_data.parent_asset_name} – Weekly System Alarm Review – Controls",
+  "task_name": "{name} – Weekly System Alarm Review – Controls",
   "maintenance_interval": 1,
   "instructions": [
     "Lock out/tag out if required by site policy before opening panels",
@@ -213,11 +265,12 @@ Example task (one item):
   "citations": ["ISO 17359 – Condition monitoring"],
   "inherits_parent_context": true,
   "context_overrides": {{}}
-}}
+}}"""
 
-Example spare (one item):
-{{
-  "parent_asset": "{input_data.parent_asset_name}",
+
+def _spare_example(name: str) -> str:
+    return f"""{{
+  "parent_asset": "{name}",
   "child_asset": "Not applicable",
   "part_name": "Main Control Relay",
   "part_number": "Not applicable",
@@ -233,7 +286,58 @@ Example spare (one item):
   "storage_conditions": "Dry indoor storage, anti-static bag if solid-state",
   "citations": ["IEC 60947 guidance"],
   "notes": "Replace with identical coil voltage and contact rating"
+}}"""
+
+
+def _with_role(prompt: str) -> str:
+    return (
+        "You are an expert in asset management and preventive maintenance planning. "
+        "Always return pure JSON without any markdown formatting.\n\n" + prompt
+    )
+
+
+def _section_prompt(context: str, section: str, example: str, key: str) -> str:
+    return _with_role(f"""{context}
+OUTPUT SECTION
+{section}
+
+FEW-SHOT EXAMPLE (ABBREVIATED)
+{example}
+
+FINAL OUTPUT REQUIREMENTS
+- Return ONE JSON object with ONLY the "{key}" section and no extra text.
+- Begin your output immediately with:
+{{
+  "{key}": [
+
+SCHEMA REMINDER
+{{
+  "{key}": [ {{item1}}, {{item2}}, ... ]
 }}
+""")
+
+
+def build_parent_plan_prompt(input_data: ParentPlanInput) -> Tuple[str, str]:
+    """Gemini prompt and AI response cache key for a parent plan request"""
+    context, manual_content, manual_usage = _universal_context(input_data)
+    name = input_data.parent_asset_name
+
+    # =============================
+    # Gemini-aligned Prompt (weeks-based, few-shot, output prefix)
+    # =============================
+    prompt = f"""{context}
+OUTPUT SECTIONS
+{_tasks_section()}
+
+{_spares_section()}
+
+FEW-SHOT EXAMPLES (ABBREVIATED)
+
+Example task (one item):
+{_task_example(name)}
+
+Example spare (one item):
+{_spare_example(name)}
 
 FINAL OUTPUT REQUIREMENTS
 - Return ONE JSON object with BOTH sections and no extra text.
@@ -248,35 +352,214 @@ SCHEMA REMINDER
 }}
 """
 
-    try:
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.4,               # more deterministic for schema-like output
-                max_output_tokens=8192,
-                response_mime_type="application/json",
-            ),
-            system_instruction="Always return pure JSON, no markdown, no prose outside the JSON."
-        )
+    full_prompt = _with_role(prompt)
 
-        full_prompt = (
-            "You are an expert in asset management and preventive maintenance planning. "
-            "Always return pure JSON without any markdown formatting.\n\n" + prompt
-        )
+    # The plan start date only appears as context (intervals are in weeks), so it stays out of the key
+    cache_inputs = input_data.dict(exclude={"user_manual_content", "bypass_cache", "fan_out", "subsystems"})
+    cache_inputs["user_manual"] = ai_cache.content_hash(manual_content)
+    cache_key = ai_cache.cache_key(
+        "generate-parent-plan",
+        cache_inputs,
+        model=PARENT_PLAN_MODEL,
+        generation_config=PARENT_PLAN_GENERATION_CONFIG,
+        system_instruction=PARENT_PLAN_SYSTEM_INSTRUCTION,
+        template_version=PARENT_PLAN_PROMPT_VERSION,
+    )
+    manual_sections.record_usage("generate-parent-plan", manual_usage, full_prompt)
+    return full_prompt, cache_key
 
-        response = model.generate_content(full_prompt)
-    except Exception as ge:
-        logger.error(f"🧠 Gemini API error: {ge}")
-        raise HTTPException(status_code=502, detail="Gemini API error")
 
-    raw_content = (response.text or "").replace("```json", "").replace("```", "").strip()
-    logger.info("🧠 AI response received from Gemini for parent asset maintenance plan")
+def build_parent_section_prompts(input_data: ParentPlanInput) -> Tuple[List[Tuple[str, str]], str]:
+    """
+    (section, prompt) pairs for fan-out generation and the cache key of the
+    merged plan. Sections are "tasks", "tasks:<subsystem>" and "spares"; all
+    share the universal context of the single-call prompt.
+    """
+    context, manual_content, manual_usage = _universal_context(input_data)
+    name = input_data.parent_asset_name
+    subsystems = input_data.subsystems or []
+
+    sections = [("tasks", _section_prompt(
+        context, _tasks_section(other_subsystems=subsystems), _task_example(name), "maintenance_plan",
+    ))]
+    sections += [(f"tasks:{subsystem}", _section_prompt(
+        context, _tasks_section(subsystem=subsystem), _task_example(name), "maintenance_plan",
+    )) for subsystem in subsystems]
+    sections.append(("spares", _section_prompt(
+        context, _spares_section(1), _spare_example(name), "critical_spares",
+    )))
+
+    cache_inputs = input_data.dict(exclude={"user_manual_content", "bypass_cache", "fan_out"})
+    cache_inputs["user_manual"] = ai_cache.content_hash(manual_content)
+    cache_key = ai_cache.cache_key(
+        "generate-parent-plan-sections",
+        cache_inputs,
+        model=PARENT_PLAN_MODEL,
+        generation_config=PARENT_PLAN_GENERATION_CONFIG,
+        system_instruction=PARENT_PLAN_SYSTEM_INSTRUCTION,
+        template_version=PARENT_PLAN_PROMPT_VERSION,
+    )
+    manual_sections.record_usage("generate-parent-plan", manual_usage, sections[0][1])
+    return sections, cache_key
+
+
+async def _generate_section(section: str, prompt: str) -> Tuple[TaskParseResult, float]:
+    """One section's call, validated on its own; returns the parse result and the call's seconds"""
+    start = time.perf_counter()
+    response = await llm_gateway.generate(
+        prompt,
+        model=PARENT_PLAN_MODEL,
+        generation_config=PARENT_PLAN_GENERATION_CONFIG,
+        system_instruction=PARENT_PLAN_SYSTEM_INSTRUCTION
+    )
+    elapsed = time.perf_counter() - start
+    if section == "spares":
+        result = extract_tasks(response.text or "", "critical_spares", "part_name")
+    else:
+        result = extract_tasks(response.text or "", "maintenance_plan")
+    if result.repairs:
+        logger.info(f"🔧 Repaired parent plan {section} response: {', '.join(result.repairs)}")
+    if result.dropped:
+        logger.warning(f"⚠️ Dropped {len(result.dropped)} malformed {section} items: {[d.to_dict() for d in result.dropped]}")
+    return result, elapsed
+
+
+async def generate_parent_plan_sections(sections: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    Run the section calls concurrently and merge them into the single-call
+    plan shape. A failed section loses only its own items and is listed in
+    "failed_sections" (such a plan is not cached); the request fails only if
+    no section produced any task.
+    """
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(_generate_section(section, prompt) for section, prompt in sections), return_exceptions=True)
+
+    tasks: List[Dict[str, Any]] = []
+    spares: List[Dict[str, Any]] = []
+    seen = set()
+    timings = []
+    failed = []
+    gemini_failed = False
+    for (section, _), outcome in zip(sections, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"🧠 Gemini API error in parent plan {section} section: {outcome}")
+            gemini_failed = True
+            failed.append(section)
+            continue
+        result, elapsed = outcome
+        timings.append(f"{section} {elapsed:.1f}s")
+        if not result.tasks and result.document is None:
+            logger.error(f"❌ Nothing salvageable in the parent plan {section} section")
+            failed.append(section)
+            continue
+        if section == "spares":
+            spares = result.tasks
+            continue
+        for task in result.tasks:
+            # Subsystem calls may repeat a system-wide task; keep the first
+            task_name = str(task.get("task_name", "")).strip().lower()
+            if task_name in seen:
+                continue
+            seen.add(task_name)
+            tasks.append(task)
+
+    logger.info(f"⏱️ Parent plan sections: {', '.join(timings)}; total {time.perf_counter() - start:.1f}s")
+    if not tasks:
+        if gemini_failed:
+            raise HTTPException(status_code=502, detail="Gemini API error")
+        logger.error("❌ No valid tasks in any parent plan section")
+        raise HTTPException(status_code=500, detail="AI returned invalid JSON format")
+    plan = {"maintenance_plan": tasks, "critical_spares": spares}
+    if failed:
+        logger.warning(f"⚠️ Parent plan is missing sections: {', '.join(failed)}")
+        plan["failed_sections"] = failed
+    return plan
+
+
+# =============================
+# Parent Asset Maintenance Plan Endpoint
+# =============================
+@router.post("/generate-parent-plan")
+async def generate_parent_plan(
+    request: Request,
+    input_data: ParentPlanInput,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    """
+    Generate AI-powered parent asset maintenance plan and critical spare parts list.
+    Requires authentication.
+    """
+    logger.info(f"🧩 User {user.email} requesting parent plan for: {input_data.parent_asset_name}")
 
-    try:
-        plan_data = json.loads(raw_content)
-        logger.info("✅ Parent asset maintenance plan generated successfully")
+    if input_data.use_fan_out:
+        sections, cache_key = await asyncio.to_thread(build_parent_section_prompts, input_data)
+        plan_data = await ai_cache.get_or_generate(
+            cache_key, lambda: generate_parent_plan_sections(sections), bypass=input_data.bypass_cache,
+            cacheable=lambda plan: not plan.get("failed_sections"),
+        )
+        failed = plan_data.pop("failed_sections", None)
+        logger.info(f"✅ Parent asset maintenance plan generated successfully ({len(sections)} sections)")
+        if failed:
+            # Partial plan: the client can retry for the missing sections
+            return {"success": True, "plan": plan_data, "failed_sections": failed}
         return {"success": True, "plan": plan_data}
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ JSON decode error: {e}")
-        logger.error(f"Raw content (first 600 chars): {raw_content[:600]}...")
-        raise HTTPException(status_code=500, detail="AI returned invalid JSON format")
+
+    full_prompt, cache_key = await asyncio.to_thread(build_parent_plan_prompt, input_data)
+
+    async def generate_plan():
+        try:
+            response = await llm_gateway.generate(
+                full_prompt,
+                model=PARENT_PLAN_MODEL,
+                generation_config=PARENT_PLAN_GENERATION_CONFIG,
+                system_instruction=PARENT_PLAN_SYSTEM_INSTRUCTION
+            )
+        except Exception as ge:
+            logger.error(f"🧠 Gemini API error: {ge}")
+            raise HTTPException(status_code=502, detail="Gemini API error")
+
+        raw_content = response.text or ""
+        logger.info("🧠 AI response received from Gemini for parent asset maintenance plan")
+
+        result = extract_tasks(raw_content, "maintenance_plan")
+        if result.dropped:
+            logger.warning(f"⚠️ Dropped {len(result.dropped)} malformed tasks: {[d.to_dict() for d in result.dropped]}")
+        if not result.tasks and result.document is None:
+            logger.error("❌ Nothing salvageable in the AI response")
+            logger.error(f"Raw content (first 600 chars): {raw_content[:600]}...")
+            raise HTTPException(status_code=500, detail="AI returned invalid JSON format")
+        return plan_from_result(result)
+
+    plan_data = await ai_cache.get_or_generate(cache_key, generate_plan, bypass=input_data.bypass_cache)
+    logger.info("✅ Parent asset maintenance plan generated successfully")
+    return {"success": True, "plan": plan_data}
+
+
+@router.post("/generate-parent-plan/stream")
+async def generate_parent_plan_stream(
+    request: Request,
+    input_data: ParentPlanInput,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    """
+    Streaming variant of /generate-parent-plan: each maintenance task is sent as a
+    Server-Sent Event as soon as it is complete, then a "done" event carries the
+    same body as the non-streaming endpoint (tasks and critical spares).
+    Always one Gemini call; fan_out and subsystems are ignored here.
+    Requires authentication.
+    """
+    logger.info(f"🧩 User {user.email} streaming parent plan for: {input_data.parent_asset_name}")
+
+    full_prompt, cache_key = await asyncio.to_thread(build_parent_plan_prompt, input_data)
+    return plan_streaming.sse_response(plan_streaming.stream_plan_events(
+        name="generate-parent-plan",
+        prompt=full_prompt,
+        model=PARENT_PLAN_MODEL,
+        generation_config=PARENT_PLAN_GENERATION_CONFIG,
+        system_instruction=PARENT_PLAN_SYSTEM_INSTRUCTION,
+        cache_key=cache_key,
+        bypass_cache=input_data.bypass_cache,
+        to_cache_value=plan_from_result,
+        tasks_of=lambda plan: plan.get("maintenance_plan", []) if isinstance(plan, dict) else [],
+        build_result=lambda plan: {"success": True, "plan": plan},
+    ))
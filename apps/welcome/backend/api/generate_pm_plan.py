@@ -7,13 +7,20 @@ import google.generativeai as genai
 import logging
 import os
 import json
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Tuple
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import llm_gateway
+from llm_json import loads_tolerant, strip_fences
 
 router = APIRouter()
 logger = logging.getLogger("main")
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+PM_PLAN_MODEL = "gemini-2.0-flash-exp"
+# Invalid tasks get up to this many small repair calls before they are dropped
+PM_PLAN_REPAIR_ROUNDS = int(os.getenv("PM_PLAN_REPAIR_ROUNDS", "2"))
+PM_PLAN_REPAIR_TOKENS_PER_TASK = int(os.getenv("PM_PLAN_REPAIR_TOKENS_PER_TASK", "1024"))
+
 
 # ============
 # Input model
@@ -173,11 +180,17 @@ def _is_number(value: Any) -> bool:
         return False
 
 
-def _validate_plan_structure(plan_json: Dict[str, Any]) -> None:
-    """
-    Validate required structure and fields for the AI output.
-    Raises HTTPException(422) with details on failure.
-    """
+REQUIRED_TASK_KEYS = [
+    "parent_asset", "child_asset", "task_name", "maintenance_interval", "instructions",
+    "reason", "engineering_rationale", "safety_precautions", "common_failures_prevented",
+    "usage_insights", "tools_needed", "number_of_technicians", "estimated_time_minutes",
+    "consumables", "risk_assessment", "criticality_rating", "comments", "assumptions",
+    "citations", "inherits_parent_context", "context_overrides"
+]
+
+
+def _validate_plan_shape(plan_json: Any) -> None:
+    """The plan must be an object with a non-empty 'maintenance_plan' array (422 otherwise)"""
     if not isinstance(plan_json, dict) or "maintenance_plan" not in plan_json:
         raise HTTPException(status_code=422, detail="Output must be a JSON object with key 'maintenance_plan'.")
 
@@ -185,50 +198,162 @@ def _validate_plan_structure(plan_json: Dict[str, Any]) -> None:
     if not isinstance(tasks, list) or len(tasks) == 0:
         raise HTTPException(status_code=422, detail="'maintenance_plan' must be a non-empty array of task objects.")
 
+
+def _task_errors(idx: int, task: Any) -> List[str]:
+    """Validation errors for one task of the plan (empty if it is valid)"""
+    path = f"maintenance_plan[{idx}]"
+    if not isinstance(task, dict):
+        return [f"{path} is not an object"]
+
     errors = []
-    for idx, task in enumerate(tasks):
-        path = f"maintenance_plan[{idx}]"
-        if not isinstance(task, dict):
-            errors.append(f"{path} is not an object")
-            continue
-
-        # Required keys presence (even if "Not applicable")
-        required_keys = [
-            "parent_asset", "child_asset", "task_name", "maintenance_interval", "instructions",
-            "reason", "engineering_rationale", "safety_precautions", "common_failures_prevented",
-            "usage_insights", "tools_needed", "number_of_technicians", "estimated_time_minutes",
-            "consumables", "risk_assessment", "criticality_rating", "comments", "assumptions",
-            "citations", "inherits_parent_context", "context_overrides"
-        ]
-        for key in required_keys:
-            if key not in task:
-                errors.append(f"{path}.{key} is missing")
-
-        # Numeric validations
-        if "maintenance_interval" in task and not _is_number(task.get("maintenance_interval")):
-            errors.append(f"{path}.maintenance_interval must be numeric (weeks)")
-        if "estimated_time_minutes" in task and not _is_number(task.get("estimated_time_minutes")):
-            errors.append(f"{path}.estimated_time_minutes must be numeric (minutes)")
-
-        # Enum validation for criticality_rating
-        if "criticality_rating" in task:
-            val = task.get("criticality_rating")
-            if not isinstance(val, str) or val.strip().title() not in {"High", "Medium", "Low"}:
-                errors.append(f"{path}.criticality_rating must be one of High, Medium, Low")
-
-        # Type expectations
-        if "inherits_parent_context" in task and not isinstance(task.get("inherits_parent_context"), bool):
-            errors.append(f"{path}.inherits_parent_context must be boolean")
-        if "context_overrides" in task and not isinstance(task.get("context_overrides"), dict):
-            errors.append(f"{path}.context_overrides must be an object (dict)")
-
-        # Disallow deprecated or off-spec fields
-        if "scheduled_dates" in task:
-            errors.append(f"{path}.scheduled_dates must NOT be included; use maintenance_interval in weeks instead")
-
-    if errors:
-        raise HTTPException(status_code=422, detail={"validation_errors": errors})
+    # Required keys presence (even if "Not applicable")
+    for key in REQUIRED_TASK_KEYS:
+        if key not in task:
+            errors.append(f"{path}.{key} is missing")
+
+    # Numeric validations
+    if "maintenance_interval" in task and not _is_number(task.get("maintenance_interval")):
+        errors.append(f"{path}.maintenance_interval must be numeric (weeks)")
+    if "estimated_time_minutes" in task and not _is_number(task.get("estimated_time_minutes")):
+        errors.append(f"{path}.estimated_time_minutes must be numeric (minutes)")
+
+    # Enum validation for criticality_rating
+    if "criticality_rating" in task:
+        val = task.get("criticality_rating")
+        if not isinstance(val, str) or val.strip().title() not in {"High", "Medium", "Low"}:
+            errors.append(f"{path}.criticality_rating must be one of High, Medium, Low")
+
+    # Type expectations
+    if "inherits_parent_context" in task and not isinstance(task.get("inherits_parent_context"), bool):
+        errors.append(f"{path}.inherits_parent_context must be boolean")
+    if "context_overrides" in task and not isinstance(task.get("context_overrides"), dict):
+        errors.append(f"{path}.context_overrides must be an object (dict)")
+
+    # Disallow deprecated or off-spec fields
+    if "scheduled_dates" in task:
+        errors.append(f"{path}.scheduled_dates must NOT be included; use maintenance_interval in weeks instead")
+
+    return errors
+
+
+# ==================
+# Targeted repair
+# ==================
+_STRING_ARRAY = {"type": "array", "items": {"type": "string"}}
+
+# Structured-output schema for one task; mirrors _task_errors
+TASK_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "parent_asset": {"type": "string"},
+        "child_asset": {"type": "string"},
+        "task_name": {"type": "string"},
+        "maintenance_interval": {"type": "number"},
+        "instructions": _STRING_ARRAY,
+        "reason": {"type": "string"},
+        "engineering_rationale": {"type": "string"},
+        "safety_precautions": _STRING_ARRAY,
+        "common_failures_prevented": _STRING_ARRAY,
+        "usage_insights": {"type": "string"},
+        "tools_needed": _STRING_ARRAY,
+        "number_of_technicians": {"type": "integer"},
+        "estimated_time_minutes": {"type": "integer"},
+        "consumables": _STRING_ARRAY,
+        "risk_assessment": {"type": "string"},
+        "criticality_rating": {"type": "string", "enum": ["High", "Medium", "Low"]},
+        "comments": {"type": "string"},
+        "assumptions": _STRING_ARRAY,
+        "citations": _STRING_ARRAY,
+        "inherits_parent_context": {"type": "boolean"},
+        "context_overrides": {
+            "type": "object",
+            "properties": {
+                "site_location": {"type": "string"},
+                "environment": {"type": "string"},
+                "operating_hours": {"type": "string"},
+                "criticality": {"type": "string"},
+            },
+        },
+    },
+    "required": REQUIRED_TASK_KEYS,
+}
+
+REPAIR_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {"tasks": {"type": "array", "items": TASK_RESPONSE_SCHEMA}},
+    "required": ["tasks"],
+}
+
+
+def _repair_prompt(data: PMPlanInput, broken: List[Tuple[Any, List[str]]]) -> str:
+    items = "\n\n".join(
+        f"Task {n}:\n{json.dumps(task, ensure_ascii=False)}\nProblems:\n" + "\n".join(f"- {e}" for e in errors)
+        for n, (task, errors) in enumerate(broken, start=1)
+    )
+    return f"""
+The following preventive maintenance tasks for child asset "{data.child_asset or data.name}"
+(parent asset "{data.parent_asset or 'Not applicable'}") failed validation.
+
+Fix ONLY the listed problems and keep every other value unchanged:
+- maintenance_interval is a number of weeks (Daily ≈ 0.143, Weekly = 1, Monthly ≈ 4, Quarterly ≈ 13, Yearly ≈ 52)
+- estimated_time_minutes and number_of_technicians are integers
+- use "Not applicable" (or ["Not applicable"] for arrays) where nothing applies
+- never include scheduled_dates
 
+Return {{"tasks": [...]}} with exactly {len(broken)} tasks, in the same order.
+
+{items}
+"""
+
+
+async def _repair_invalid_tasks(data: PMPlanInput, plan_json: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Keep the valid tasks and send only the invalid ones, with their validation
+    errors, back to the model for a schema-constrained fix. Tasks still invalid
+    after PM_PLAN_REPAIR_ROUNDS are dropped. Returns a summary of the repair.
+    """
+    tasks = plan_json["maintenance_plan"]
+    repaired = 0
+    for round_no in range(1, PM_PLAN_REPAIR_ROUNDS + 1):
+        invalid = [(idx, errors) for idx, task in enumerate(tasks) if (errors := _task_errors(idx, task))]
+        if not invalid:
+            break
+        logger.info(f"🔧 Repair round {round_no}: {len(invalid)} of {len(tasks)} tasks failed validation")
+        try:
+            response = await llm_gateway.generate(
+                _repair_prompt(data, [(tasks[idx], errors) for idx, errors in invalid]),
+                model=PM_PLAN_MODEL,
+                generation_config=genai.types.GenerationConfig(
+                    temperature=0.2,
+                    max_output_tokens=min(8192, PM_PLAN_REPAIR_TOKENS_PER_TASK * len(invalid)),
+                    response_mime_type="application/json",
+                    response_schema=REPAIR_RESPONSE_SCHEMA,
+                ),
+            )
+            fixed, _ = loads_tolerant(response.text or "")
+            fixed_tasks = fixed.get("tasks") if isinstance(fixed, dict) else None
+        except Exception as e:
+            logger.error(f"⚠️ Repair call failed: {e}")
+            break
+        if not isinstance(fixed_tasks, list):
+            logger.error("⚠️ Repair response had no task list")
+            break
+
+        # Merge fixes back by position; only accept tasks that now validate
+        # and are still the same task
+        for (idx, _), task in zip(invalid, fixed_tasks):
+            original = tasks[idx].get("task_name") if isinstance(tasks[idx], dict) else None
+            if original and isinstance(task, dict) and task.get("task_name") != original:
+                continue
+            if not _task_errors(idx, task):
+                tasks[idx] = task
+                repaired += 1
+
+    dropped = [{"index": idx, "errors": errors} for idx, task in enumerate(tasks) if (errors := _task_errors(idx, task))]
+    if dropped:
+        logger.warning(f"⚠️ Dropping {len(dropped)} tasks that could not be repaired")
+        plan_json["maintenance_plan"] = [task for idx, task in enumerate(tasks) if not _task_errors(idx, task)]
+    return {"repaired_tasks": repaired, "dropped_tasks": dropped}
 
 # ==========
 # Endpoint
@@ -240,8 +365,14 @@ async def generate_ai_plan(input: PMPlanInput, request: Request):
     prompt = generate_prompt(input)
 
     try:
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
+        full_prompt = (
+            "You are an expert in preventive maintenance planning. "
+            "Always return pure JSON without any markdown formatting.\n\n" + prompt
+        )
+
+        response = await llm_gateway.generate(
+            full_prompt,
+            model=PM_PLAN_MODEL,
             generation_config=genai.types.GenerationConfig(
                 temperature=0.4,               # more deterministic for schema output
                 max_output_tokens=8192,
@@ -249,27 +380,31 @@ async def generate_ai_plan(input: PMPlanInput, request: Request):
             ),
             system_instruction="Always return pure JSON, no markdown, no prose outside the JSON."
         )
-
-        full_prompt = (
-            "You are an expert in preventive maintenance planning. "
-            "Always return pure JSON without any markdown formatting.\n\n" + prompt
-        )
-
-        response = model.generate_content(full_prompt)
-        ai_output = (response.text or "").replace("```json", "").replace("```", "").strip()
+        ai_output = strip_fences(response.text or "")
 
         # Parse & validate
         try:
-            plan_json = json.loads(ai_output)
-        except json.JSONDecodeError:
+            plan_json, _ = loads_tolerant(ai_output)
+        except ValueError:
             logger.error("AI output was not valid JSON")
             logger.error(f"Raw content (first 600 chars): {ai_output[:600]}...")
             raise HTTPException(status_code=422, detail="Model did not return valid JSON.")
-        _validate_plan_structure(plan_json)
+        _validate_plan_shape(plan_json)
+
+        # Fix individual bad tasks instead of rejecting (and regenerating) the whole plan
+        repair = await _repair_invalid_tasks(input, plan_json)
+        if not plan_json["maintenance_plan"]:
+            raise HTTPException(status_code=422, detail={"validation_errors": [
+                error for task in repair["dropped_tasks"] for error in task["errors"]
+            ]})
+        if repair["repaired_tasks"] or repair["dropped_tasks"]:
+            ai_output = json.dumps(plan_json)
 
         logger.info("✅ AI plan generated and validated successfully")
-        return {"plan": ai_output, "plan_json": plan_json}
+        return {"plan": ai_output, "plan_json": plan_json, "repair": repair}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"🧠 Gemini error: {e}")
         raise HTTPException(status_code=500, detail="Gemini API error.")
@@ -0,0 +1,106 @@
+# job_routes.py
+
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Dict
+import logging
+import os
+import sys
+
+# Add parent directory to path to import auth module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from auth import verify_supabase_token, AuthenticatedUser
+import jobs
+import plan_streaming
+
+router = APIRouter()
+logger = logging.getLogger("main")
+
+# Seconds between keep-alive comments on an idle job event stream
+JOB_EVENTS_KEEPALIVE_SECONDS = float(os.getenv("JOB_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+# =============================
+# Pydantic Models
+# =============================
+class JobSubmission(BaseModel):
+    type: str = Field(..., description="Job type: ai-plan, ai-plan-batch, parent-plan or child-suggestions")
+    payload: Dict[str, Any] = Field(..., description="Request body of the matching generation endpoint")
+
+def _public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: job[key]
+        for key in ("id", "type", "status", "result", "error", "created_at", "started_at", "finished_at", "updated_at")
+    }
+
+async def _get_own_job(job_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+    job = await jobs.get(job_id)
+    if job is None or job["user_id"] != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# =============================
+# Job Endpoints
+# =============================
+@router.post("/jobs", status_code=202)
+async def submit_job(
+    submission: JobSubmission,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    """
+    Queue a plan, plan batch, parent-plan or child-suggestion generation and return its id
+    at once. Poll GET /api/jobs/{id} or stream GET /api/jobs/{id}/events.
+    Requires authentication.
+    """
+    try:
+        job = await jobs.submit(submission.type, submission.payload, user)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown job type; expected one of {jobs.jobs.job_types}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    except jobs.JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "success": True,
+        "job": _public_job(job),
+        "status_url": f"/api/jobs/{job['id']}",
+        "events_url": f"/api/jobs/{job['id']}/events",
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    """Current status of a job, with its result once it has finished"""
+    return {"success": True, "job": _public_job(await _get_own_job(job_id, user))}
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    """
+    Server-Sent Events for a job: a "status" event on every change, ending
+    with "done" (the finished job, including its result or error).
+    """
+    job = await _get_own_job(job_id, user)
+
+    async def events():
+        current = job
+        while True:
+            if current is None:
+                yield plan_streaming.sse_event("error", {"detail": "Job expired"})
+                return
+            if current["status"] in jobs.FINISHED:
+                yield plan_streaming.sse_event("done", _public_job(current))
+                return
+            yield plan_streaming.sse_event("status", _public_job(current))
+            updated_at = current["updated_at"]
+            while True:
+                current = await jobs.wait_for_change(job_id, updated_at, JOB_EVENTS_KEEPALIVE_SECONDS)
+                if current is None or current["updated_at"] != updated_at:
+                    break
+                yield ": keep-alive\n\n"
+
+    return plan_streaming.sse_response(events())
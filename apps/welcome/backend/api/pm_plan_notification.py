@@ -5,15 +5,14 @@ Sends notification to support when a user generates a PM plan
 
 from fastapi import APIRouter
 from pydantic import BaseModel
-import resend
 import os
 from typing import Optional
+from api.resend_client import send_email
 
 router = APIRouter()
 
-# Initialize Resend with API key - reuse existing pattern
+# Check Resend configuration - reuse existing pattern
 if os.getenv("RESEND_KEY"):
-    resend.api_key = os.getenv("RESEND_KEY")
     print("✅ Resend configured for PM plan notifications")
 else:
     print("⚠️ RESEND_KEY not set - PM plan notifications will be simulated")
@@ -90,12 +89,12 @@ async def send_pm_plan_notification_email(request: PMPlanNotificationRequest):
         """
 
         # Send email using Resend
-        response = resend.Emails.send({
+        response = await send_email({
             "from": "ArcTecFox PM Planner <notifications@arctecfox.ai>",
             "to": ["support@arctecfox.ai"],
             "subject": subject,
             "html": html_content
-        })
+        }, api_key=os.getenv("RESEND_KEY"))
 
         print(f"PM plan notification email sent successfully: {response}")
 
@@ -0,0 +1,40 @@
+"""
+Minimal async Resend client on top of the shared HTTP connection pool
+"""
+from typing import Any, Dict
+
+from http_clients import get_http_client
+
+class ResendError(Exception):
+    """Error returned by the Resend API"""
+    def __init__(self, message: str, code: int = None, error_type: str = None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.error_type = error_type
+
+async def send_email(params: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+    """
+    Send an email through Resend's /emails endpoint.
+    Takes the same params dict as resend.Emails.send and returns its JSON
+    response (containing the email "id").
+    """
+    client = get_http_client("resend")
+    response = await client.post(
+        "/emails",
+        json=params,
+        headers={"Authorization": f"Bearer {api_key}"}
+    )
+
+    if response.status_code >= 400:
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"message": response.text}
+        raise ResendError(
+            body.get("message") or f"Resend API error {response.status_code}",
+            code=response.status_code,
+            error_type=body.get("name")
+        )
+
+    return response.json()
@@ -6,15 +6,18 @@ from datetime import datetime, timedelta
 from fastapi import HTTPException
 from pydantic import BaseModel
 from typing import Optional
-import resend
-from supabase import create_client, Client
+from supabase import Client
+from database import get_service_supabase_client, has_service_credentials, run_db
+from reference_data import get_site
+from repositories import InvitationsRepository, SiteUsersRepository, UsersRepository
+from timing import StepTimer
 from .email_templates import create_invitation_email_content
+from .resend_client import send_email
 
-# Initialize Resend 
+# Check Resend configuration
 # IMPORTANT: Set RESEND_API_KEY environment variable in production
 # For development/testing, emails will be simulated if API key is not set
 if os.getenv("RESEND_API_KEY"):
-    resend.api_key = os.getenv("RESEND_API_KEY")
     print("✅ Resend configured - emails will be sent")
 else:
     print("⚠️ RESEND_API_KEY not set - emails will be simulated (logged only)")
@@ -25,49 +28,50 @@ class InvitationRequest(BaseModel):
     invitation_token: str
     site_id: str
 
+async def _find_site_link(supabase: Client, email: str, site_id: str) -> Optional[dict]:
+    """Existing user with this email and their site_users link (user lookup -> link lookup)"""
+    existing_user = await UsersRepository(supabase).find_by_email(email)
+    if not existing_user:
+        return None
+    print(f"👤 Found existing user: {existing_user['id']}")
+    return await SiteUsersRepository(supabase).find_membership(existing_user['id'], site_id)
+
 async def send_invitation_email(request: InvitationRequest, invited_by_user_id: str = None):
     """Send invitation email to user using Supabase native email (interim) or Resend (when configured)"""
+    timer = StepTimer("send_invitation")
     try:
-        # Initialize Supabase client using same pattern as task_due_dates.py
-        # SUPABASE_KEY is the service role key in production (bypasses RLS)
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_KEY")  # This IS the service role key
-        
-        if not supabase_url or not supabase_key:
+        # Shared service-role client (bypasses RLS)
+        if not has_service_credentials():
             raise HTTPException(status_code=500, detail="Missing Supabase service credentials (SUPABASE_KEY)")
         
-        supabase: Client = create_client(supabase_url, supabase_key)
-        print(f"✅ Using service role key for invitation operations")
+        supabase: Client = get_service_supabase_client()
+        invitations = InvitationsRepository(supabase)
+        
+        # The three pre-insert checks are independent, so they run concurrently;
+        # results are checked in the original order
+        print(f"🔍 Checking if user {request.email} already exists...")
+        site_task = timer.start("site", get_site(request.site_id))
+        link_task = timer.start("existing_user_link", _find_site_link(supabase, request.email, request.site_id))
+        invitations_task = timer.start("existing_invitations", invitations.for_email_and_site(request.email, request.site_id))
         
         # Get site and company details
-        site_response = supabase.table("sites").select("*, companies(*)").eq("id", request.site_id).single().execute()
-        if not site_response.data:
+        site = await site_task
+        if not site:
             raise HTTPException(status_code=404, detail="Site not found")
         
-        site = site_response.data
         company_name = site['companies']['name'] if site.get('companies') else 'the company'
         site_name = site['name']
         
         # Check if user already exists and is linked to site
-        print(f"🔍 Checking if user {request.email} already exists...")
-        existing_user_response = supabase.table("users").select("*").eq("email", request.email).execute()
-        
-        if existing_user_response.data:
-            existing_user = existing_user_response.data[0]
-            print(f"👤 Found existing user: {existing_user['id']}")
-            
-            # Check if already linked to this site
-            existing_link_response = supabase.table("site_users").select("id").eq("user_id", existing_user['id']).eq("site_id", request.site_id).execute()
-            
-            if existing_link_response.data:
-                raise HTTPException(status_code=400, detail="User is already a member of this site")
+        if await link_task:
+            raise HTTPException(status_code=400, detail="User is already a member of this site")
         
         # Check for existing pending invitation
-        existing_invitation_response = supabase.table("invitations").select("*").eq("email", request.email).eq("site_id", request.site_id).execute()
+        existing_invitations = await invitations_task
         
-        if existing_invitation_response.data:
+        if existing_invitations:
             # Check if any are still pending (not accepted)
-            pending_invitations = [inv for inv in existing_invitation_response.data if inv.get('accepted_at') is None]
+            pending_invitations = [inv for inv in existing_invitations if inv.get('accepted_at') is None]
             if pending_invitations:
                 raise HTTPException(status_code=400, detail="An invitation has already been sent to this email for this site")
         
@@ -86,10 +90,10 @@ async def send_invitation_email(request: InvitationRequest, invited_by_user_id:
             "invited_by": invited_by_user_id  # Set from authenticated user
         }
         
-        invitation_response = supabase.table("invitations").insert([invitation_data]).execute()
+        created_invitations = await timer.run("insert_invitation", invitations.insert([invitation_data]))
         
-        if invitation_response.data and len(invitation_response.data) > 0:
-            invitation = invitation_response.data[0]
+        if created_invitations:
+            invitation = created_invitations[0]
             print(f"✅ Invitation record created successfully")
         else:
             # Insert was successful even if no data returned (common with RLS)
@@ -105,7 +109,8 @@ async def send_invitation_email(request: InvitationRequest, invited_by_user_id:
             
             try:
                 # Send invitation via Supabase Auth Admin API (using service key)
-                response = supabase.auth.admin.invite_user_by_email(
+                response = await timer.run("supabase_invite", run_db(
+                    supabase.auth.admin.invite_user_by_email,
                     email=request.email,
                     options={
                         "data": {
@@ -117,7 +122,7 @@ async def send_invitation_email(request: InvitationRequest, invited_by_user_id:
                         },
                         "redirect_to": f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/accept-invitation"
                     }
-                )
+                ))
                 
                 if response.get('error'):
                     raise Exception(f"Supabase invitation failed: {response['error']}")
@@ -151,13 +156,13 @@ async def send_invitation_email(request: InvitationRequest, invited_by_user_id:
             # Send email if Resend API key is configured, otherwise simulate
             if os.getenv("RESEND_API_KEY"):
                 try:
-                    response = resend.Emails.send({
+                    response = await timer.run("resend_email", send_email({
                         "from": os.getenv("RESEND_FROM_EMAIL", "user_admin@arctecfox.ai"),
                         "to": request.email,
                         "subject": subject,
                         "html": html_content,
                         "text": text_content
-                    })
+                    }, api_key=os.getenv("RESEND_API_KEY")))
                     print(f"✅ Email sent successfully to {request.email} via Resend")
                     print(f"📧 Resend ID: {response.get('id', 'N/A')}")
                 except Exception as e:
@@ -184,4 +189,7 @@ async def send_invitation_email(request: InvitationRequest, invited_by_user_id:
         
     except Exception as e:
         print(f"Error sending invitation email: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to send invitation email: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to send invitation email: {str(e)}")
+    finally:
+        timer.close()
+        print(timer.summary())
\ No newline at end of file
@@ -5,12 +5,11 @@ import os
 from fastapi import HTTPException
 from pydantic import BaseModel
 from typing import Optional
-import resend
 from .email_templates import create_invitation_email_content
+from .resend_client import send_email
 
-# Initialize Resend 
+# Check Resend configuration
 if os.getenv("RESEND_API_KEY"):
-    resend.api_key = os.getenv("RESEND_API_KEY")
     print("✅ Resend configured for test emails")
 else:
     print("⚠️ RESEND_API_KEY not set - test emails will be simulated")
@@ -73,7 +72,7 @@ async def send_test_invitation_email(request: TestInvitationRequest):
             print(f"  Text length: {len(email_data['text'])}")
             
             try:
-                response = resend.Emails.send(email_data)
+                response = await send_email(email_data, api_key=resend_api_key)
                 print(f"✅ TEST email sent successfully with {test_from}")
                 print(f"📧 Resend ID: {response.get('id', 'N/A')}")
                 print(f"📧 Resend response: {response}")
@@ -86,7 +85,7 @@ async def send_test_invitation_email(request: TestInvitationRequest):
                     custom_email_data["subject"] = f"[CUSTOM] {subject}"
                     
                     try:
-                        custom_response = resend.Emails.send(custom_email_data)
+                        custom_response = await send_email(custom_email_data, api_key=resend_api_key)
                         print(f"✅ Custom domain email also sent successfully!")
                         print(f"📧 Custom Resend ID: {custom_response.get('id', 'N/A')}")
                     except Exception as custom_e:
@@ -3,12 +3,15 @@ from pydantic import BaseModel, Field
 import google.generativeai as genai
 from typing import Optional
 import logging
-import json
 import os
 import sys
 # Add parent directory to path to import auth module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth import verify_supabase_token, AuthenticatedUser
+import llm_gateway
+import ai_cache
+import plan_prefetch
+from llm_json import loads_tolerant
 # Optional rate limiting
 try:
     from slowapi import Limiter
@@ -20,8 +23,11 @@ except ImportError:
 router = APIRouter()
 logger = logging.getLogger("main")
 
-# Configure Google AI (using the same setup as main.py)
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+SUGGEST_MODEL = "gemini-2.0-flash-exp"
+# Bump whenever the prompt below changes so cached suggestions are regenerated
+SUGGEST_PROMPT_VERSION = "1"
+CRITICALITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
 
 # Rate limiter (optional)
 if RATE_LIMITING_AVAILABLE:
@@ -40,6 +46,39 @@ class ChildSuggestInput(BaseModel):
     environment: Optional[str] = Field(None, max_length=500, description="Environmental conditions")
     additional_context: Optional[str] = Field(None, max_length=1000, description="Additional context for suggestions")
     top_n: Optional[int] = Field(8, ge=1, le=20, description="Number of suggestions to generate")
+    bypass_cache: bool = Field(False, description="Skip the AI response cache and generate fresh suggestions")
+    prefetch_plans: bool = Field(False, description="Start generating PM plans for the top suggestions in the background")
+    prefetch_top_k: Optional[int] = Field(None, ge=1, le=20, description="Number of suggestions to prefetch plans for")
+    parent_asset_id: Optional[str] = Field(None, description="Parent asset ID, so prefetched plans use its manual")
+
+def _prefetch_plans(input_data: ChildSuggestInput, suggestions: dict, user: AuthenticatedUser) -> dict:
+    """Queue plans for the most critical suggestions; returns a copy with their prefetch_id"""
+    child_assets = suggestions.get("child_assets") if isinstance(suggestions, dict) else None
+    if not isinstance(child_assets, list):
+        return suggestions
+    child_assets = [dict(child) if isinstance(child, dict) else child for child in child_assets]
+    candidates = [
+        i for i, child in enumerate(child_assets)
+        if isinstance(child, dict) and isinstance(child.get("name"), str) and child["name"].strip()
+    ]
+    candidates.sort(key=lambda i: CRITICALITY_ORDER.get(str(child_assets[i].get("criticality_level", "")).lower(), 3))
+    chosen = candidates[:input_data.prefetch_top_k or plan_prefetch.PLAN_PREFETCH_TOP_K]
+
+    plans = [{
+        "name": child_assets[i]["name"][:255],
+        "model": str(child_assets[i].get("model") or "")[:255] or None,
+        "category": str(child_assets[i].get("category") or input_data.parent_asset_category or "General")[:255],
+        "environment": input_data.environment,
+        "parent_asset_id": input_data.parent_asset_id,
+    } for i in chosen]
+    for i, prefetch_id in zip(chosen, plan_prefetch.submit(user.id, plans)):
+        child_assets[i]["prefetch_id"] = prefetch_id
+    return {**suggestions, "child_assets": child_assets}
+
+# Rejected suggestion: stop (or forget) its speculative plan
+@router.delete("/plan-prefetch/{prefetch_id}")
+async def cancel_plan_prefetch(prefetch_id: str, user: AuthenticatedUser = Depends(verify_supabase_token)):
+    return {"success": True, "cancelled": plan_prefetch.cancel(prefetch_id, user.id)}
 
 # =============================
 # Child Asset Suggestions Endpoint
@@ -110,32 +149,46 @@ Suggest up to {input_data.top_n} child assets that are most relevant for prevent
 }}
 """
 
-    try:
-        # Use the same Google AI pattern as generate-ai-plan in main.py
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        full_prompt = "You are an expert in asset management and preventive maintenance planning. Always return pure JSON without any markdown formatting.\n\n" + prompt
-        response = model.generate_content(
-            full_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=4096,
+    generation_config = genai.types.GenerationConfig(
+        temperature=0.7,
+        max_output_tokens=4096,
+    )
+
+    async def generate_suggestions():
+        try:
+            # Use the same Google AI pattern as generate-ai-plan in main.py
+            full_prompt = "You are an expert in asset management and preventive maintenance planning. Always return pure JSON without any markdown formatting.\n\n" + prompt
+            response = await llm_gateway.generate(
+                full_prompt,
+                model=SUGGEST_MODEL,
+                generation_config=generation_config
             )
-        )
-    except Exception as ge:
-        logger.error(f"🧠 Gemini API error: {ge}")
-        raise HTTPException(status_code=502, detail="Gemini API error")
-
-    raw_content = response.text
-    logger.info("🧠 AI response received from Gemini for child asset suggestions")
-
-    # Clean the response (same pattern as PM generation)
-    raw_content = raw_content.replace("```json", "").replace("```", "").strip()
-
-    try:
-        suggestions_data = json.loads(raw_content)
-        logger.info("✅ Child asset suggestions generated successfully")
-        return {"success": True, "suggestions": suggestions_data}
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ JSON decode error: {e}")
-        logger.error(f"Raw content: {raw_content[:200]}...")
-        raise HTTPException(status_code=500, detail="AI returned invalid JSON format")
+        except Exception as ge:
+            logger.error(f"🧠 Gemini API error: {ge}")
+            raise HTTPException(status_code=502, detail="Gemini API error")
+
+        raw_content = response.text
+        logger.info("🧠 AI response received from Gemini for child asset suggestions")
+
+        try:
+            suggestions, repairs = loads_tolerant(raw_content)
+        except ValueError as e:
+            logger.error(f"❌ JSON decode error: {e}")
+            logger.error(f"Raw content: {raw_content[:200]}...")
+            raise HTTPException(status_code=500, detail="AI returned invalid JSON format")
+        if repairs:
+            logger.info(f"🔧 Repaired AI response: {', '.join(repairs)}")
+        return suggestions
+
+    cache_key = ai_cache.cache_key(
+        "suggest-child-assets",
+        input_data.dict(exclude={"bypass_cache", "prefetch_plans", "prefetch_top_k", "parent_asset_id"}),
+        model=SUGGEST_MODEL,
+        generation_config=generation_config,
+        template_version=SUGGEST_PROMPT_VERSION,
+    )
+    suggestions_data = await ai_cache.get_or_generate(cache_key, generate_suggestions, bypass=input_data.bypass_cache)
+    if input_data.prefetch_plans:
+        suggestions_data = _prefetch_plans(input_data, suggestions_data, user)
+    logger.info("✅ Child asset suggestions generated successfully")
+    return {"success": True, "suggestions": suggestions_data}
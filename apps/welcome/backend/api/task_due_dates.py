@@ -1,16 +1,16 @@
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from typing import Optional, List, Dict
+from typing import AsyncIterator, Optional, List, Dict
 import logging
-from supabase import create_client, Client
-import os
+from memberships import get_user_memberships
+from repositories import DB_PAGE_SIZE, PMPlansRepository, PMTasksRepository, TaskSignoffRepository
 
 logger = logging.getLogger("main")
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+# Repositories on the shared service-role Supabase client
+pm_plans = PMPlansRepository()
+pm_tasks = PMTasksRepository()
+task_signoffs = TaskSignoffRepository()
 
 
 def parse_maintenance_interval(interval_str: str) -> float:
@@ -139,15 +139,12 @@ async def create_initial_task_signoff(pm_plan_id: str, user_id: str):
     """
     try:
         # Get the PM plan with child asset details
-        plan_result = supabase.table('pm_plans').select(
-            '*, child_assets!inner(plan_start_date)'
-        ).eq('id', pm_plan_id).single().execute()
+        plan = await pm_plans.get_with_plan_start(pm_plan_id)
         
-        if not plan_result.data:
+        if not plan:
             logger.error(f"PM plan {pm_plan_id} not found")
             return
         
-        plan = plan_result.data
         plan_start_date = plan['child_assets']['plan_start_date']
         
         if not plan_start_date:
@@ -156,15 +153,15 @@ async def create_initial_task_signoff(pm_plan_id: str, user_id: str):
             logger.warning(f"No plan_start_date for child asset, using today's date")
         
         # Get all tasks for this PM plan
-        tasks_result = supabase.table('pm_tasks').select('*').eq('pm_plan_id', pm_plan_id).execute()
+        tasks = await pm_tasks.list_for_plan(pm_plan_id)
         
-        if not tasks_result.data:
+        if not tasks:
             logger.warning(f"No tasks found for PM plan {pm_plan_id}")
             return
         
         # Create task_signoff records for each task
         signoff_records = []
-        for task in tasks_result.data:
+        for task in tasks:
             interval_months = parse_maintenance_interval(task.get('maintenance_interval', ''))
             
             if interval_months > 0:
@@ -180,9 +177,9 @@ async def create_initial_task_signoff(pm_plan_id: str, user_id: str):
         
         if signoff_records:
             # Insert all signoff records
-            result = supabase.table('task_signoff').insert(signoff_records).execute()
+            created = await task_signoffs.insert(signoff_records)
             logger.info(f"Created {len(signoff_records)} task_signoff records for PM plan {pm_plan_id}")
-            return result.data
+            return created
         
     except Exception as e:
         logger.error(f"Error creating task_signoff records: {e}")
@@ -196,26 +193,26 @@ async def update_task_due_date(task_id: str, new_due_date: str, user_id: str):
     """
     try:
         # Check if signoff record exists
-        existing = supabase.table('task_signoff').select('*').eq('task_id', task_id).eq('status', 'pending').execute()
+        existing = await task_signoffs.pending_for_task(task_id)
         
-        if existing.data:
+        if existing:
             # Update existing record
-            result = supabase.table('task_signoff').update({
+            result = await task_signoffs.update_pending(task_id, {
                 'due_date': new_due_date,
                 'updated_by': user_id,
                 'updated_at': datetime.now().isoformat()
-            }).eq('task_id', task_id).eq('status', 'pending').execute()
+            })
         else:
             # Create new record
-            result = supabase.table('task_signoff').insert({
+            result = await task_signoffs.insert({
                 'task_id': task_id,
                 'due_date': new_due_date,
                 'created_by': user_id,
                 'status': 'pending'
-            }).execute()
+            })
         
         logger.info(f"Updated due date for task {task_id} to {new_due_date}")
-        return result.data
+        return result
         
     except Exception as e:
         logger.error(f"Error updating task due date: {e}")
@@ -229,13 +226,12 @@ async def create_next_task_signoff(task_id: str, completion_date: str, user_id:
     """
     try:
         # Get the task with its maintenance interval
-        task_result = supabase.table('pm_tasks').select('*, pm_plans!inner(child_assets!inner(plan_start_date))').eq('id', task_id).single().execute()
+        task = await pm_tasks.get_with_plan_start(task_id)
         
-        if not task_result.data:
+        if not task:
             logger.error(f"Task {task_id} not found")
             return
         
-        task = task_result.data
         interval_months = parse_maintenance_interval(task.get('maintenance_interval', ''))
         
         if interval_months > 0:
@@ -254,40 +250,66 @@ async def create_next_task_signoff(task_id: str, completion_date: str, user_id:
                 'status': 'pending'
             }
             
-            result = supabase.table('task_signoff').insert(signoff_record).execute()
+            created = await task_signoffs.insert(signoff_record)
             logger.info(f"Created next task_signoff for task {task_id}, due: {next_due_date}")
-            return result.data
+            return created
         
     except Exception as e:
         logger.error(f"Error creating next task_signoff: {e}")
         raise
 
 
-def get_pending_task_signoffs(user_id: str) -> List[Dict]:
+async def _accessible_site_ids(user_id: str, site_id: Optional[str] = None) -> List[str]:
+    """Sites the user belongs to, narrowed to site_id when given"""
+    memberships = await get_user_memberships(user_id)
+    if site_id:
+        return [site_id] if memberships.has_site(site_id) else []
+    return list(memberships.sites)
+
+
+async def get_pending_task_signoffs(
+    user_id: str,
+    site_id: Optional[str] = None,
+    due_from: Optional[str] = None,
+    due_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = DB_PAGE_SIZE
+) -> Dict:
     """
-    Get all pending task signoffs for tasks the user has access to.
+    Get one page of pending task signoffs for tasks the user has access to.
     This is used by the task view to show upcoming due dates.
+    
+    Returns {"items": [...], "next_cursor": str | None}; pass next_cursor
+    back to get the following page.
     """
     try:
-        # Get signoffs with task and plan details
-        result = supabase.table('task_signoff').select(
-            '''
-            *,
-            pm_tasks!inner(
-                *,
-                pm_plans!inner(
-                    *,
-                    child_assets!inner(
-                        *,
-                        parent_assets!inner(*)
-                    )
-                )
-            )
-            '''
-        ).eq('status', 'pending').execute()
+        site_ids = await _accessible_site_ids(user_id, site_id)
+        if not site_ids:
+            return {"items": [], "next_cursor": None}
         
-        return result.data if result.data else []
+        # Get signoffs with task and plan details, soonest due first
+        items, next_cursor = await task_signoffs.pending_page(
+            site_ids, due_from, due_to, after=cursor, limit=limit
+        )
+        return {"items": items, "next_cursor": next_cursor}
         
+    except ValueError:
+        raise
     except Exception as e:
         logger.error(f"Error fetching pending task signoffs: {e}")
-        return []
\ No newline at end of file
+        return {"items": [], "next_cursor": None}
+
+
+async def iter_pending_task_signoffs(
+    user_id: str,
+    site_id: Optional[str] = None,
+    due_from: Optional[str] = None,
+    due_to: Optional[str] = None,
+    page_size: int = DB_PAGE_SIZE
+) -> AsyncIterator[List[Dict]]:
+    """Stream every pending task signoff the user has access to, one page at a time"""
+    site_ids = await _accessible_site_ids(user_id, site_id)
+    if not site_ids:
+        return
+    async for page in task_signoffs.iter_pending(site_ids, due_from, due_to, page_size=page_size):
+        yield page
@@ -0,0 +1,206 @@
+"""
+Local (no-LLM) extraction of make, model, serial number and category from
+manual text.
+
+Nameplates and manual covers state most of these on labelled lines
+("Model: XG350", "S/N: 4411-A", "Manufactured by Honda"). extract_local()
+reads them with compiled patterns, recognises manufacturers from the makes
+already entered on parent and child assets, and categories from dim_assets.
+Each field gets a 0-100 confidence on the same scale the Gemini prompt
+uses; only fields below LOCAL_EXTRACTION_THRESHOLD need the model.
+
+    local = extract_local(text, manufacturers, categories)
+    if not local.fields_needing_llm():
+        return local
+"""
+import os
+import re
+import functools
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LOCAL_EXTRACTION_THRESHOLD = float(os.getenv("LOCAL_EXTRACTION_THRESHOLD", "80"))
+LOCAL_EXTRACTION_SCAN_CHARS = int(os.getenv("LOCAL_EXTRACTION_SCAN_CHARS", "50000"))
+
+FIELDS = ("make", "model", "serial_number", "category")
+
+# Values that are not a real make even though they were entered as one
+GENERIC_MAKES = {
+    "various", "standard", "generic", "oem", "custom", "unknown", "other", "n/a", "na", "none",
+    "tbd", "test", "tester", "misc", "multiple",
+}
+# Lines like these describe a field rather than state it
+TEMPLATE_CUES = re.compile(r"\b(?:example|e\.g\.|format|sample|such as|record (?:the|your)|write)\b", re.I)
+DISCLAIMER_CUES = re.compile(r"\b(?:warrant\w*|disclaim\w*|liabilit\w*)\b", re.I)
+PLACEHOLDER = re.compile(r"^(?:x+|_+|-+|\.+|#+|0+|n/?a|none|tbd|unknown|\[.*\]|<.*>|\{.*\})$", re.I)
+
+_STOP = r"(?=\s{2,}|\s*[,;|\t]|\s*$|\s+(?i:serial|s/n|model|make|manufacturer|type|brand|category)\b)"
+# A code, optionally followed by capitalised or numeric words ("XG350 Series B")
+_CODE = r"(?P<value>[A-Za-z0-9][A-Za-z0-9\-_/.+]*(?: [A-Z0-9][A-Za-z0-9\-_/.+]*){0,3}?)"
+_NAME = r"(?P<value>[A-Z0-9][\w&.\-]*(?: (?:[A-Z0-9&][\w&.\-]*|of|and|&)){0,4})"
+
+# (pattern, confidence) in order of preference
+SERIAL_PATTERNS = [
+    (re.compile(r"(?i:\bserial\s*(?:number|no\.?|num\.?|#)?|\bs/n|\bs\.n\.)\s*[:#=]\s*" + _CODE + _STOP, re.M), 95),
+    (re.compile(r"(?i:\bserial\s*(?:number|no\.?))\s+" + _CODE + _STOP, re.M), 85),
+]
+MODEL_PATTERNS = [
+    (re.compile(r"(?i:\bmodel\s*(?:number|no\.?|#)?)\s*[:#=]\s*" + _CODE + _STOP, re.M), 95),
+    (re.compile(r"(?i:\b(?:type|model/type))\s*[:#=]\s*(?=[A-Za-z\-]*\d)" + _CODE + _STOP, re.M), 85),
+    (re.compile(r"(?i:\bmodel)\s+(?P<value>[A-Za-z\-]*\d[A-Za-z0-9\-_/.+]*)\b", re.M), 85),
+]
+MAKE_PATTERNS = [
+    (re.compile(r"(?i:\b(?:manufacturer|make|brand|mfr\.?|mfg\.?))\s*[:#=]\s*" + _NAME, re.M), 95),
+    (re.compile(r"(?i:\bmanufactured\s+by)\s+" + _NAME, re.M), 90),
+]
+CATEGORY_LABEL = re.compile(r"(?i:\b(?:category|equipment\s+type|asset\s+type))\s*[:#=]\s*(?P<value>[^\n,;|]{2,60})", re.M)
+SERIAL_CUE = re.compile(r"(?i)\bserial\b|\bs/n\b|\bs\.n\.")
+MANUAL_TITLE = r"(?:owner'?s?|operator'?s?|operation|operating|installation|service|maintenance|user|instruction)\s+(?:manual|guide|instructions)"
+
+@dataclass
+class LocalExtraction:
+    values: Dict[str, Optional[str]] = field(default_factory=lambda: dict.fromkeys(FIELDS))
+    confidence: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(FIELDS, 0.0))
+    # Fields the text gives no sign of, so the model has nothing to find either
+    absent: List[str] = field(default_factory=list)
+
+    def set(self, name: str, value: Optional[str], confidence: float) -> None:
+        if value and confidence > self.confidence[name]:
+            self.values[name] = value
+            self.confidence[name] = float(confidence)
+
+    def fields_needing_llm(self, threshold: float = LOCAL_EXTRACTION_THRESHOLD) -> List[str]:
+        return [name for name in FIELDS if self.confidence[name] < threshold and name not in self.absent]
+
+def _clean(value: str) -> Optional[str]:
+    value = value.strip().strip(".,:;-").strip()
+    if not value or PLACEHOLDER.match(value) or "xxx" in value.lower() or "__" in value:
+        return None
+    return value
+
+def _line_at(text: str, position: int) -> str:
+    start = text.rfind("\n", 0, position) + 1
+    end = text.find("\n", position)
+    return text[start:end if end >= 0 else len(text)]
+
+def _labelled(text: str, patterns: Iterable[Tuple[re.Pattern, float]]) -> Tuple[Optional[str], float]:
+    """Best labelled value; several different values mean the text is ambiguous"""
+    for pattern, confidence in patterns:
+        scores: Dict[str, float] = {}
+        spellings: Dict[str, str] = {}
+        for match in pattern.finditer(text):
+            line = _line_at(text, match.start())
+            if TEMPLATE_CUES.search(line):
+                continue
+            value = _clean(match.group("value"))
+            if not value:
+                continue
+            key = value.lower()
+            scores[key] = max(scores.get(key, 0), confidence - (20 if DISCLAIMER_CUES.search(line) else 0))
+            spellings.setdefault(key, value)
+        if scores:
+            best = max(scores, key=scores.get)
+            return spellings[best], scores[best] - (30 if len(scores) > 1 else 0)
+    return None, 0.0
+
+@functools.lru_cache(maxsize=4)
+def _vocabulary(names: Tuple[str, ...]) -> Optional[re.Pattern]:
+    """One alternation over every name, longest first, matched on word boundaries"""
+    if not names:
+        return None
+    alternatives = sorted(names, key=len, reverse=True)
+    return re.compile(r"(?<![\w-])(" + "|".join(re.escape(name) for name in alternatives) + r")(?![\w-])", re.I)
+
+def _known_makes(manufacturers: Dict[str, str]) -> Dict[str, str]:
+    return {
+        key: name for key, name in manufacturers.items()
+        if len(key) >= 2 and key not in GENERIC_MAKES and "(" not in key and "e.g" not in key
+    }
+
+def _extract_make(text: str, result: LocalExtraction, manufacturers: Dict[str, str]) -> None:
+    known = _known_makes(manufacturers)
+    value, confidence = _labelled(text, MAKE_PATTERNS)
+    if value:
+        # "Honda Motor Co., Ltd." -> the name already used on our assets
+        lowered = value.lower()
+        canonical = next((known[key] for key in sorted(known, key=len, reverse=True)
+                          if lowered == key or lowered.startswith(key + " ")), None)
+        result.set("make", canonical or value, min(100, confidence + 2) if canonical else confidence)
+
+    pattern = _vocabulary(tuple(sorted(known)))
+    if pattern is None:
+        return
+    counts: Dict[str, int] = {}
+    head = text[:500].lower()
+    for match in pattern.finditer(text):
+        # Brand names are written capitalised; "tester" in a sentence is not a make
+        if not match.group(1)[0].isupper():
+            continue
+        key = match.group(1).lower()
+        counts[key] = counts.get(key, 0) + 1
+    if not counts:
+        return
+    ranked = sorted(counts, key=counts.get, reverse=True)
+    best = ranked[0]
+    if len(ranked) > 1 and counts[ranked[1]] * 2 > counts[best]:
+        confidence = 55  # several manufacturers mentioned about equally often
+    elif best in head and counts[best] >= 2:
+        confidence = 85
+    else:
+        confidence = 80 if counts[best] >= 3 else 65
+    result.set("make", known[best], confidence)
+
+def _extract_category(text: str, result: LocalExtraction, categories: Dict[str, str]) -> None:
+    match = CATEGORY_LABEL.search(text)
+    if match and not TEMPLATE_CUES.search(_line_at(text, match.start())):
+        value = _clean(match.group("value"))
+        if value:
+            result.set("category", categories.get(value.lower(), value), 95 if value.lower() in categories else 85)
+
+    pattern = _vocabulary(tuple(sorted(key for key in categories if len(key) >= 3)))
+    if pattern is None:
+        return
+    head = "\n".join(line for line in text[:1000].splitlines() if line.strip())[:300].lower()
+    counts: Dict[str, int] = {}
+    for found in pattern.finditer(text):
+        key = found.group(1).lower()
+        counts[key] = counts.get(key, 0) + 1
+    for key in sorted(counts, key=lambda key: (-counts[key], -len(key))):
+        if re.search(re.escape(key) + r"s?\s+" + MANUAL_TITLE, text, re.I):
+            confidence = 90
+        elif key in head:
+            confidence = 85
+        else:
+            confidence = 70 if counts[key] >= 3 else 50
+        result.set("category", categories[key], confidence)
+
+def extract_local(
+    text: str,
+    manufacturers: Optional[Dict[str, str]] = None,
+    categories: Optional[Dict[str, str]] = None,
+) -> LocalExtraction:
+    """
+    manufacturers and categories map lower-cased name -> name (see
+    reference_data.get_manufacturers / get_asset_categories).
+    """
+    text = (text or "")[:LOCAL_EXTRACTION_SCAN_CHARS]
+    result = LocalExtraction()
+
+    result.set("model", *_labelled(text, MODEL_PATTERNS))
+    result.set("serial_number", *_labelled(text, SERIAL_PATTERNS))
+    if not result.values["serial_number"] and not SERIAL_CUE.search(text):
+        result.absent.append("serial_number")
+    _extract_make(text, result, manufacturers or {})
+    _extract_category(text, result, categories or {})
+    return result
+
+_stats = {"requests": 0, "local_only": 0, "llm_calls": 0, "fields_local": 0}
+
+def record_extraction(result: LocalExtraction, llm_fields: List[str]) -> None:
+    _stats["requests"] += 1
+    _stats["local_only"] += not llm_fields
+    _stats["llm_calls"] += bool(llm_fields)
+    _stats["fields_local"] += len(FIELDS) - len(llm_fields)
+
+def get_extraction_stats() -> Dict[str, float]:
+    return {"threshold": LOCAL_EXTRACTION_THRESHOLD, **_stats}
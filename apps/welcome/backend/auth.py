@@ -2,13 +2,20 @@
 Authentication middleware for FastAPI using Supabase JWTs
 """
 import os
+import time
+import asyncio
+import hashlib
 import logging
 from typing import Optional, Dict, Any
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client
 import httpx
+import jwt
 from dotenv import load_dotenv
+from cache import TTLCache, SingleFlight
+from http_clients import get_http_client
+from memberships import get_user_memberships
+from database import get_user_supabase_client as db_get_user_supabase_client
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -16,6 +23,28 @@ logger = logging.getLogger(__name__)
 # HTTP Bearer token security scheme
 security = HTTPBearer(auto_error=False)
 
+# Token verification settings
+# - AUTH_VERIFY_MODE=local  -> verify JWT signature/claims in-process (default)
+# - AUTH_VERIFY_MODE=remote -> always call Supabase Auth /auth/v1/user
+# AUTH_REMOTE_FALLBACK controls whether local mode may fall back to the remote
+# call when no key material is available to verify a token (missing secret, unknown kid).
+AUTH_VERIFY_MODE = os.getenv("AUTH_VERIFY_MODE", "local").lower()
+AUTH_REMOTE_FALLBACK = os.getenv("AUTH_REMOTE_FALLBACK", "true").lower() == "true"
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_REFRESH_SECONDS = int(os.getenv("SUPABASE_JWKS_REFRESH_SECONDS", "600"))
+JWT_LEEWAY_SECONDS = int(os.getenv("SUPABASE_JWT_LEEWAY_SECONDS", "30"))
+
+# Verified-token cache: users are kept until their token's exp, rejected
+# tokens for a short negative TTL. Keys are SHA-256 hashes, never raw tokens.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "2048"))
+AUTH_NEGATIVE_CACHE_SIZE = int(os.getenv("AUTH_NEGATIVE_CACHE_SIZE", "1024"))
+AUTH_NEGATIVE_CACHE_SECONDS = float(os.getenv("AUTH_NEGATIVE_CACHE_SECONDS", "10"))
+
+_token_cache = TTLCache(maxsize=AUTH_TOKEN_CACHE_SIZE)
+_negative_token_cache = TTLCache(maxsize=AUTH_NEGATIVE_CACHE_SIZE, ttl=AUTH_NEGATIVE_CACHE_SECONDS)
+_token_verifications = SingleFlight()
+
 class AuthenticatedUser:
     """Container for authenticated user data"""
     def __init__(self, user_data: Dict[str, Any], token: str):
@@ -26,65 +55,214 @@ class AuthenticatedUser:
         self.token = token
         self.data = user_data  # Keep full user data
 
-async def verify_supabase_token(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
-) -> AuthenticatedUser:
+class LocalVerificationUnavailable(Exception):
+    """Raised when a token cannot be checked locally (no key material for it)"""
+
+class JWKSCache:
     """
-    Verify the Supabase JWT token and return authenticated user.
-    This is the main authentication dependency for protected endpoints.
+    Cache of the Supabase project's signing keys (JWKS), refreshed in the background.
+    Keys are looked up by "kid"; an unknown kid triggers at most one refresh per minute.
     """
-    if not credentials:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing authentication token",
-            headers={"WWW-Authenticate": "Bearer"}
+    MIN_REFRESH_INTERVAL = 60
+
+    def __init__(self):
+        self.keys: Dict[str, jwt.PyJWK] = {}
+        self.fetched_at: float = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def jwks_url(self) -> Optional[str]:
+        supabase_url = os.getenv("SUPABASE_URL")
+        return f"{supabase_url}/auth/v1/.well-known/jwks.json" if supabase_url else None
+
+    async def refresh(self) -> None:
+        url = self.jwks_url
+        if not url:
+            return
+        async with self._lock:
+            try:
+                client = get_http_client("supabase")
+                response = await client.get(url, headers={"apikey": os.getenv("SUPABASE_ANON_KEY") or ""})
+                response.raise_for_status()
+                keys = {}
+                for jwk in response.json().get("keys", []):
+                    try:
+                        keys[jwk.get("kid")] = jwt.PyJWK(jwk)
+                    except jwt.PyJWTError as e:
+                        logger.warning(f"⚠️ Skipping unsupported JWKS key {jwk.get('kid')}: {e}")
+                self.keys = keys
+                self.fetched_at = time.monotonic()
+                logger.info(f"🔑 Loaded {len(keys)} Supabase signing key(s) from JWKS")
+            except Exception as e:
+                # Keep serving the previous key set; the next cycle will retry
+                logger.warning(f"⚠️ Failed to refresh Supabase JWKS: {e}")
+
+    async def get_key(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self.fetched_at > self.MIN_REFRESH_INTERVAL:
+            await self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(JWKS_REFRESH_SECONDS)
+
+    def start(self) -> None:
+        """Start periodic background refresh (called from the app lifespan)"""
+        if self._task is None and self.jwks_url and AUTH_VERIFY_MODE == "local":
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+jwks_cache = JWKSCache()
+
+def _unauthorized(detail: str = "Invalid or expired token") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+
+def _user_data_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the same shape /auth/v1/user returns from the JWT claims"""
+    return {
+        **claims,
+        "id": claims.get("sub"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "role": claims.get("role"),
+        "user_metadata": claims.get("user_metadata") or {},
+        "app_metadata": claims.get("app_metadata") or {},
+    }
+
+async def _verify_token_local(token: str) -> AuthenticatedUser:
+    """
+    Verify signature, expiry, audience and issuer of a Supabase JWT in-process.
+    HS256 tokens are checked against SUPABASE_JWT_SECRET, asymmetric tokens
+    (RS256/ES256) against the cached project JWKS.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError:
+        raise _unauthorized()
+
+    algorithm = header.get("alg")
+    if algorithm == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET not configured")
+        key = SUPABASE_JWT_SECRET
+    elif algorithm in ("RS256", "ES256", "EdDSA"):
+        jwk = await jwks_cache.get_key(header.get("kid"))
+        if jwk is None:
+            raise LocalVerificationUnavailable(f"No JWKS key for kid {header.get('kid')}")
+        key = jwk.key
+    else:
+        logger.warning(f"❌ Rejected token with unsupported algorithm: {algorithm}")
+        raise _unauthorized()
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=SUPABASE_JWT_AUDIENCE,
+            issuer=f"{supabase_url}/auth/v1",
+            leeway=JWT_LEEWAY_SECONDS,
+            options={"require": ["exp", "sub"]}
         )
-    
-    token = credentials.credentials
+    except jwt.ExpiredSignatureError:
+        logger.warning("❌ Expired token")
+        raise _unauthorized()
+    except jwt.PyJWTError as e:
+        logger.warning(f"❌ Invalid token: {e}")
+        raise _unauthorized()
+
+    return AuthenticatedUser(_user_data_from_claims(claims), token)
+
+async def _verify_token_remote(token: str) -> AuthenticatedUser:
+    """Verify the token by asking Supabase Auth for the user it belongs to"""
     supabase_url = os.getenv("SUPABASE_URL")
-    
-    if not supabase_url:
+    client = get_http_client("supabase")
+    response = await client.get(
+        f"{supabase_url}/auth/v1/user",
+        headers={
+            "Authorization": f"Bearer {token}",
+            "apikey": os.getenv("SUPABASE_ANON_KEY")
+        }
+    )
+
+    if response.status_code == 200:
+        return AuthenticatedUser(response.json(), token)
+    elif response.status_code == 401:
+        logger.warning(f"❌ Invalid or expired token")
+        raise _unauthorized()
+    elif response.status_code == 403:
+        logger.error(f"❌ Forbidden: Check SUPABASE_ANON_KEY permissions. Response: {response.text}")
+        raise _unauthorized()
+    else:
+        logger.error(f"❌ Unexpected auth response: {response.status_code}, Body: {response.text}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Authentication service error"
+        )
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _token_expiry(user: AuthenticatedUser) -> Optional[float]:
+    """Epoch seconds at which the user's token expires"""
+    exp = user.data.get("exp")
+    if exp is None:
+        # Remote verification returns the user, not the claims; the token has
+        # already been accepted by Supabase so reading exp unverified is safe.
+        try:
+            exp = jwt.decode(user.token, options={"verify_signature": False}).get("exp")
+        except jwt.PyJWTError:
+            return None
+    return float(exp) if exp is not None else None
+
+async def _authenticate_uncached(token: str, force_remote: bool = False) -> AuthenticatedUser:
+    """
+    Resolve a bearer token to an AuthenticatedUser.
+    Uses local JWT verification unless remote mode is configured or forced;
+    falls back to Supabase Auth only when local key material is unavailable.
+    """
+    if not os.getenv("SUPABASE_URL"):
         logger.error("SUPABASE_URL not configured")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Authentication service not configured"
         )
-    
-    # Verify token with Supabase Auth API
+
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{supabase_url}/auth/v1/user",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "apikey": os.getenv("SUPABASE_ANON_KEY")
-                }
-            )
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                logger.info(f"✅ Authenticated user: {user_data.get('email')}")
-                return AuthenticatedUser(user_data, token)
-            elif response.status_code == 401:
-                logger.warning(f"❌ Invalid or expired token")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid or expired token",
-                    headers={"WWW-Authenticate": "Bearer"}
-                )
-            elif response.status_code == 403:
-                logger.error(f"❌ Forbidden: Check SUPABASE_ANON_KEY permissions. Response: {response.text}")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid or expired token",
-                    headers={"WWW-Authenticate": "Bearer"}
-                )
-            else:
-                logger.error(f"❌ Unexpected auth response: {response.status_code}, Body: {response.text}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Authentication service error"
-                )
+        if AUTH_VERIFY_MODE == "local" and not force_remote:
+            try:
+                user = await _verify_token_local(token)
+                logger.info(f"✅ Authenticated user (local JWT): {user.email}")
+                return user
+            except LocalVerificationUnavailable as e:
+                if not AUTH_REMOTE_FALLBACK:
+                    logger.error(f"❌ Local token verification unavailable and remote fallback disabled: {e}")
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="Authentication service unavailable"
+                    )
+                logger.info(f"🔁 Local verification unavailable ({e}) - falling back to Supabase Auth")
+
+        user = await _verify_token_remote(token)
+        logger.info(f"✅ Authenticated user: {user.email}")
+        return user
     except httpx.RequestError as e:
         logger.error(f"❌ Auth service connection error: {e}")
         raise HTTPException(
@@ -100,27 +278,85 @@ async def verify_supabase_token(
             detail="Authentication error"
         )
 
+async def _authenticate_and_cache(token: str, key: str) -> AuthenticatedUser:
+    try:
+        user = await _authenticate_uncached(token)
+    except HTTPException as e:
+        if e.status_code == status.HTTP_401_UNAUTHORIZED:
+            _negative_token_cache.set(key, True)
+        raise
+
+    expires_at = _token_expiry(user)
+    if expires_at is not None:
+        _token_cache.set(key, user, ttl=expires_at - time.time())
+    return user
+
+async def authenticate_token(token: str, force_remote: bool = False) -> AuthenticatedUser:
+    """
+    Resolve a bearer token to an AuthenticatedUser, using the verified-token cache.
+    Concurrent requests carrying the same unverified token share one verification.
+    force_remote skips the cache and always asks Supabase Auth.
+    """
+    if force_remote:
+        return await _authenticate_uncached(token, force_remote=True)
+
+    key = _token_cache_key(token)
+    user = _token_cache.get(key)
+    if user is not None:
+        return user
+    if _negative_token_cache.get(key) is not None:
+        raise _unauthorized()
+
+    return await _token_verifications.do(key, lambda: _authenticate_and_cache(token, key))
+
+def get_token_cache_stats() -> Dict[str, Any]:
+    """Counters for sizing the verified-token cache"""
+    return {
+        "verified": _token_cache.stats(),
+        "rejected": _negative_token_cache.stats(),
+        "verifications": _token_verifications.stats(),
+    }
+
+async def verify_supabase_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> AuthenticatedUser:
+    """
+    Verify the Supabase JWT token and return authenticated user.
+    This is the main authentication dependency for protected endpoints.
+    """
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing authentication token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    
+    return await authenticate_token(credentials.credentials)
+
+async def verify_supabase_token_remote(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> AuthenticatedUser:
+    """
+    Verify the token against Supabase Auth on every call.
+    Use for revocation-sensitive endpoints where a signed-out or deleted
+    user must lose access before their JWT expires.
+    """
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing authentication token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    return await authenticate_token(credentials.credentials, force_remote=True)
+
 def get_user_supabase_client(token: str):
     """
-    Create a Supabase client with user's token to respect RLS policies.
+    Get a Supabase client with user's token to respect RLS policies.
     This client will only have access to data the user is authorized to see.
     """
-    url = os.getenv("SUPABASE_URL")
-    anon_key = os.getenv("SUPABASE_ANON_KEY")
-    
-    if not url or not anon_key:
-        raise ValueError("Supabase configuration missing")
-    
-    # Create client with user's token - this respects RLS
-    return create_client(
-        url,
-        anon_key,
-        options={
-            "headers": {
-                "Authorization": f"Bearer {token}"
-            }
-        }
-    )
+    # User-scoped view over the shared connection pool (see database.py)
+    return db_get_user_supabase_client(token)
 
 async def verify_site_access(
     site_id: str,
@@ -131,25 +367,16 @@ async def verify_site_access(
     Returns role_id if user has access, raises 403 if not.
     """
     try:
-        # Use user's token to check access (respects RLS)
-        client = get_user_supabase_client(user.token)
-        
-        # Check site_users table for user's role at this site
-        result = client.table('site_users')\
-            .select("role_id, roles(name)")\
-            .eq('user_id', user.id)\
-            .eq('site_id', site_id)\
-            .single()\
-            .execute()
+        memberships = await get_user_memberships(user.id)
+        role_name = memberships.site_role(site_id)
         
-        if not result.data:
+        if role_name is None:
             logger.warning(f"User {user.email} denied access to site {site_id}")
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="No access to this site"
             )
         
-        role_name = result.data.get('roles', {}).get('name') if result.data.get('roles') else result.data.get('role_id')
         logger.info(f"User {user.email} has {role_name} access to site {site_id}")
         return role_name
         
@@ -170,28 +397,16 @@ async def require_admin_role(
     Use this for endpoints that require admin privileges.
     """
     try:
-        client = get_user_supabase_client(user.token)
-        
-        # Check if user is admin for any site
-        result = client.table('site_users')\
-            .select("site_id, roles(name)")\
-            .eq('user_id', user.id)\
-            .execute()
+        memberships = await get_user_memberships(user.id)
         
-        if not result.data:
+        if not memberships.sites:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="No site access found"
             )
         
         # Check if user has admin role for any site
-        is_admin = any(
-            site.get('roles', {}).get('name') == 'admin' 
-            for site in result.data
-            if site.get('roles')
-        )
-        
-        if not is_admin:
+        if not memberships.has_site_role('admin'):
             logger.warning(f"User {user.email} attempted admin action without admin role")
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -209,6 +424,12 @@ async def require_admin_role(
             detail="Error verifying admin access"
         )
 
+async def require_super_admin(user: AuthenticatedUser) -> None:
+    """Raise 403 unless the user holds the super_admin company role"""
+    memberships = await get_user_memberships(user.id)
+    if not memberships.is_super_admin:
+        raise HTTPException(status_code=403, detail="Super admin access required")
+
 # Optional: Create a dependency for optional authentication
 async def get_optional_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
@@ -0,0 +1,92 @@
+"""
+/api/extract-asset-details on synthetic manual covers, with the local
+extractor in front of Gemini.
+
+Half the documents state make, model and serial number on labelled lines
+(as nameplates and manual covers do); the rest only mention the product in
+prose, and those still need the model. Gemini is the gateway's fake
+backend (DELAY seconds). Labelled documents must be answered locally, with
+the right values and a median under 50 ms; exits non-zero otherwise.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_asset_extraction.py [documents] [delay_seconds]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+os.environ["AI_CACHE_PATH"] = ""  # memory-only cache for the run
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+import llm_gateway  # noqa: E402
+import asset_details  # noqa: E402
+import reference_data  # noqa: E402
+from auth import verify_supabase_token  # noqa: E402
+from bench_plan_streaming import BenchUser  # noqa: E402
+
+MAKES = ["Honda", "Caterpillar", "Trane", "Grundfos", "Atlas Copco", "Cummins", "Various", "Standard"]
+CATEGORIES = ["Generator", "Excavator", "Chiller", "Pump", "Air Compressor", "Diesel Engine"]
+BODY = "Read all safety instructions before operating. Lubricate the bearings every 500 hours. " * 40
+
+def document(i):
+    make = MAKES[i % 6]
+    category = CATEGORIES[i % 6]
+    model = f"X{i:03d}-{i % 7}"
+    serial = f"SN{i:06d}A"
+    if i % 2 == 0:
+        cover = (f"{make.upper()} {category.upper()}\n{category} Operator's Manual\n\n"
+                 f"Manufacturer: {make}\nModel: {model}\nSerial No.: {serial}\n\n")
+    else:
+        cover = "Welcome\n\nThis guide covers the product family. Contact your dealer for service.\n\n"
+    return cover + BODY, {"make": make, "model": model, "serial_number": serial, "category": category}
+
+async def run(count):
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        for i in range(count):
+            text, expected = document(i)
+            start = time.perf_counter()
+            response = await client.post("/api/extract-asset-details", json={"manual_content": text, "bypass_cache": True})
+            response.raise_for_status()
+            results.append((i, time.perf_counter() - start, response.json()["extracted"], expected))
+    return results
+
+async def names(values):
+    return {value.lower(): value for value in values}
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 1.5
+
+    main.app.dependency_overrides[verify_supabase_token] = lambda: BenchUser()
+    reference_data.get_manufacturers = lambda: names(MAKES)
+    reference_data.get_asset_categories = lambda: names(CATEGORIES)
+    llm_gateway.gateway._backend = llm_gateway.FakeGeminiBackend(latency=delay, response_text=json.dumps({
+        "extracted": {"make": None, "model": None, "serial_number": None, "category": None},
+        "confidence": {"make": 0, "model": 0, "serial_number": 0, "category": 0},
+    }))
+
+    results = asyncio.run(run(count))
+    labelled = [r for r in results if r[0] % 2 == 0]
+    prose = [r for r in results if r[0] % 2 == 1]
+    correct = sum(extracted == expected for _, _, extracted, expected in labelled)
+    local_ms = sorted(elapsed for _, elapsed, _, _ in labelled)[len(labelled) // 2] * 1000
+    prose_ms = sum(elapsed for _, elapsed, _, _ in prose) / max(1, len(prose)) * 1000
+    stats = asset_details.get_extraction_stats()
+
+    print(f"{count} documents, fake Gemini {delay * 1000:.0f} ms")
+    print(f"labelled covers  {len(labelled)} docs, {correct} fully correct, median {local_ms:.1f} ms")
+    print(f"prose only       {len(prose)} docs, mean {prose_ms:.0f} ms (Gemini)")
+    print(f"gemini calls     {stats['llm_calls']}/{stats['requests']} requests")
+    ok = correct == len(labelled) and local_ms < 50 and stats["llm_calls"] == len(prose)
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,70 @@
+"""
+Concurrency check: AI endpoints must not serialize on Gemini calls.
+
+Replaces GenerativeModel.generate_content_async with a fake that sleeps
+DELAY seconds, fires N concurrent requests at /api/generate-ai-plan-public
+through the ASGI app, and probes /api/health while they are in flight.
+With non-blocking calls the wall time is ~DELAY (not N * DELAY) and the
+health check answers immediately. Exits non-zero if requests serialized.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_concurrent_ai.py [concurrency] [delay_seconds]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+
+import httpx  # noqa: E402
+import google.generativeai as genai  # noqa: E402
+import main  # noqa: E402
+
+FAKE_PLAN = json.dumps([{"task_name": "Inspect", "maintenance_interval": "Monthly"}])
+
+class FakeResponse:
+    text = FAKE_PLAN
+
+def install_fake_gemini(delay):
+    async def fake_generate_content_async(self, *args, **kwargs):
+        await asyncio.sleep(delay)
+        return FakeResponse()
+    genai.GenerativeModel.generate_content_async = fake_generate_content_async
+
+async def run(concurrency, delay):
+    payload = {"planData": {"name": "Pump", "category": "Pumps"}}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def plan_request():
+            response = await client.post("/api/generate-ai-plan-public", json=payload)
+            response.raise_for_status()
+
+        async def health_probe():
+            await asyncio.sleep(delay / 4)  # while plan requests are waiting on "Gemini"
+            start = time.perf_counter()
+            response = await client.get("/api/health")
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = await asyncio.gather(health_probe(), *(plan_request() for _ in range(concurrency)))
+        return time.perf_counter() - start, results[0]
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    install_fake_gemini(delay)
+    wall, health = asyncio.run(run(concurrency, delay))
+    serial = concurrency * delay
+    print(f"{concurrency} concurrent plan requests, fake Gemini latency {delay * 1000:.0f} ms")
+    print(f"wall {wall * 1000:8.1f} ms   (serialized would be ≥ {serial * 1000:.0f} ms)")
+    print(f"health check during generation {health * 1000:8.1f} ms")
+    overlapped = wall < serial / 2 and health < delay / 2
+    print("requests overlap" if overlapped else "requests SERIALIZED")
+    sys.exit(0 if overlapped else 1)
@@ -0,0 +1,67 @@
+"""
+Microbenchmark: event-loop stalls from blocking Supabase queries.
+
+Runs N concurrent "requests", each making one PostgREST query against a
+mock transport that takes DELAY seconds, and measures how late a 10 ms
+heartbeat task wakes up meanwhile. Compares calling .execute() directly in
+the coroutine (the previous behaviour) with awaiting it through
+repositories / the database executor.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_db_executor.py [concurrency] [delay_seconds]
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "service-key")
+
+import httpx  # noqa: E402
+import database  # noqa: E402
+from repositories import AccessRequestsRepository  # noqa: E402
+
+def install_slow_transport(delay):
+    def handler(request):
+        time.sleep(delay)
+        return httpx.Response(200, json=[])
+    database._shared_http_client = httpx.Client(transport=httpx.MockTransport(handler))
+
+async def blocking_request():
+    client = database.get_service_supabase_client()
+    client.table("access_requests").select("*").eq("status", "pending").execute()
+
+async def executor_request():
+    await AccessRequestsRepository().list_by_status("pending")
+
+async def run(request_fn, concurrency):
+    lags = []
+    done = asyncio.Event()
+
+    async def heartbeat():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - start - 0.01) * 1000)
+
+    beat = asyncio.create_task(heartbeat())
+    start = time.perf_counter()
+    await asyncio.gather(*(request_fn() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await beat
+    return elapsed, max(lags) if lags else 0.0
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    install_slow_transport(delay)
+    print(f"{concurrency} concurrent queries, {delay * 1000:.0f} ms each")
+    for name, fn in (("execute() on event loop", blocking_request), ("database executor", executor_request)):
+        elapsed, worst_lag = asyncio.run(run(fn, concurrency))
+        print(f"{name:<26} wall {elapsed * 1000:8.1f} ms   worst heartbeat lag {worst_lag:8.1f} ms")
+    database.shutdown_db_executor()
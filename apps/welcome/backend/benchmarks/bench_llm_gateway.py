@@ -0,0 +1,90 @@
+"""
+Load test for llm_gateway against the local fake Gemini backend.
+
+The fake answers after DELAY seconds and returns 429 (ResourceExhausted)
+whenever more than CAPACITY calls are in flight. N callers arrive at once:
+
+- direct: every caller hits the backend at once, so everything past
+  CAPACITY fails with a 429
+- gateway: callers queue per model; the limit starts above CAPACITY, is
+  halved on the first 429s and then creeps back up, so nearly every call
+  is served on the first try and all of them succeed
+
+Exits non-zero if the gateway dropped a request or let a caller overtake
+more earlier arrivals than were in flight alongside it or pushed back by
+a retry.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_llm_gateway.py [requests] [capacity] [delay_seconds]
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("LLM_MAX_CONCURRENCY", "8")
+os.environ.setdefault("LLM_RETRY_BASE_SECONDS", "0.1")
+os.environ.setdefault("LLM_RETRY_MAX_SECONDS", "1")
+os.environ.setdefault("LLM_MAX_RETRIES", "6")
+
+from google.api_core import exceptions as google_exceptions  # noqa: E402
+import llm_gateway  # noqa: E402
+
+MODEL = "gemini-1.5-flash"
+
+async def run_direct(requests, capacity, delay):
+    backend = llm_gateway.FakeGeminiBackend(latency=delay, capacity=capacity)
+
+    async def call():
+        try:
+            await backend.generate("prompt", MODEL, None, None)
+            return True
+        except google_exceptions.ResourceExhausted:
+            return False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call() for _ in range(requests)))
+    return time.perf_counter() - start, sum(results), backend
+
+async def run_gateway(requests, capacity, delay):
+    backend = llm_gateway.FakeGeminiBackend(latency=delay, capacity=capacity)
+    gateway = llm_gateway.LLMGateway(backend)
+    finished = []
+
+    async def call(index):
+        # Distinct prompts, so the gateway can't coalesce them into one call
+        await gateway.generate(f"prompt {index}", model=MODEL)
+        finished.append(index)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call(i) for i in range(requests)), return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    return time.perf_counter() - start, requests - len(failures), finished, gateway
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    capacity = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+
+    print(f"{requests} simultaneous calls, fake capacity {capacity}, latency {delay * 1000:.0f} ms")
+
+    wall, ok, backend = asyncio.run(run_direct(requests, capacity, delay))
+    print(f"direct   {wall * 1000:8.1f} ms   {ok:3d}/{requests} succeeded   {backend.rejected} rejected")
+
+    wall, ok, finished, gateway = asyncio.run(run_gateway(requests, capacity, delay))
+    stats = gateway.stats()
+    limiter = stats["models"][MODEL]
+    ideal = requests / capacity * delay
+    print(f"gateway  {wall * 1000:8.1f} ms   {ok:3d}/{requests} succeeded   {stats['rejected']} rejected, "
+          f"{stats['retries']} retries   (ideal ≥ {ideal * 1000:.0f} ms)")
+    print(f"         limit {limiter['max_limit']} → {limiter['limit']}, peak queue {limiter['peak_queue']}, "
+          f"peak in flight {stats['peak_in_flight']}")
+
+    # FIFO: a caller may only finish ahead of earlier arrivals that were in flight
+    # with it or went back to the end of the queue after a 429
+    overtaken = max((index - position for position, index in enumerate(finished)), default=0)
+    fair = overtaken <= limiter["max_limit"] + stats["retries"]
+    print(f"         max overtake {overtaken} positions ({'fair' if fair else 'UNFAIR'})")
+    sys.exit(0 if ok == requests and fair else 1)
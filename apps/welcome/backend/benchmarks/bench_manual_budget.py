@@ -0,0 +1,64 @@
+"""
+Manual excerpting for plan prompts on a synthetic PAGES-page manual.
+
+Every PLANT_EVERY-th page carries a maintenance section (lubrication
+interval, torque value, inspection); the rest is operator-interface and
+warranty filler. fit_manuals() must keep every maintenance section within
+MANUAL_TOKEN_BUDGET and run in well under a second. Fitting the same
+manual again for another asset (a sibling child plan) reuses its cached
+index and must take under a fifth of the first pass. Exits non-zero
+otherwise.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_manual_budget.py [pages] [budget_tokens]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import manual_sections  # noqa: E402
+
+PLANT_EVERY = 25
+PAGE_CHARS = 3000
+
+FILLER = (
+    "The touchscreen supports several display languages and colour themes. Warranty claims must "
+    "be registered online within thirty days of purchase. The packaging is recyclable. "
+)
+
+def page(number):
+    if number % PLANT_EVERY == 0:
+        body = (
+            f"{number}.1 LUBRICATION AND INSPECTION\n"
+            f"Grease the drive-end bearing every {500 + number} operating hours with NLGI 2 grease. "
+            f"Torque the coupling bolts to {40 + number % 7} Nm and inspect the belt for wear monthly.\n\n"
+        )
+    else:
+        body = f"{number}.1 GENERAL INFORMATION\n"
+    return body + FILLER * (PAGE_CHARS // len(FILLER))
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else manual_sections.MANUAL_TOKEN_BUDGET
+
+    manual = "\n\n".join(page(n) for n in range(1, pages + 1))
+    planted = [f"every {500 + n} operating hours" for n in range(1, pages + 1) if n % PLANT_EVERY == 0]
+
+    start = time.perf_counter()
+    excerpts, usage = manual_sections.fit_manuals({"manual": manual}, ["Centrifugal pump", "Pumps"], budget=budget)
+    elapsed = (time.perf_counter() - start) * 1000
+    found = sum(marker in excerpts["manual"] for marker in planted)
+
+    start = time.perf_counter()
+    sibling, _ = manual_sections.fit_manuals({"manual": manual}, ["Drive motor", "Motors"], budget=budget)
+    cached = (time.perf_counter() - start) * 1000
+
+    print(f"{pages}-page manual: {usage['manual_tokens']} tokens, budget {budget}")
+    print(f"excerpt      {usage['tokens_used']} tokens, {usage.get('sections_used')}/{usage.get('sections_total')} sections, "
+          f"{elapsed:.0f} ms")
+    print(f"sibling plan {cached:.0f} ms from the cached index")
+    print(f"maintenance sections kept {found}/{len(planted)}")
+    ok = found == len(planted) and usage["tokens_used"] <= budget and elapsed < 1000 and cached < elapsed / 5
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,133 @@
+"""
+Parent-asset plan as one call vs fan-out sections (/api/generate-parent-plan).
+
+The fake Gemini backend answers each prompt with only the sections it asks
+for and takes SECONDS_PER_ITEM per task or spare written, so a single call
+costs the sum of its sections. Fan-out (tasks + spares) should track the
+larger section, and splitting the tasks by subsystem the largest subsystem.
+Every mode must return the same tasks and spares in the single-call
+response shape. When the spares call fails, fan-out must return the tasks
+with "failed_sections" and must not cache that partial plan. Exits
+non-zero otherwise.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_parent_plan_sections.py [tasks] [spares]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+os.environ["AI_CACHE_PATH"] = ""  # memory-only cache for the run
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+import llm_gateway  # noqa: E402
+from auth import verify_supabase_token  # noqa: E402
+from bench_plan_streaming import BenchUser  # noqa: E402
+
+SECONDS_PER_ITEM = 0.1
+SUBSYSTEMS = ["Compressor", "Condenser", "Controls"]
+
+def task(name, subsystem):
+    return {"task_name": f"Chiller – {name} – {subsystem}", "maintenance_interval": 4, "instructions": ["Step 1"]}
+
+def spare(i):
+    return {"part_name": f"Spare {i}", "part_number": "Not applicable", "criticality": "High"}
+
+class SectionBackend(llm_gateway.FakeGeminiBackend):
+    """Writes only the requested sections, at SECONDS_PER_ITEM per item"""
+    def __init__(self, tasks, spares):
+        super().__init__(capacity=16)
+        self.tasks = tasks
+        self.spares = spares
+        self.fail_spares = False
+
+    async def generate(self, prompt, model, generation_config, system_instruction):
+        await self._admit()
+        try:
+            if self.fail_spares and 'ONLY the "critical_spares" section' in prompt:
+                raise RuntimeError("spares call failed")
+            body = {}
+            if 'ONLY the "critical_spares" section' not in prompt:
+                subsystem = next((s for s in SUBSYSTEMS if f"the {s} subsystem ONLY" in prompt), None)
+                split = "generated separately" in prompt and subsystem is None
+                owners = [subsystem] if subsystem else (["System"] if split else ["System"] + SUBSYSTEMS)
+                per_owner = self.tasks // (len(SUBSYSTEMS) + 1)
+                body["maintenance_plan"] = [task(f"Check {i}", owner) for owner in owners for i in range(per_owner)]
+            if 'ONLY the "maintenance_plan" section' not in prompt:
+                body["critical_spares"] = [spare(i) for i in range(self.spares)]
+            await asyncio.sleep(SECONDS_PER_ITEM * sum(len(items) for items in body.values()))
+            return llm_gateway.FakeResponse(json.dumps(body))
+        finally:
+            self.in_flight -= 1
+
+async def run():
+    base = {"parent_asset_name": "Chiller", "parent_asset_category": "HVAC", "bypass_cache": True}
+    modes = {
+        "single call": {"fan_out": False},
+        "fan-out": {"fan_out": True},
+        "by subsystem": {"fan_out": True, "subsystems": SUBSYSTEMS},
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        for label, options in modes.items():
+            start = time.perf_counter()
+            response = await client.post("/api/generate-parent-plan", json={**base, **options})
+            response.raise_for_status()
+            results[label] = (time.perf_counter() - start, response.json())
+
+        # A failed section is reported and its partial plan isn't cached
+        retry = {**base, "parent_asset_name": "Chiller 2", "bypass_cache": False, "fan_out": True}
+        llm_gateway.gateway.backend.fail_spares = True
+        partial = (await client.post("/api/generate-parent-plan", json=retry)).json()
+        llm_gateway.gateway.backend.fail_spares = False
+        complete = (await client.post("/api/generate-parent-plan", json=retry)).json()
+    return results, partial, complete
+
+if __name__ == "__main__":
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    spares = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    main.app.dependency_overrides[verify_supabase_token] = lambda: BenchUser()
+    llm_gateway.gateway._backend = SectionBackend(tasks, spares)
+
+    per_owner = tasks // (len(SUBSYSTEMS) + 1)
+    ideal = {
+        "single call": (per_owner * (len(SUBSYSTEMS) + 1) + spares) * SECONDS_PER_ITEM,
+        "fan-out": max(per_owner * (len(SUBSYSTEMS) + 1), spares) * SECONDS_PER_ITEM,
+        "by subsystem": max(per_owner, spares) * SECONDS_PER_ITEM,
+    }
+    results, partial, complete = asyncio.run(run())
+    print(f"parent plan with {tasks} tasks and {spares} spares, {SECONDS_PER_ITEM * 1000:.0f} ms per item")
+
+    reference = results["single call"][1]
+    ok = True
+    for label, (elapsed, body) in results.items():
+        plan = body["plan"]
+        same = (
+            sorted(t["task_name"] for t in plan["maintenance_plan"]) == sorted(t["task_name"] for t in reference["plan"]["maintenance_plan"])
+            and plan["critical_spares"] == reference["plan"]["critical_spares"]
+            and set(body) == set(reference)
+        )
+        fast = elapsed < ideal[label] * 1.3
+        ok = ok and same and fast
+        print(f"{label:13} {elapsed * 1000:8.1f} ms   (ideal ≈ {ideal[label] * 1000:.0f} ms)   "
+              f"{len(plan['maintenance_plan'])} tasks, {len(plan['critical_spares'])} spares   "
+              f"{'same plan' if same else 'DIFFERENT plan'}")
+    recovered = (
+        partial.get("failed_sections") == ["spares"] and not partial["plan"]["critical_spares"]
+        and "failed_sections" not in complete and len(complete["plan"]["critical_spares"]) == spares
+    )
+    ok = ok and recovered
+    print(f"failed spares call: reported {partial.get('failed_sections')}, "
+          f"{'not cached' if recovered else 'CACHED or unreported'}")
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
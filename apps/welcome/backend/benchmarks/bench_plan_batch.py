@@ -0,0 +1,104 @@
+"""
+Child-asset plans for one parent: N calls to /api/generate-ai-plan one after
+another (what PMPlanManager does) vs one /api/generate-ai-plan/batch call.
+Both start with a cold parent-manual cache; sibling calls should reuse the
+extracted manual either way.
+
+Gemini is served by the gateway's fake backend (DELAY seconds per plan) and
+the parent manual lookup/extraction by an in-process stand-in that takes
+MANUAL_DELAY seconds and counts its calls. The batch should take about
+ceil(N / AI_PLAN_BATCH_PARALLELISM) generations and extract the parent
+manual once; exits non-zero otherwise or if any plan failed.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_plan_batch.py [children] [delay_seconds]
+"""
+import os
+import sys
+import math
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+os.environ["AI_CACHE_PATH"] = ""  # memory-only cache for the run
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+import llm_gateway  # noqa: E402
+import manual_context  # noqa: E402
+from auth import verify_supabase_token  # noqa: E402
+from bench_plan_streaming import BenchUser, fake_plan, stream_events  # noqa: E402
+
+MANUAL_DELAY = 0.3
+manual_extractions = 0
+
+class FakeManualsRepository:
+    async def first_for_parent_asset(self, parent_asset_id):
+        return {"file_path": f"{parent_asset_id}/manual.pdf", "file_type": "application/pdf", "original_name": "manual.pdf"}
+
+async def fake_extract_text_from_file(file_path, file_type):
+    global manual_extractions
+    manual_extractions += 1
+    await asyncio.sleep(MANUAL_DELAY)
+    return "Grease the bearings every 4 weeks. " * 50
+
+def child_plans(count):
+    return [{"name": f"Child {i}", "category": "Pumps", "parent_asset_id": "parent-1", "child_asset_id": f"child-{i}"}
+            for i in range(count)]
+
+async def run_sequential(children):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        start = time.perf_counter()
+        for plan in child_plans(children):
+            response = await client.post("/api/generate-ai-plan", json={"planData": plan, "bypass_cache": True})
+            response.raise_for_status()
+    return time.perf_counter() - start
+
+async def run_batch(children):
+    start = time.perf_counter()
+    events = await stream_events(main.app, "/api/generate-ai-plan/batch", {
+        "parent_asset_id": "parent-1", "plans": child_plans(children), "bypass_cache": True,
+    })
+    return time.perf_counter() - start, events
+
+if __name__ == "__main__":
+    children = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+    main.app.dependency_overrides[verify_supabase_token] = lambda: BenchUser()
+    manual_context.LoadedManualsRepository = FakeManualsRepository
+    manual_context.file_processor.extract_text_from_file = fake_extract_text_from_file
+    llm_gateway.gateway._backend = llm_gateway.FakeGeminiBackend(latency=delay, response_text=fake_plan(5))
+
+    print(f"{children} child plans, fake Gemini {delay * 1000:.0f} ms, parent manual extraction {MANUAL_DELAY * 1000:.0f} ms, "
+          f"parallelism {main.AI_PLAN_BATCH_PARALLELISM}")
+
+    sequential = asyncio.run(run_sequential(children))
+    sequential_extractions = manual_extractions
+    print(f"sequential   {sequential * 1000:8.1f} ms   {manual_extractions} parent manual extractions")
+
+    # Cold manual cache for the batch too
+    manual_extractions = 0
+    manual_context._manual_lookups.clear()
+    manual_context._manual_texts.clear()
+    batch, events = asyncio.run(run_batch(children))
+    items = [data for _, event, data in events if event == "plan"]
+    done = next((data for _, event, data in events if event == "done"), {})
+    print(f"batch        {batch * 1000:8.1f} ms   {manual_extractions} parent manual extractions   "
+          f"{done.get('succeeded')}/{done.get('total')} plans succeeded")
+
+    ideal = MANUAL_DELAY + math.ceil(children / main.AI_PLAN_BATCH_PARALLELISM) * delay
+    ok = (
+        manual_extractions == 1
+        and sequential_extractions == 1
+        and len(items) == children
+        and all(item["success"] for item in items)
+        and batch < ideal * 1.5
+    )
+    print(f"             ideal ≈ {ideal * 1000:.0f} ms ({'ok' if ok else 'FAILED'})")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,127 @@
+"""
+Accepting a suggested child asset with and without speculative prefetch.
+
+The user asks for child-asset suggestions, spends THINK seconds reviewing
+them and accepts the first one. Without prefetch the plan is generated
+after the click; with prefetch_plans it was generated during the review, so
+/api/generate-ai-plan with the suggestion's prefetch_id should answer
+almost at once. Accepting it with details the suggestion didn't have
+(operating hours here) must not be served the speculative plan.
+
+Then prefetches for every suggestion are queued behind a gateway limit of
+LIMIT while INTERACTIVE plan requests arrive: those must not wait for the
+speculative work (at most DELAY * 2.5 each). Exits non-zero otherwise.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_plan_prefetch.py [delay_seconds]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+os.environ["AI_CACHE_PATH"] = ""  # memory-only cache for the run
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+import llm_gateway  # noqa: E402
+import plan_prefetch  # noqa: E402
+from auth import verify_supabase_token  # noqa: E402
+from bench_plan_streaming import BenchUser, fake_plan  # noqa: E402
+
+THINK = 1.5
+LIMIT = 2
+INTERACTIVE = 3
+SUGGESTIONS = 6
+
+class SuggestionAwareBackend(llm_gateway.FakeGeminiBackend):
+    """Answers child-asset prompts with suggestions and everything else with a plan"""
+    async def generate(self, prompt, model, generation_config, system_instruction):
+        response = await super().generate(prompt, model, generation_config, system_instruction)
+        if "child assets" in str(prompt):
+            response.text = json.dumps({"child_assets": [
+                {"name": f"Component {i}", "model": "Standard", "category": "Pumps",
+                 "criticality_level": ["Low", "High", "Medium"][i % 3]}
+                for i in range(SUGGESTIONS)
+            ]})
+        return response
+
+def suggest_payload(prefetch, top_k=None):
+    return {"parent_asset_name": f"Cooling skid {time.perf_counter()}", "parent_asset_category": "Pumps",
+            "prefetch_plans": prefetch, "prefetch_top_k": top_k, "bypass_cache": True}
+
+async def accept_first(client, prefetch, **details):
+    response = await client.post("/api/suggest-child-assets", json=suggest_payload(prefetch))
+    child = response.json()["suggestions"]["child_assets"][1]  # the "High" one
+    await asyncio.sleep(THINK)
+    start = time.perf_counter()
+    response = await client.post("/api/generate-ai-plan", json={
+        "planData": {"name": child["name"], "category": child["category"], "model": child["model"], **details},
+        "prefetch_id": child.get("prefetch_id"),
+    })
+    response.raise_for_status()
+    return time.perf_counter() - start, len(response.json()["data"])
+
+async def interactive_under_load(client):
+    llm_gateway.gateway.limiter(main.AI_PLAN_MODEL).limit = LIMIT
+    response = await client.post("/api/suggest-child-assets", json=suggest_payload(True, SUGGESTIONS))
+    ids = [child["prefetch_id"] for child in response.json()["suggestions"]["child_assets"]]
+    await asyncio.sleep(0.05)
+
+    async def one(i):
+        start = time.perf_counter()
+        response = await client.post("/api/generate-ai-plan", json={
+            "planData": {"name": f"Urgent asset {i}", "category": "Pumps"}, "bypass_cache": True,
+        })
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    latencies = await asyncio.gather(*(one(i) for i in range(INTERACTIVE)))
+    # The user rejects the last suggestion
+    rejected = (await client.delete(f"/api/plan-prefetch/{ids[-1]}")).json()["cancelled"]
+    claimed = [await plan_prefetch.claim(prefetch_id, BenchUser.id) for prefetch_id in ids[:-1]]
+    return latencies, rejected, claimed
+
+async def run():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        without, _ = await accept_first(client, prefetch=False)
+        with_prefetch, tasks = await accept_first(client, prefetch=True)
+        with_details, _ = await accept_first(client, prefetch=True, hours="12000")
+        under_load = await interactive_under_load(client)
+    return without, with_prefetch, with_details, tasks, under_load
+
+if __name__ == "__main__":
+    delay = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+
+    main.app.dependency_overrides[verify_supabase_token] = lambda: BenchUser()
+    llm_gateway.gateway._backend = SuggestionAwareBackend(latency=delay, capacity=16, response_text=fake_plan(5))
+
+    print(f"fake Gemini {delay * 1000:.0f} ms, {THINK:.1f} s review, prefetch top {plan_prefetch.PLAN_PREFETCH_TOP_K}")
+    without, with_prefetch, with_details, tasks, (latencies, rejected, claimed) = asyncio.run(run())
+    print(f"accept without prefetch {without * 1000:8.1f} ms")
+    print(f"accept with prefetch    {with_prefetch * 1000:8.1f} ms   ({tasks} tasks)")
+    print(f"accept with new details {with_details * 1000:8.1f} ms   (prefetch not used)")
+    print(f"{INTERACTIVE} interactive plans behind {SUGGESTIONS} prefetches (limit {LIMIT}): "
+          f"{', '.join(f'{latency * 1000:.0f}' for latency in latencies)} ms")
+    served = sum(tasks is not None for tasks in claimed)
+    print(f"rejected suggestion cancelled: {rejected}; {served}/{len(claimed)} remaining prefetches claimed")
+    print(f"stats {plan_prefetch.get_prefetch_stats()}")
+
+    ok = (
+        with_prefetch < delay / 2
+        and without >= delay
+        and with_details >= delay
+        and plan_prefetch.get_prefetch_stats()["mismatched"] == 1
+        and max(latencies) < delay * 2.5
+        and rejected
+        and served == len(claimed)
+    )
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,117 @@
+"""
+Time-to-first-task: /api/generate-ai-plan vs /api/generate-ai-plan/stream.
+
+Serves Gemini from the gateway's fake backend, which streams a TASKS-task
+plan over DELAY seconds, and calls both endpoints through the ASGI app
+with bypass_cache set. The streaming endpoint should deliver its first
+task after roughly DELAY / TASKS, and its "done" event must carry exactly
+the non-streaming response body. Exits non-zero otherwise.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_plan_streaming.py [tasks] [delay_seconds]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+os.environ["AI_CACHE_PATH"] = ""  # memory-only cache for the run
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+import llm_gateway  # noqa: E402
+from auth import verify_supabase_token  # noqa: E402
+
+class BenchUser:
+    id = "bench-user"
+    email = "bench@example.com"
+
+def fake_plan(tasks):
+    return json.dumps({"maintenance_plan": [
+        {
+            "task_name": f"Task {i}",
+            "maintenance_interval": "Monthly",
+            "instructions": [f"Step {step}" for step in range(5)],
+            "reason": "Prevent wear " * 10,
+        }
+        for i in range(tasks)
+    ]}, indent=2)
+
+async def stream_events(app, path, payload):
+    """
+    POST to the ASGI app directly and timestamp each SSE event as its body
+    chunk is sent (httpx's ASGITransport buffers the whole response).
+    """
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"host", b"test")],
+        "client": ("127.0.0.1", 1234), "server": ("test", 80),
+    }
+    received = False
+    events, pending = [], ""
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # no disconnect
+
+    async def send(message):
+        nonlocal pending
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"HTTP {message['status']}")
+        if message["type"] == "http.response.body":
+            pending += message.get("body", b"").decode()
+            while "\n\n" in pending:
+                block, pending = pending.split("\n\n", 1)
+                fields = dict(line.split(": ", 1) for line in block.splitlines())
+                events.append((time.perf_counter(), fields["event"], json.loads(fields["data"])))
+
+    await app(scope, receive, send)
+    return events
+
+async def run(delay):
+    payload = {"planData": {"name": "Pump", "category": "Pumps"}, "bypass_cache": True}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        start = time.perf_counter()
+        response = await client.post("/api/generate-ai-plan", json=payload)
+        response.raise_for_status()
+        blocking_ms = (time.perf_counter() - start) * 1000
+        blocking_body = response.json()
+
+        start = time.perf_counter()
+        events = await stream_events(main.app, "/api/generate-ai-plan/stream", payload)
+        streaming_ms = (time.perf_counter() - start) * 1000
+    tasks = [(at, data) for at, event, data in events if event == "task"]
+    errors = [data for _, event, data in events if event == "error"]
+    if errors:
+        raise RuntimeError(errors[0])
+    done = next((data for _, event, data in events if event == "done"), None)
+    first_task_ms = (tasks[0][0] - start) * 1000 if tasks else float("inf")
+    return blocking_ms, blocking_body, first_task_ms, streaming_ms, [data for _, data in tasks], done
+
+if __name__ == "__main__":
+    task_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+
+    main.app.dependency_overrides[verify_supabase_token] = lambda: BenchUser()
+    llm_gateway.gateway._backend = llm_gateway.FakeGeminiBackend(latency=delay, response_text=fake_plan(task_count))
+
+    blocking_ms, blocking_body, first_task_ms, streaming_ms, tasks, done = asyncio.run(run(delay))
+    print(f"{task_count}-task plan, fake Gemini generation time {delay * 1000:.0f} ms")
+    print(f"non-streaming   first task {blocking_ms:8.1f} ms   (whole response)")
+    print(f"streaming       first task {first_task_ms:8.1f} ms   done {streaming_ms:8.1f} ms   {len(tasks)} task events")
+
+    matches = done is not None and done["result"] == blocking_body and tasks == blocking_body["data"]
+    print("done event matches non-streaming body" if matches else "done event DIFFERS from non-streaming body")
+    sys.exit(0 if matches and first_task_ms < blocking_ms / 2 else 1)
@@ -0,0 +1,113 @@
+"""
+/api/generate-ai-plan from the PM template library vs Gemini.
+
+The library is built from the pm_tasks export in database_exports/. For a
+category it covers, use_template must answer in under 50 ms with the
+template plan, and enrich_with_ai must queue a background job that returns
+the Gemini plan (the gateway's fake backend, DELAY seconds). A dusty,
+high-hour asset must get at least one shorter interval than a mild, new
+one, and a category with no templates must fall back to Gemini. Template
+tasks must carry scheduled_dates from the plan start date and a
+time_to_complete string, like Gemini's tasks. Exits non-zero otherwise.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_pm_templates.py [category] [delay_seconds]
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+os.environ["AI_CACHE_PATH"] = ""  # memory-only cache for the run
+os.environ["JOB_STORE_PATH"] = ""  # memory-only job store for the run
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+import jobs  # noqa: E402
+import llm_gateway  # noqa: E402
+import pm_templates  # noqa: E402
+import reference_data  # noqa: E402
+from auth import verify_supabase_token  # noqa: E402
+from bench_plan_streaming import BenchUser, fake_plan  # noqa: E402
+
+START = "2026-03-01"
+
+async def no_categories():
+    return {}
+
+async def plan(client, category, **options):
+    body = {"planData": {"name": "Atlas GA37", "model": "GA37", "category": category, **options.pop("asset", {})}, **options}
+    start = time.perf_counter()
+    response = await client.post("/api/generate-ai-plan", json=body)
+    response.raise_for_status()
+    return time.perf_counter() - start, response.json()
+
+async def run(category):
+    # Build from the export rather than the (unreachable) benchmark Supabase project
+    os.environ.pop("SUPABASE_URL")
+    library = await pm_templates.rebuild()
+    await jobs.start()
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+            ai = await plan(client, category, bypass_cache=True)
+            templated = await plan(client, category, use_template=True, enrich_with_ai=True)
+            job = await jobs.get(templated[1]["enrichment_job_id"])
+            while job["status"] not in jobs.FINISHED:
+                job = await jobs.wait_for_change(job["id"], job["updated_at"], 10)
+            mild = await plan(client, category, use_template=True, asset={
+                "environment": "Clean indoor room", "hours": "100", "date_of_plan_start": START,
+            })
+            harsh = await plan(client, category, use_template=True, asset={"environment": "Dusty outdoor yard", "hours": "30000"})
+            unknown = await plan(client, "Particle Accelerators", use_template=True)
+    finally:
+        await jobs.stop()
+    return library, ai, templated, job, mild[1], harsh[1], unknown[1]
+
+def weeks(tasks):
+    return {task["task_name"]: pm_templates.interval_weeks(task["maintenance_interval"]) for task in tasks}
+
+if __name__ == "__main__":
+    category = sys.argv[1] if len(sys.argv) > 1 else "Compressors"
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 1.5
+
+    main.app.dependency_overrides[verify_supabase_token] = lambda: BenchUser()
+    reference_data.get_asset_categories = no_categories
+    llm_gateway.gateway._backend = llm_gateway.FakeGeminiBackend(latency=delay, response_text=fake_plan(6))
+
+    library, (ai_elapsed, ai), (template_elapsed, templated), job, mild, harsh, unknown = asyncio.run(run(category))
+    print(f"library from {library.source}: {len(library.categories)} categories, {library.task_count} historical tasks")
+    print(f"gemini plan      {ai_elapsed * 1000:8.1f} ms   {len(ai['data'])} tasks (fake Gemini {delay * 1000:.0f} ms)")
+    print(f"template plan    {template_elapsed * 1000:8.1f} ms   {len(templated['data'])} tasks, source {templated['source']}")
+    enriched = job["status"] == jobs.SUCCEEDED and job["result"]["source"] == "ai" and job["result"]["data"] == ai["data"]
+    print(f"enrichment job   {job['status']}, {len(job.get('result', {}).get('data', []))} Gemini tasks")
+
+    mild_weeks, harsh_weeks = weeks(mild["data"]), weeks(harsh["data"])
+    shortened = [name for name, value in harsh_weeks.items()
+                 if value and mild_weeks.get(name) and value < mild_weeks[name]]
+    print(f"harsh + high hours shortened {len(shortened)}/{len(harsh_weeks)} intervals")
+    print(f"unknown category served by   {unknown['source']}")
+    scheduled = all(
+        task["scheduled_dates"] and task["scheduled_dates"][0] == START and isinstance(task["time_to_complete"], str)
+        for task in mild["data"]
+    )
+    print(f"scheduled from {START}: {'yes' if scheduled else 'NO'} "
+          f"({sum(len(task['scheduled_dates']) for task in mild['data'])} dates in 12 months)")
+    print(f"stats {pm_templates.get_template_stats()}")
+
+    ok = (
+        templated["source"] == "template"
+        and template_elapsed < 0.05
+        and all(task["asset_name"] == "Atlas GA37" for task in templated["data"])
+        and enriched
+        and shortened
+        and unknown["source"] == "ai"
+        and scheduled
+    )
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
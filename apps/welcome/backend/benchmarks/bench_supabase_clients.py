@@ -0,0 +1,61 @@
+"""
+Microbenchmark: per-request Supabase client overhead.
+
+Compares building a fresh client with supabase.create_client on every call
+(the previous behaviour) against the pooled user-scoped view from
+database.get_user_supabase_client. Measures construction plus building a
+query; no network calls are made.
+
+Usage (from apps/welcome/backend):
+    python benchmarks/bench_supabase_clients.py [iterations]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+
+from supabase import create_client, ClientOptions  # noqa: E402
+from database import get_user_supabase_client  # noqa: E402
+
+TOKEN = "user-jwt"
+
+def per_call_create_client():
+    client = create_client(
+        os.environ["SUPABASE_URL"],
+        os.environ["SUPABASE_ANON_KEY"],
+        options=ClientOptions(headers={"Authorization": f"Bearer {TOKEN}"})
+    )
+    client.table("site_users").select("role_id").eq("user_id", "u")
+    client.postgrest.session.close()
+
+def pooled_user_view():
+    client = get_user_supabase_client(TOKEN)
+    client.table("site_users").select("role_id").eq("user_id", "u")
+
+def measure(fn, iterations):
+    fn()  # warm-up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(samples):9.1f} µs   p50 {statistics.median(samples):9.1f} µs   p95 {p95:9.1f} µs")
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    before = measure(per_call_create_client, iterations)
+    after = measure(pooled_user_view, iterations)
+    print(f"Per-request Supabase client overhead ({iterations} iterations)")
+    report("create_client per call", before)
+    report("pooled user-scoped view", after)
+    print(f"speed-up: {statistics.mean(before) / statistics.mean(after):.1f}x")
@@ -1,22 +1,90 @@
 import os
-from typing import Optional
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
 from dotenv import load_dotenv
-from supabase import create_client
+import httpx
+from postgrest import SyncPostgrestClient
+from supabase import create_client, Client, ClientOptions
 import logging
+from http_clients import HTTP2_AVAILABLE
 
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-def get_user_supabase_client(token: str):
+# Pool settings for the synchronous transport shared by every Supabase client
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "20"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+# Worker threads for blocking supabase-py calls (keep <= SUPABASE_MAX_CONNECTIONS)
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "32"))
+
+T = TypeVar("T")
+
+_client_lock = threading.RLock()
+_shared_http_client: Optional[httpx.Client] = None
+_service_client: Optional[Client] = None
+_base_client: Optional[Client] = None
+_db_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_service_key() -> Optional[str]:
+    # Deployments name the service role key either way
+    return os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_KEY")
+
+def get_shared_http_client() -> httpx.Client:
+    """Keep-alive connection pool shared by the service, base and user-scoped clients"""
+    global _shared_http_client
+    if _shared_http_client is None:
+        with _client_lock:
+            if _shared_http_client is None:
+                _shared_http_client = httpx.Client(
+                    http2=HTTP2_AVAILABLE,
+                    follow_redirects=True,
+                    timeout=SUPABASE_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=SUPABASE_MAX_CONNECTIONS,
+                        max_keepalive_connections=SUPABASE_MAX_KEEPALIVE_CONNECTIONS,
+                    ),
+                )
+    return _shared_http_client
+
+class UserScopedClient:
+    """
+    Per-request view of Supabase that queries PostgREST with the user's JWT.
+    It only carries the user's headers; connections come from the shared
+    pool, so creating one per request costs no HTTP session setup.
+    """
+    def __init__(self, url: str, anon_key: str, token: str):
+        self.postgrest = SyncPostgrestClient(
+            f"{url}/rest/v1",
+            headers={
+                "apikey": anon_key,
+                "Authorization": f"Bearer {token}",
+            },
+            http_client=get_shared_http_client(),
+        )
+
+    def table(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def from_(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None, **kwargs):
+        return self.postgrest.rpc(fn, params or {}, **kwargs)
+
+def get_user_supabase_client(token: str) -> UserScopedClient:
     """
-    Create a Supabase client with user's token to respect RLS policies.
+    Get a Supabase client scoped to the user's token so RLS policies apply.
     This should be the primary method for database access.
     
     Args:
         token: User's JWT token from Supabase Auth
     
     Returns:
-        Supabase client that respects RLS policies
+        User-scoped client (table/from_/rpc) that respects RLS policies
     """
     url = os.getenv("SUPABASE_URL")
     anon_key = os.getenv("SUPABASE_ANON_KEY")
@@ -25,22 +93,35 @@ def get_user_supabase_client(token: str):
         logger.error("❌ Missing Supabase URL or anon key")
         raise ValueError("Missing Supabase credentials")
     
-    # Create client with user's token - this respects RLS
-    client = create_client(
-        url,
-        anon_key,
-        options={
-            "headers": {
-                "Authorization": f"Bearer {token}"
-            }
-        }
-    )
-    logger.info("✅ User-scoped Supabase client initialized")
-    return client
-
-def get_service_supabase_client():
+    return UserScopedClient(url, anon_key, token)
+
+def get_base_supabase_client() -> Client:
     """
-    Create a Supabase client with service key that bypasses RLS.
+    Long-lived Supabase client with the anon key (no user context).
+    Shares the pooled transport with every other client.
+    """
+    global _base_client
+    if _base_client is None:
+        url = os.getenv("SUPABASE_URL")
+        anon_key = os.getenv("SUPABASE_ANON_KEY")
+        
+        if not url or not anon_key:
+            logger.error("❌ Missing Supabase URL or anon key")
+            raise ValueError("Missing Supabase credentials")
+        
+        with _client_lock:
+            if _base_client is None:
+                _base_client = create_client(
+                    url,
+                    anon_key,
+                    options=ClientOptions(httpx_client=get_shared_http_client())
+                )
+                logger.info("✅ Base Supabase client initialized")
+    return _base_client
+
+def get_service_supabase_client() -> Client:
+    """
+    Get the long-lived Supabase client with service key that bypasses RLS.
     
     ⚠️ WARNING: Only use for system operations that require admin access:
     - Sending invitation emails (needs to read all sites/companies)
@@ -49,15 +130,70 @@ def get_service_supabase_client():
     
     All usage should be logged for security auditing.
     """
-    url = os.getenv("SUPABASE_URL")
-    service_key = os.getenv("SUPABASE_SERVICE_KEY")  # Updated to match .env file
-    
-    if not url or not service_key:
-        logger.error("❌ Missing Supabase service credentials")
-        raise ValueError("Missing Supabase service credentials")
-    
-    logger.warning("⚠️ Service Supabase client initialized - bypasses RLS")
-    return create_client(url, service_key)
+    global _service_client
+    if _service_client is None:
+        url = os.getenv("SUPABASE_URL")
+        service_key = _get_service_key()
+        
+        if not url or not service_key:
+            logger.error("❌ Missing Supabase service credentials")
+            raise ValueError("Missing Supabase service credentials")
+        
+        with _client_lock:
+            if _service_client is None:
+                _service_client = create_client(
+                    url,
+                    service_key,
+                    options=ClientOptions(httpx_client=get_shared_http_client())
+                )
+                logger.warning("⚠️ Service Supabase client initialized - bypasses RLS")
+    return _service_client
+
+def has_service_credentials() -> bool:
+    return bool(os.getenv("SUPABASE_URL") and _get_service_key())
+
+def close_supabase_clients() -> None:
+    """Close the shared transport (called on app shutdown)"""
+    global _shared_http_client, _service_client, _base_client
+    with _client_lock:
+        if _shared_http_client is not None:
+            _shared_http_client.close()
+        _shared_http_client = None
+        _service_client = None
+        _base_client = None
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Bounded thread pool that runs blocking Supabase calls off the event loop"""
+    global _db_executor
+    if _db_executor is None:
+        with _client_lock:
+            if _db_executor is None:
+                _db_executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS,
+                    thread_name_prefix="supabase-db"
+                )
+    return _db_executor
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Await a blocking supabase-py call (query execute, auth admin, storage)
+    on the database executor so a slow round trip only occupies one worker
+    thread instead of stalling every request on this uvicorn worker.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(fn, *args, **kwargs))
+
+async def execute_query(query: Any) -> Any:
+    """Run a query builder's execute() on the database executor"""
+    return await run_db(query.execute)
+
+def shutdown_db_executor() -> None:
+    """Wait for in-flight queries and stop the executor (called on app shutdown)"""
+    global _db_executor
+    with _client_lock:
+        executor, _db_executor = _db_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
 
 # Deprecated: Keep for backward compatibility but log usage
 def get_supabase_client():
@@ -67,32 +203,3 @@ def get_supabase_client():
     """
     logger.warning("⚠️ DEPRECATED: get_supabase_client() called - migrate to get_user_supabase_client()")
     return get_service_supabase_client()
-
-def get_assets(user_token: Optional[str] = None):
-    """
-    Fetch assets with optional user context.
-    
-    Args:
-        user_token: Optional user JWT token. If provided, respects RLS.
-                   If not provided, uses service key (deprecated).
-    """
-    try:
-        if user_token:
-            supabase = get_user_supabase_client(user_token)
-            logger.info("Fetching assets with user context")
-        else:
-            logger.warning("⚠️ Fetching assets without user context - migrate to authenticated calls")
-            supabase = get_service_supabase_client()
-        
-        response = supabase.table('assets').select("*").execute()
-
-        if response and response.data:
-            logger.info(f"✅ Found {len(response.data)} assets")
-            return response.data
-        else:
-            logger.warning("⚠️ No data found in assets table.")
-            return []
-
-    except Exception as e:
-        logger.error(f"❌ Database error: {str(e)}")
-        raise Exception(f"Failed to fetch assets: {str(e)}")
@@ -2,7 +2,8 @@ import os
 import logging
 import io
 from typing import Optional
-from supabase import create_client, Client
+from supabase import Client
+from database import get_service_supabase_client, get_base_supabase_client, has_service_credentials, run_db
 import PyPDF2
 from docx import Document
 from PIL import Image
@@ -13,20 +14,18 @@ class FileProcessor:
     def __init__(self):
         supabase_url = os.getenv("SUPABASE_URL")
         # Use service key for file processing to ensure sufficient permissions
-        service_key = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_KEY")
         anon_key = os.getenv("SUPABASE_ANON_KEY")
         
         if not supabase_url:
             logger.warning("⚠️ SUPABASE_URL not found - file processing will be disabled")
             self.supabase_client = None
-        elif service_key:
-            logger.info("🔗 FileProcessor: Using SUPABASE_SERVICE_KEY")
-            self.supabase_client: Client = create_client(supabase_url, service_key)
-            logger.info("🔗 FileProcessor: Supabase client initialized with service key")
+        elif has_service_credentials():
+            self.supabase_client: Client = get_service_supabase_client()
+            logger.info("🔗 FileProcessor: Using shared service-key Supabase client")
         elif anon_key:
             logger.warning("⚠️ SUPABASE_SERVICE_KEY not found, falling back to SUPABASE_ANON_KEY")
-            self.supabase_client: Client = create_client(supabase_url, anon_key)
-            logger.info("🔗 FileProcessor: Supabase client initialized with anon key")
+            self.supabase_client: Client = get_base_supabase_client()
+            logger.info("🔗 FileProcessor: Using shared anon-key Supabase client")
         else:
             logger.warning("⚠️ No Supabase keys found - file processing will be disabled")
             self.supabase_client = None
@@ -47,12 +46,12 @@ class FileProcessor:
                 folder_path = file_path.split('/')[0] if '/' in file_path else ''
                 if folder_path:
                     logger.info(f"🗂️ Testing folder access: {folder_path}")
-                    folder_contents = self.supabase_client.storage.from_("user-manuals").list(folder_path)
+                    folder_contents = await run_db(self.supabase_client.storage.from_("user-manuals").list, folder_path)
                     logger.info(f"🗂️ Folder contents: {len(folder_contents) if folder_contents else 0} items")
             except Exception as list_error:
                 logger.warning(f"🗂️ Could not list folder contents: {list_error}")
             
-            response = self.supabase_client.storage.from_("user-manuals").download(file_path)
+            response = await run_db(self.supabase_client.storage.from_("user-manuals").download, file_path)
             
             if not response:
                 logger.error(f"Failed to download file from path: {file_path}")
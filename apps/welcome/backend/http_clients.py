@@ -0,0 +1,90 @@
+"""
+Shared outbound HTTP clients.
+
+One pooled httpx.AsyncClient per upstream service, created by the FastAPI
+lifespan in main.py and closed on shutdown, so requests reuse keep-alive
+(and HTTP/2 where the server supports it) connections instead of paying a
+TCP/TLS handshake per call.
+"""
+import os
+import logging
+from typing import Dict
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Pool limits and timeouts (seconds)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+
+# HTTP/2 needs the optional h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+def _base_url(name: str) -> str:
+    if name == "supabase":
+        return os.getenv("SUPABASE_URL") or ""
+    if name == "resend":
+        return "https://api.resend.com"
+    return ""
+
+class HTTPClientRegistry:
+    """Named, lazily created AsyncClients sharing one configuration"""
+
+    SERVICES = ("supabase", "resend", "default")
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(
+            base_url=_base_url(name),
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                HTTP_READ_TIMEOUT,
+                connect=HTTP_CONNECT_TIMEOUT,
+                pool=HTTP_POOL_TIMEOUT,
+            ),
+        )
+        logger.info(f"🔌 HTTP client '{name}' ready (http2={'on' if HTTP2_AVAILABLE else 'off'})")
+        return client
+
+    def start(self) -> None:
+        """Create the clients for every known service (called from the app lifespan)"""
+        for name in self.SERVICES:
+            self.get(name)
+
+    def get(self, name: str = "default") -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+            self._clients[name] = client
+        return client
+
+    async def aclose(self) -> None:
+        for name, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"⚠️ Error closing HTTP client '{name}': {e}")
+        self._clients.clear()
+        logger.info("🔌 HTTP clients closed")
+
+http_clients = HTTPClientRegistry()
+
+def get_http_client(name: str = "default") -> httpx.AsyncClient:
+    """Shared AsyncClient for an upstream service ("supabase", "resend" or "default")"""
+    return http_clients.get(name)
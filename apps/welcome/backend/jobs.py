@@ -0,0 +1,358 @@
+"""
+Background jobs for long AI generations.
+
+A client submits a job and gets its id back immediately; a bounded pool of
+workers runs the generator outside the HTTP request, so proxy timeouts and
+dropped connections don't lose the work. Jobs, their inputs and results
+live in a SQLite file: jobs that were queued or running when the process
+stopped are queued again on the next start, and finished jobs are kept for
+JOB_RETENTION_SECONDS.
+
+Generators are registered by type with the pydantic model of their input:
+
+    jobs.register("ai-plan", GenerateAIPlanRequest, run_ai_plan)
+    job = await jobs.submit("ai-plan", payload, user)
+    job = await jobs.wait_for_change(job["id"], job["updated_at"])
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from auth import AuthenticatedUser
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "500"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+JOB_PURGE_INTERVAL_SECONDS = float(os.getenv("JOB_PURGE_INTERVAL_SECONDS", "600"))
+# Set to an empty string to keep jobs in memory only (lost on restart)
+JOB_STORE_PATH = os.getenv(
+    "JOB_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs.sqlite3"),
+)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+JobHandler = Callable[[Any, AuthenticatedUser], Awaitable[Any]]
+
+class JobQueueFullError(Exception):
+    """Raised when JOB_MAX_QUEUED jobs are already waiting"""
+
+class SQLiteJobStore:
+    """Job rows with JSON payloads and results"""
+    COLUMNS = (
+        "id", "type", "status", "user_id", "user_email", "payload", "result", "error",
+        "created_at", "started_at", "finished_at", "updated_at",
+    )
+
+    def __init__(self, path: str):
+        self.path = path or ":memory:"
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                user_id TEXT,
+                user_email TEXT,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def _row(self, row: Optional[Tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        for key in ("payload", "result", "error"):
+            if job[key] is not None:
+                job[key] = json.loads(job[key])
+        return job
+
+    def insert(self, job: Dict[str, Any]) -> None:
+        values = {**job, "payload": json.dumps(job["payload"])}
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(values)}) VALUES ({', '.join('?' for _ in values)})",
+                tuple(values.values()),
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        for key in ("result", "error"):
+            if fields.get(key) is not None:
+                fields[key] = json.dumps(fields[key])
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING),
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def purge(self, finished_before: float) -> int:
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (*FINISHED, finished_before),
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class JobManager:
+    def __init__(self, path: str = JOB_STORE_PATH, workers: int = JOB_WORKERS, retention: float = JOB_RETENTION_SECONDS):
+        self.path = path
+        self.workers = workers
+        self.retention = retention
+        self.store: Optional[SQLiteJobStore] = None
+        self._handlers: Dict[str, Tuple[Type[BaseModel], JobHandler]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Set and replaced whenever a job changes, to wake status watchers
+        self._changed: Dict[str, asyncio.Event] = {}
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.resumed = 0
+        self.purged = 0
+
+    def register(self, job_type: str, input_model: Type[BaseModel], handler: JobHandler) -> None:
+        self._handlers[job_type] = (input_model, handler)
+
+    @property
+    def job_types(self) -> List[str]:
+        return sorted(self._handlers)
+
+    def _get_store(self) -> SQLiteJobStore:
+        if self.store is None:
+            try:
+                self.store = SQLiteJobStore(self.path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ Job store is memory-only, could not open {self.path}: {e}")
+                self.store = SQLiteJobStore("")
+        return self.store
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        await asyncio.to_thread(self._get_store().update, job_id, **fields)
+        self._notify(job_id)
+
+    async def start(self) -> None:
+        """Start the workers and queue jobs interrupted by the last shutdown"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        store = self._get_store()
+        for job in await asyncio.to_thread(store.unfinished):
+            if job["status"] == RUNNING:
+                await self._update(job["id"], status=QUEUED, started_at=None)
+            self._queue.put_nowait(job["id"])
+            self.resumed += 1
+        if self.resumed:
+            logger.info(f"⏱️ Resumed {self.resumed} unfinished jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge_loop()))
+
+    async def stop(self) -> None:
+        # Jobs still queued or running stay in the store and resume on the next start
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    async def submit(self, job_type: str, payload: Dict[str, Any], user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Validate and queue a job. Raises KeyError for an unknown type,
+        pydantic.ValidationError for a bad payload and JobQueueFullError.
+        """
+        input_model, _ = self._handlers[job_type]
+        payload = jsonable_encoder(input_model(**payload))
+        if self._queue is None:
+            raise RuntimeError("Job workers are not running")
+        if self._queue.qsize() >= JOB_MAX_QUEUED:
+            raise JobQueueFullError(f"{JOB_MAX_QUEUED} jobs are already queued")
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "type": job_type,
+            "status": QUEUED,
+            "user_id": user.id,
+            "user_email": user.email,
+            "payload": payload,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await asyncio.to_thread(self._get_store().insert, job)
+        self._queue.put_nowait(job["id"])
+        logger.info(f"⏱️ Queued {job_type} job {job['id']} for {user.email}")
+        return await self.get(job["id"])
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get_store().get, job_id)
+
+    async def wait_for_change(self, job_id: str, updated_at: float, timeout: float) -> Optional[Dict[str, Any]]:
+        """The job once it has changed after updated_at, or as it is after timeout"""
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        job = await self.get(job_id)
+        if job is None or job["updated_at"] != updated_at:
+            return job
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await self.get(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Job worker error for {job_id}: {e}")
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            return
+        input_model, handler = self._handlers.get(job["type"], (None, None))
+        if handler is None:
+            await self._update(job_id, status=FAILED, finished_at=time.time(),
+                               error={"status_code": 500, "detail": f"Unknown job type {job['type']}"})
+            return
+
+        started = time.time()
+        await self._update(job_id, status=RUNNING, started_at=started)
+        self.running += 1
+        user = AuthenticatedUser({"id": job["user_id"], "email": job["user_email"]}, token="")
+        try:
+            result = jsonable_encoder(await handler(input_model(**job["payload"]), user))
+        except HTTPException as e:
+            error = {"status_code": e.status_code, "detail": e.detail}
+        except Exception as e:
+            logger.error(f"❌ {job['type']} job {job_id} failed: {e}")
+            error = {"status_code": 500, "detail": "Internal error while running the job"}
+        else:
+            error = None
+        finally:
+            self.running -= 1
+
+        if error is None:
+            self.completed += 1
+            await self._update(job_id, status=SUCCEEDED, result=result, finished_at=time.time())
+            logger.info(f"✅ {job['type']} job {job_id} finished in {time.time() - started:.1f}s")
+        else:
+            self.failed += 1
+            await self._update(job_id, status=FAILED, error=error, finished_at=time.time())
+
+    async def _purge_loop(self) -> None:
+        while True:
+            try:
+                deleted = await asyncio.to_thread(self._get_store().purge, time.time() - self.retention)
+                if deleted:
+                    self.purged += deleted
+                    logger.info(f"🗃️ Purged {deleted} expired jobs")
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Job purge failed: {e}")
+            await asyncio.sleep(JOB_PURGE_INTERVAL_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "types": self.job_types,
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "resumed": self.resumed,
+            "purged": self.purged,
+            "retention_seconds": self.retention,
+            "stored": self.store.counts() if self.store is not None else None,
+        }
+
+jobs = JobManager()
+
+def register(job_type: str, input_model: Type[BaseModel], handler: JobHandler) -> None:
+    jobs.register(job_type, input_model, handler)
+
+async def submit(job_type: str, payload: Dict[str, Any], user: AuthenticatedUser) -> Dict[str, Any]:
+    return await jobs.submit(job_type, payload, user)
+
+async def get(job_id: str) -> Optional[Dict[str, Any]]:
+    return await jobs.get(job_id)
+
+async def wait_for_change(job_id: str, updated_at: float, timeout: float) -> Optional[Dict[str, Any]]:
+    return await jobs.wait_for_change(job_id, updated_at, timeout)
+
+async def start() -> None:
+    """Start the worker pool (called from the app lifespan)"""
+    await jobs.start()
+
+async def stop() -> None:
+    await jobs.stop()
+
+def get_job_stats() -> Dict[str, Any]:
+    return jobs.stats()
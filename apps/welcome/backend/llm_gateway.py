@@ -0,0 +1,597 @@
+"""
+Single entry point for every Gemini call.
+
+Owns the genai configuration, caches GenerativeModel objects per
+(model, generation_config, system_instruction), and limits how many calls
+run against each model at once. Callers beyond the limit wait in a FIFO
+queue. The limit adapts AIMD-style: it grows by ~1 per window of successful
+calls and is cut multiplicatively on quota errors (429 / ResourceExhausted),
+which are retried with exponential backoff and full jitter.
+
+    response = await llm_gateway.generate(prompt, model="gemini-1.5-flash")
+    text = response.text
+
+    async for chunk in llm_gateway.stream(prompt, model="gemini-2.0-flash-exp"):
+        ...
+
+Identical concurrent calls (same model, config, system instruction and
+prompt text) are coalesced into one Gemini request whose response every
+caller receives.
+
+Speculative work can run at background priority, which only takes a slot
+when no interactive call is waiting and never more than half the limit:
+
+    with llm_gateway.background_priority() as work:
+        await llm_gateway.generate(...)
+
+An interactive request that ends up waiting on that work (it joined the
+same call, or claimed its result) raises it with work.promote(), so it is
+not left queued behind the traffic it was meant to yield to.
+
+Set LLM_BACKEND=fake to swap Gemini for a local fake with a fixed capacity
+(see FakeGeminiBackend), e.g. for offline load tests.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import asyncio
+import logging
+import threading
+import contextlib
+import contextvars
+import dataclasses
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Iterator, List, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_BACKOFF_FACTOR = float(os.getenv("LLM_BACKOFF_FACTOR", "0.5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "20"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "60"))
+# Per-model ceilings, e.g. "gemini-2.0-flash-exp=4,gemini-1.5-flash=12"
+LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")
+# GenerativeModel objects kept for reuse (one per model / generation config / system instruction)
+LLM_MODEL_CACHE_SIZE = int(os.getenv("LLM_MODEL_CACHE_SIZE", "32"))
+
+QUOTA_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+
+class BackgroundWork:
+    """The Gemini calls made inside one background_priority() block"""
+    def __init__(self):
+        self.background = True
+        # Set once one of the calls has held a model slot
+        self.started = False
+        self._queued: Dict[asyncio.Future, "AdaptiveLimiter"] = {}
+
+    def promote(self) -> None:
+        """Run the block's calls at interactive priority, including those already queued"""
+        if not self.background:
+            return
+        self.background = False
+        for waiter, limiter in list(self._queued.items()):
+            limiter.promote(waiter)
+
+# The BackgroundWork the current task's Gemini calls belong to (None = interactive)
+_work: "contextvars.ContextVar[Optional[BackgroundWork]]" = contextvars.ContextVar("llm_background_work", default=None)
+
+@contextlib.contextmanager
+def background_priority() -> Iterator[BackgroundWork]:
+    """Run the Gemini calls made inside this block at background priority"""
+    work = BackgroundWork()
+    token = _work.set(work)
+    try:
+        yield work
+    finally:
+        _work.reset(token)
+
+def current_work() -> Optional[BackgroundWork]:
+    """The background work the current task is part of (None for interactive requests)"""
+    return _work.get()
+
+def join_work(work: Optional[BackgroundWork]) -> None:
+    """The current task is about to wait on work; an interactive caller promotes it"""
+    if work is not None and _work.get() is None:
+        work.promote()
+
+class PrioritySingleFlight(SingleFlight):
+    """SingleFlight whose interactive joiners promote the background work they wait on"""
+    def __init__(self):
+        super().__init__()
+        self._work: Dict[Hashable, BackgroundWork] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.is_in_flight(key):
+            join_work(self._work.get(key))
+            return await super().do(key, fn)
+        work = _work.get()
+        if work is None:
+            return await super().do(key, fn)
+        self._work[key] = work
+
+        async def call():
+            try:
+                return await fn()
+            finally:
+                if self._work.get(key) is work:
+                    del self._work[key]
+
+        return await super().do(key, call)
+
+class LLMOverloadedError(Exception):
+    """Raised when a call waited longer than LLM_QUEUE_TIMEOUT_SECONDS for a slot"""
+
+def _parse_model_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        try:
+            limits[name.strip()] = int(value)
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring bad LLM_MODEL_CONCURRENCY entry: {item}")
+    return limits
+
+def config_key(generation_config: Any) -> str:
+    """Stable, hashable form of a GenerationConfig or plain dict"""
+    if generation_config is None:
+        return ""
+    if dataclasses.is_dataclass(generation_config):
+        generation_config = dataclasses.asdict(generation_config)
+    values = {k: v for k, v in dict(generation_config).items() if v is not None}
+    return json.dumps(values, sort_keys=True, default=str)
+
+# ============
+# Backends
+# ============
+
+class GeminiBackend:
+    """Calls Gemini through google.generativeai, reusing model objects"""
+    def __init__(self, api_key: Optional[str]):
+        genai.configure(api_key=api_key)
+        self._models: "OrderedDict[Hashable, genai.GenerativeModel]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def model(self, model: str, generation_config: Any, system_instruction: Optional[str]) -> genai.GenerativeModel:
+        key = (model, config_key(generation_config), system_instruction)
+        with self._lock:
+            cached = self._models.get(key)
+            if cached is None:
+                cached = genai.GenerativeModel(
+                    model_name=model,
+                    generation_config=generation_config,
+                    system_instruction=system_instruction,
+                )
+                self._models[key] = cached
+                while len(self._models) > LLM_MODEL_CACHE_SIZE:
+                    self._models.popitem(last=False)
+            else:
+                self._models.move_to_end(key)
+            return cached
+
+    async def generate(self, prompt: Any, model: str, generation_config: Any, system_instruction: Optional[str]) -> Any:
+        return await self.model(model, generation_config, system_instruction).generate_content_async(prompt)
+
+    async def stream(self, prompt: Any, model: str, generation_config: Any, system_instruction: Optional[str]) -> AsyncIterator[str]:
+        response = await self.model(model, generation_config, system_instruction).generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # chunk without text parts (e.g. only a finish reason)
+            if text:
+                yield text
+
+    async def list_models(self) -> List[str]:
+        # list_models() pages over the network synchronously - keep it off the event loop
+        return await asyncio.to_thread(lambda: [m.name for m in genai.list_models()])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "gemini", "cached_models": len(self._models)}
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeGeminiBackend:
+    """
+    Local stand-in for Gemini: answers after LLM_FAKE_LATENCY_SECONDS and
+    raises ResourceExhausted whenever more than LLM_FAKE_CAPACITY calls are
+    in flight, like a project that has hit its quota.
+    """
+    def __init__(
+        self,
+        latency: float = float(os.getenv("LLM_FAKE_LATENCY_SECONDS", "0.5")),
+        capacity: int = int(os.getenv("LLM_FAKE_CAPACITY", "4")),
+        response_text: str = os.getenv("LLM_FAKE_RESPONSE", "[]"),
+    ):
+        self.latency = latency
+        self.capacity = capacity
+        self.response_text = response_text
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.rejected = 0
+
+    async def _admit(self) -> None:
+        self.calls += 1
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            await asyncio.sleep(0.01)
+            raise google_exceptions.ResourceExhausted("429 Resource has been exhausted (fake backend)")
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def generate(self, prompt: Any, model: str, generation_config: Any, system_instruction: Optional[str]) -> Any:
+        await self._admit()
+        try:
+            await asyncio.sleep(self.latency)
+            return FakeResponse(self.response_text)
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, prompt: Any, model: str, generation_config: Any, system_instruction: Optional[str]) -> AsyncIterator[str]:
+        """Same text as generate(), in 64-character chunks spread over the latency"""
+        await self._admit()
+        try:
+            chunks = [self.response_text[i:i + 64] for i in range(0, len(self.response_text), 64)] or [""]
+            for chunk in chunks:
+                await asyncio.sleep(self.latency / len(chunks))
+                yield chunk
+        finally:
+            self.in_flight -= 1
+
+    async def list_models(self) -> List[str]:
+        return ["models/fake-gemini"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "fake",
+            "capacity": self.capacity,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "peak_in_flight": self.peak_in_flight,
+        }
+
+# ============
+# Limiter
+# ============
+
+class AdaptiveLimiter:
+    """
+    Per-model concurrency limit with a FIFO wait queue.
+
+    A released slot is handed straight to the oldest waiter, so later
+    arrivals cannot overtake callers that are already queued. Background
+    callers have their own queue and are only served when no interactive
+    caller is waiting, up to half the limit; a promoted background caller
+    moves to the back of the interactive queue.
+    """
+    def __init__(self, name: str, max_limit: int, min_limit: int = LLM_MIN_CONCURRENCY):
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._background_waiters: Deque[asyncio.Future] = deque()
+        self.background_in_flight = 0
+        self.completed = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.promoted = 0
+        self.peak_queue = 0
+        # Bumped on every decrease; calls started before a decrease don't cut again
+        self.epoch = 0
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def _has_background_capacity(self) -> bool:
+        return (
+            not self._waiters
+            and self._has_capacity()
+            and self.background_in_flight < max(1, int(self.limit) // 2)
+        )
+
+    async def acquire(self, timeout: Optional[float] = None, work: Optional[BackgroundWork] = None) -> bool:
+        """Wait for a slot; returns whether it is a background one (pass that to release)"""
+        background = work is not None and work.background
+        if background:
+            if not self._background_waiters and self._has_background_capacity():
+                self.in_flight += 1
+                self.background_in_flight += 1
+                work.started = True
+                return True
+            queue = self._background_waiters
+        else:
+            if not self._waiters and self._has_capacity():
+                self.in_flight += 1
+                if work is not None:
+                    work.started = True
+                return False
+            queue = self._waiters
+
+        # Resolved with True when the slot comes from the background queue
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self.peak_queue = max(self.peak_queue, len(self._waiters))
+        if background:
+            work._queued[waiter] = self
+        try:
+            background = await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we gave up; pass it on
+                self.release(waiter.result())
+            else:
+                waiter.cancel()
+                for queue in (self._waiters, self._background_waiters):
+                    try:
+                        queue.remove(waiter)
+                    except ValueError:
+                        pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise LLMOverloadedError(f"Timed out waiting for a {self.name} slot") from None
+            raise
+        finally:
+            if work is not None:
+                work._queued.pop(waiter, None)
+        if work is not None:
+            work.started = True
+        return background
+
+    def promote(self, waiter: asyncio.Future) -> None:
+        """Move a queued background caller to the interactive queue"""
+        try:
+            self._background_waiters.remove(waiter)
+        except ValueError:
+            return  # already has its slot
+        self._waiters.append(waiter)
+        self.promoted += 1
+        self._wake()
+
+    def release(self, background: bool = False) -> None:
+        self.in_flight -= 1
+        if background:
+            self.background_in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(False)
+        while self._background_waiters and self._has_background_capacity():
+            waiter = self._background_waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            self.background_in_flight += 1
+            waiter.set_result(True)
+
+    def on_success(self) -> None:
+        """Additive increase: about +1 per window of successful calls"""
+        self.completed += 1
+        if self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    def on_throttled(self, epoch: int) -> None:
+        """Multiplicative decrease on a quota error, once per burst of 429s"""
+        self.throttled += 1
+        if epoch != self.epoch:
+            return
+        self.epoch += 1
+        new_limit = max(self.min_limit, self.limit * LLM_BACKOFF_FACTOR)
+        if int(new_limit) < int(self.limit):
+            logger.warning(f"⚠️ {self.name} throttled, concurrency {int(self.limit)} → {int(new_limit)}")
+        self.limit = new_limit
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "background_in_flight": self.background_in_flight,
+            "background_queued": len(self._background_waiters),
+            "peak_queue": self.peak_queue,
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "queue_timeouts": self.timeouts,
+            "promoted": self.promoted,
+        }
+
+# ============
+# Gateway
+# ============
+
+class LLMGateway:
+    def __init__(self, backend: Any = None):
+        self._backend = backend
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._model_limits = _parse_model_limits(LLM_MODEL_CONCURRENCY)
+        self._flights = PrioritySingleFlight()
+        self.retries = 0
+
+    @property
+    def backend(self) -> Any:
+        # Created on first use so GEMINI_API_KEY can come from main's load_dotenv()
+        if self._backend is None:
+            self._backend = _create_backend()
+        return self._backend
+
+    def limiter(self, model: str) -> AdaptiveLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = AdaptiveLimiter(model, self._model_limits.get(model, LLM_MAX_CONCURRENCY))
+            self._limiters[model] = limiter
+        return limiter
+
+    @staticmethod
+    def _backoff_seconds(attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    async def generate(
+        self,
+        prompt: Any,
+        *,
+        model: str = "gemini-1.5-flash",
+        generation_config: Any = None,
+        system_instruction: Optional[str] = None,
+    ) -> Any:
+        call = lambda: self._generate(prompt, model, generation_config, system_instruction)
+        if not isinstance(prompt, str):
+            return await call()  # multi-part prompts (files, images) aren't coalesced
+
+        key = hashlib.sha256(
+            json.dumps([model, config_key(generation_config), system_instruction, prompt]).encode("utf-8")
+        ).hexdigest()
+        if self._flights.is_in_flight(key):
+            logger.info(f"🔗 Joined in-flight {model} call {key[:12]}")
+        return await self._flights.do(key, call)
+
+    async def _generate(self, prompt: Any, model: str, generation_config: Any, system_instruction: Optional[str]) -> Any:
+        limiter = self.limiter(model)
+        work = _work.get()
+        attempt = 0
+        while True:
+            background = await limiter.acquire(LLM_QUEUE_TIMEOUT_SECONDS, work)
+            epoch = limiter.epoch
+            start = time.perf_counter()
+            try:
+                response = await self.backend.generate(prompt, model, generation_config, system_instruction)
+            except QUOTA_ERRORS as e:
+                limiter.on_throttled(epoch)
+                error = e
+            except TRANSIENT_ERRORS as e:
+                error = e
+            else:
+                limiter.on_success()
+                logger.debug(f"🧠 {model} answered in {(time.perf_counter() - start) * 1000:.0f} ms")
+                return response
+            finally:
+                limiter.release(background)
+
+            await self._before_retry(model, attempt, error)
+            attempt += 1
+
+    async def stream(
+        self,
+        prompt: Any,
+        *,
+        model: str = "gemini-1.5-flash",
+        generation_config: Any = None,
+        system_instruction: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Yield response text as Gemini produces it. The model slot is held
+        until the stream ends; errors are only retried before the first chunk.
+        """
+        limiter = self.limiter(model)
+        work = _work.get()
+        attempt = 0
+        while True:
+            background = await limiter.acquire(LLM_QUEUE_TIMEOUT_SECONDS, work)
+            epoch = limiter.epoch
+            started = False
+            try:
+                async for text in self.backend.stream(prompt, model, generation_config, system_instruction):
+                    started = True
+                    yield text
+            except QUOTA_ERRORS as e:
+                limiter.on_throttled(epoch)
+                if started:
+                    raise
+                error = e
+            except TRANSIENT_ERRORS as e:
+                if started:
+                    raise
+                error = e
+            else:
+                limiter.on_success()
+                return
+            finally:
+                limiter.release(background)
+
+            await self._before_retry(model, attempt, error)
+            attempt += 1
+
+    async def _before_retry(self, model: str, attempt: int, error: Exception) -> None:
+        """Sleep before the next attempt, or re-raise once retries are used up"""
+        if attempt >= LLM_MAX_RETRIES:
+            logger.error(f"❌ {model} failed after {attempt + 1} attempts: {error}")
+            raise error
+        delay = self._backoff_seconds(attempt)
+        self.retries += 1
+        logger.warning(f"⚠️ {model} error ({type(error).__name__}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **(self._backend.stats() if self._backend else {"backend": LLM_BACKEND}),
+            "retries": self.retries,
+            # "shared" = Gemini calls saved by joining an identical in-flight call
+            "single_flight": self._flights.stats(),
+            "models": {name: limiter.stats() for name, limiter in self._limiters.items()},
+        }
+
+def _create_backend() -> Any:
+    if LLM_BACKEND == "fake":
+        logger.warning("⚠️ LLM_BACKEND=fake, Gemini calls are served by the local fake backend")
+        return FakeGeminiBackend()
+    return GeminiBackend(os.getenv("GEMINI_API_KEY"))
+
+gateway = LLMGateway()
+
+async def generate(
+    prompt: Any,
+    *,
+    model: str = "gemini-1.5-flash",
+    generation_config: Any = None,
+    system_instruction: Optional[str] = None,
+) -> Any:
+    """Run one Gemini call through the shared gateway"""
+    return await gateway.generate(
+        prompt, model=model, generation_config=generation_config, system_instruction=system_instruction
+    )
+
+async def stream(
+    prompt: Any,
+    *,
+    model: str = "gemini-1.5-flash",
+    generation_config: Any = None,
+    system_instruction: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """Stream one Gemini call's text through the shared gateway"""
+    async for text in gateway.stream(
+        prompt, model=model, generation_config=generation_config, system_instruction=system_instruction
+    ):
+        yield text
+
+async def list_models() -> List[str]:
+    """Model names visible to the configured backend"""
+    return await gateway.backend.list_models()
+
+def get_llm_gateway_stats() -> Dict[str, Any]:
+    return gateway.stats()
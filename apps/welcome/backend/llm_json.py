@@ -0,0 +1,319 @@
+"""
+Tolerant, incremental parsing of JSON produced by the LLM.
+
+Model output regularly arrives wrapped in markdown fences, with trailing
+commas, or cut off at max_output_tokens. Rather than failing the whole
+request on one bad character, these helpers repair what they can and
+salvage every task that is intact:
+
+    result = extract_tasks(response.text, "maintenance_plan")
+    result.tasks      # valid task dicts, keys normalized to snake_case
+    result.dropped    # DroppedTask(index, reason, raw) for the rest
+    result.document   # whole repaired document, or None
+
+IncrementalTaskParser does the same while a response is still streaming,
+returning each task as soon as its closing brace arrives.
+
+Task keys are normalized so the different conventions the prompts produce
+("Task name", "Maintenance interval", "task_name", ...) all come out as
+the snake_case names the rest of the backend uses.
+"""
+import re
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Long-form keys asked for by the lead-capture / public plan prompts
+TASK_KEY_ALIASES = {
+    "task name": "task_name",
+    "step-by-step instructions": "instructions",
+    "reason for the task": "reason",
+    "estimated time in minutes": "est_minutes",
+    "number of technicians needed": "no_techs_needed",
+    "consumables required": "consumables",
+}
+
+RAW_PREVIEW_CHARS = 500
+
+@dataclass
+class DroppedTask:
+    index: int
+    reason: str
+    raw: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"index": self.index, "reason": self.reason}
+
+@dataclass
+class TaskParseResult:
+    tasks: List[Dict[str, Any]] = field(default_factory=list)
+    dropped: List[DroppedTask] = field(default_factory=list)
+    document: Any = None
+    repairs: List[str] = field(default_factory=list)
+
+def normalize_key(key: str) -> str:
+    folded = " ".join(str(key).split()).casefold()
+    return TASK_KEY_ALIASES.get(folded) or re.sub(r"[^0-9a-z]+", "_", folded).strip("_")
+
+def normalize_task_keys(task: Dict[str, Any]) -> Dict[str, Any]:
+    normalized: Dict[str, Any] = {}
+    for key, value in task.items():
+        # Keep the first value if two spellings of a key collide
+        normalized.setdefault(normalize_key(key), value)
+    return normalized
+
+def task_problem(task: Any, required_key: str = "task_name") -> Optional[str]:
+    """Why a parsed element isn't a usable task (None if it is)"""
+    if not isinstance(task, dict):
+        return f"expected an object, got {type(task).__name__}"
+    if not str(task.get(required_key) or "").strip():
+        return f"missing {required_key}"
+    return None
+
+def strip_fences(text: str) -> str:
+    """Remove markdown code fences and any prose around the JSON payload"""
+    text = (text or "").strip()
+    fenced = re.search(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", text, re.S)
+    if fenced:
+        text = fenced.group(1).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return text[min(starts):] if starts else text
+
+def remove_trailing_commas(text: str) -> str:
+    """Drop commas directly before a closing bracket, outside of strings"""
+    out = []
+    in_string = escape = False
+    pending_comma = None
+    for c in text:
+        if in_string:
+            out.append(c)
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            continue
+        if c == ",":
+            if pending_comma is not None:
+                out.append(pending_comma)
+            pending_comma = c
+            continue
+        if pending_comma is not None:
+            if c.isspace():
+                pending_comma += c
+                continue
+            if c not in "}]":
+                out.append(pending_comma)
+            else:
+                out.append(pending_comma[1:])  # keep the whitespace, drop the comma
+            pending_comma = None
+        if c == '"':
+            in_string = True
+        out.append(c)
+    if pending_comma is not None:
+        out.append(pending_comma)
+    return "".join(out)
+
+def close_truncated(text: str) -> Tuple[str, bool]:
+    """
+    Cut a truncated document back to its last complete element and close
+    the open brackets. Returns (text, whether anything was cut or closed).
+    """
+    stack: List[str] = []
+    in_string = escape = False
+    # (position, open brackets) after which the document can be closed cleanly
+    safe = (0, "")
+    for i, c in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            continue
+        if c == '"':
+            in_string = True
+        elif c in "{[":
+            stack.append(c)
+            safe = (i + 1, "".join(stack))
+        elif c in "}]":
+            if stack:
+                stack.pop()
+            safe = (i + 1, "".join(stack))
+        elif c == ",":
+            safe = (i, "".join(stack))
+    if not stack and not in_string:
+        return text, False
+    cut, open_brackets = safe
+    closers = "".join("}" if b == "{" else "]" for b in reversed(open_brackets))
+    return text[:cut].rstrip().rstrip(",") + closers, True
+
+def loads_tolerant(text: str) -> Tuple[Any, List[str]]:
+    """
+    json.loads with repairs for fences, trailing commas and truncation.
+    Returns (value, repairs applied); raises ValueError if nothing works.
+    """
+    repairs: List[str] = []
+    cleaned = strip_fences(text)
+    if cleaned != (text or "").strip():
+        repairs.append("fences")
+    try:
+        return json.loads(cleaned), repairs
+    except json.JSONDecodeError:
+        pass
+
+    without_commas = remove_trailing_commas(cleaned)
+    if without_commas != cleaned:
+        repairs.append("trailing_commas")
+        try:
+            return json.loads(without_commas), repairs
+        except json.JSONDecodeError:
+            pass
+
+    closed, truncated = close_truncated(without_commas)
+    if truncated:
+        repairs.append("truncated")
+        try:
+            return json.loads(remove_trailing_commas(closed)), repairs
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Unrepairable JSON: {e}") from e
+    raise ValueError("Unrepairable JSON")
+
+class IncrementalTaskParser:
+    """
+    Feed response text as it arrives; feed() returns the objects in the
+    array under array_key (or the first array if array_key is None) that
+    were completed by that chunk. Objects that can't be repaired, or that
+    fail task_problem(), are recorded in dropped instead.
+    """
+    def __init__(self, array_key: Optional[str] = "maintenance_plan", required_key: str = "task_name"):
+        self.array_key = array_key
+        self.required_key = required_key
+        self._start = re.compile(r'"%s"\s*:\s*\[' % re.escape(array_key)) if array_key else re.compile(r"\[")
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start: Optional[int] = None
+        self._index = 0
+        self.done = False
+        self.dropped: List[DroppedTask] = []
+        self.repairs: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        return self._buffer
+
+    @property
+    def found_array(self) -> bool:
+        return self._in_array
+
+    def _drop(self, reason: str, raw: str) -> None:
+        self.dropped.append(DroppedTask(self._index, reason, raw[:RAW_PREVIEW_CHARS]))
+
+    def _complete(self, raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            task = json.loads(raw)
+        except json.JSONDecodeError:
+            try:
+                task = json.loads(remove_trailing_commas(raw))
+                self.repairs.append("trailing_commas")
+            except json.JSONDecodeError as e:
+                self._drop(f"invalid JSON: {e.msg}", raw)
+                return None
+        if isinstance(task, dict):
+            task = normalize_task_keys(task)
+        problem = task_problem(task, self.required_key)
+        if problem:
+            self._drop(problem, raw)
+            return None
+        return task
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._buffer += chunk
+        completed: List[Dict[str, Any]] = []
+        if self.done:
+            return completed
+        if not self._in_array:
+            match = self._start.search(self._buffer)
+            if not match:
+                return completed
+            self._in_array = True
+            self._pos = match.end()
+
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                if self._depth == 0 and c == "{":
+                    self._object_start = i
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 0:
+                    # End of the task array
+                    self.done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    task = self._complete(buffer[self._object_start:i + 1])
+                    if task is not None:
+                        completed.append(task)
+                    self._object_start = None
+                    self._index += 1
+            i += 1
+        self._pos = i
+        return completed
+
+    def finish(self) -> None:
+        """Record a task left open by a truncated response"""
+        if self._object_start is not None:
+            self._drop("truncated", self._buffer[self._object_start:])
+            self._object_start = None
+            self._index += 1
+            self.repairs.append("truncated")
+
+def extract_tasks(text: str, array_key: Optional[str] = "maintenance_plan", required_key: str = "task_name") -> TaskParseResult:
+    """
+    Salvage every valid task from a complete response. array_key=None means
+    the tasks are the top-level array (or a single top-level object).
+    """
+    parser = IncrementalTaskParser(array_key, required_key)
+    tasks = parser.feed(strip_fences(text))
+    parser.finish()
+    result = TaskParseResult(tasks=tasks, dropped=parser.dropped, repairs=list(dict.fromkeys(parser.repairs)))
+
+    try:
+        result.document, document_repairs = loads_tolerant(text)
+        result.repairs = list(dict.fromkeys(result.repairs + document_repairs))
+    except ValueError:
+        result.document = None
+
+    if not parser.found_array or (array_key is None and not tasks and not parser.dropped):
+        # No task array in the output: accept a single top-level task object
+        document = result.document
+        items = document if isinstance(document, list) else [document] if isinstance(document, dict) else []
+        result.tasks, result.dropped = [], []
+        for index, item in enumerate(items):
+            task = normalize_task_keys(item) if isinstance(item, dict) else item
+            problem = task_problem(task, required_key)
+            if problem:
+                result.dropped.append(DroppedTask(index, problem, json.dumps(item)[:RAW_PREVIEW_CHARS]))
+            else:
+                result.tasks.append(task)
+    return result
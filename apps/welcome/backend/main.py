@@ -1,12 +1,15 @@
 # apps/welcome/backend/main.py - Production ready with environment-based CORS
 import os
 import json
+import time
+import asyncio
 import logging
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 import io
 import tempfile
 from pathlib import Path
+from contextlib import asynccontextmanager
 
 import google.generativeai as genai
 from dotenv import load_dotenv
@@ -14,16 +17,42 @@ from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from pydantic import BaseModel, Field, validator
-from supabase import create_client, Client
+from supabase import Client
 # Import our new auth module
 from auth import (
     verify_supabase_token, 
+    verify_supabase_token_remote,
+    jwks_cache,
+    get_token_cache_stats,
     AuthenticatedUser, 
     get_user_supabase_client,
     verify_site_access,
     require_admin_role
 )
-from database import get_user_supabase_client as db_get_user_client, get_service_supabase_client
+from database import (
+    get_user_supabase_client as db_get_user_client,
+    get_base_supabase_client,
+    close_supabase_clients,
+    shutdown_db_executor
+)
+from repositories import (
+    DB_PAGE_SIZE,
+    AccessRequestsRepository,
+    PMLeadsRepository
+)
+from http_clients import http_clients
+from memberships import get_membership_cache_stats, invalidate_user_memberships
+import reference_data
+import manual_context
+import manual_sections
+import asset_details
+import llm_gateway
+import ai_cache
+import jobs
+import plan_prefetch
+import pm_templates
+import plan_streaming
+from llm_json import extract_tasks
 # Rate limiting imports (optional - graceful fallback if not available)
 try:
     from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -43,20 +72,30 @@ from pdf_export import (
     export_assets_data_to_pdf,
     export_detailed_pm_plans_to_pdf
 )
-from api.suggest_child_assets import router as child_assets_router
+from api.suggest_child_assets import router as child_assets_router, ChildSuggestInput, suggest_child_assets
 from api.agent_executor import router as agent_router
 from api.bulk_import import router as bulk_import_router
-from api.full_parent_create_prompt import router as parent_plan_router
+from api.full_parent_create_prompt import router as parent_plan_router, ParentPlanInput, generate_parent_plan
 from api.access_requests import router as access_requests_router, send_notification_email
 from api.extract_asset_details import router as extract_details_router
 from api.pm_plan_notification import router as pm_plan_notification_router
+from api.job_routes import router as jobs_router
 from api.send_invitation import InvitationRequest, send_invitation_email
 from api.send_test_invitation import TestInvitationRequest, send_test_invitation_email
 from api.add_existing_user import AddExistingUserRequest, AddExistingUserResponse, add_existing_user_to_site
+from api.task_due_dates import get_pending_task_signoffs
 
 # Load environment variables
 load_dotenv()
 
+# /api/generate-ai-plan model; bump the prompt version whenever its prompt changes
+# so cached plans from the old prompt are no longer served
+AI_PLAN_MODEL = "gemini-2.0-flash-exp"
+AI_PLAN_PROMPT_VERSION = "1"
+# /api/generate-ai-plan/batch: plans generated at once per batch, and the largest batch accepted
+AI_PLAN_BATCH_PARALLELISM = int(os.getenv("AI_PLAN_BATCH_PARALLELISM", "4"))
+AI_PLAN_BATCH_MAX_ITEMS = int(os.getenv("AI_PLAN_BATCH_MAX_ITEMS", "50"))
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -83,8 +122,32 @@ if RATE_LIMITING_AVAILABLE:
 else:
     limiter = None
 
+# Application lifespan - start/stop background services
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared keep-alive connection pools for outbound HTTP (Supabase Auth, Resend)
+    http_clients.start()
+    # Load Supabase signing keys so JWTs can be verified locally
+    jwks_cache.start()
+    # Warm the dim_assets / roles / sites reference cache
+    reference_data.start()
+    # Rule-based PM plan templates from historical pm_tasks
+    pm_templates.start()
+    # Background workers for /api/jobs (resumes jobs interrupted by the last shutdown)
+    await jobs.start()
+    yield
+    await plan_prefetch.stop()
+    await jobs.stop()
+    await pm_templates.stop()
+    await reference_data.stop()
+    await jwks_cache.stop()
+    await http_clients.aclose()
+    shutdown_db_executor()
+    close_supabase_clients()
+    ai_cache.close()
+
 # Initialize FastAPI app
-app = FastAPI(title="PM Planning AI API", version="1.0.0")
+app = FastAPI(title="PM Planning AI API", version="1.0.0", lifespan=lifespan)
 
 # Add rate limiter to app (only if available)
 if RATE_LIMITING_AVAILABLE and limiter:
@@ -99,6 +162,7 @@ app.include_router(parent_plan_router, prefix="/api", tags=["parent-plans"])
 app.include_router(access_requests_router, prefix="/api", tags=["access-requests"])
 app.include_router(extract_details_router, prefix="/api", tags=["extraction"])
 app.include_router(pm_plan_notification_router, tags=["pm-notifications"])
+app.include_router(jobs_router, prefix="/api", tags=["jobs"])
 
 # Environment-based CORS configuration with smart pattern matching
 cors_origins_env = os.getenv("CORS_ORIGIN", "https://arctecfox-mono.vercel.app")
@@ -160,7 +224,6 @@ gemini_api_key = os.getenv("GEMINI_API_KEY")
 if not gemini_api_key:
     raise ValueError("GEMINI_API_KEY must be set")
 
-genai.configure(api_key=gemini_api_key)
 logger.info(f"🔑 Gemini key loaded: {'Yes' if gemini_api_key else 'No'}")
 
 # Initialize Supabase client for file access
@@ -170,7 +233,7 @@ if not supabase_url or not supabase_key:
     logger.warning("⚠️ Supabase credentials not found - file processing will be disabled")
     supabase_client = None
 else:
-    supabase_client: Client = create_client(supabase_url, supabase_key)
+    supabase_client: Client = get_base_supabase_client()
     logger.info("🔗 Supabase client initialized for file processing")
 
 # Validation utilities
@@ -233,6 +296,30 @@ class PlanData(BaseModel):
 
 class GenerateAIPlanRequest(BaseModel):
     planData: PlanData
+    bypass_cache: bool = Field(False, description="Skip the AI response cache and generate a fresh plan")
+    prefetch_id: Optional[str] = Field(None, max_length=64, description="Plan prefetched with the child-asset suggestions")
+    use_template: bool = Field(False, description="Answer from the PM template library when it covers the category")
+    enrich_with_ai: bool = Field(False, description="With use_template, also generate the AI plan as a background job")
+
+class BatchAIPlanRequest(BaseModel):
+    parent_asset_id: Optional[str] = Field(None, description="Parent asset whose manual is shared by every plan")
+    plans: List[PlanData]
+    max_parallel: Optional[int] = Field(None, ge=1, description="Lower the server's parallelism cap for this batch")
+    bypass_cache: bool = Field(False, description="Skip the AI response cache and generate fresh plans")
+
+    @validator('plans')
+    def validate_plans(cls, v, values):
+        if not v:
+            raise ValueError("At least one plan is required")
+        if len(v) > AI_PLAN_BATCH_MAX_ITEMS:
+            raise ValueError(f"At most {AI_PLAN_BATCH_MAX_ITEMS} plans per batch")
+        # The batch loads one parent manual for every plan, so they must share that parent
+        parents = {plan.parent_asset_id for plan in v if plan.parent_asset_id}
+        if values.get('parent_asset_id'):
+            parents.add(values['parent_asset_id'])
+        if len(parents) > 1:
+            raise ValueError("All plans in a batch must have the batch's parent_asset_id")
+        return v
 
 class HealthResponse(BaseModel):
     status: str
@@ -241,6 +328,8 @@ class HealthResponse(BaseModel):
 class AIPlanResponse(BaseModel):
     success: bool
     data: List[Dict[str, Any]]
+    source: str = "ai"  # "template" when served from the PM template library
+    enrichment_job_id: Optional[str] = None
 
 class PDFExportRequest(BaseModel):
     data: List[Dict[str, Any]]
@@ -266,86 +355,62 @@ async def debug_cors(request: Request):
         "user_agent": request.headers.get("user-agent", "No user-agent")
     }
 
-# Main PM generation route with authentication and rate limiting
-@app.post("/api/generate-ai-plan", response_model=AIPlanResponse)
-async def generate_ai_plan(
-    request: Request, 
-    plan_request: GenerateAIPlanRequest,
-    user: AuthenticatedUser = Depends(verify_supabase_token)
-):
-    try:
-        plan_data = plan_request.planData
-        logger.info(f"🚀 User {user.email} requesting AI plan for: {plan_data.name}")
-        logger.info(f"📋 Plan data - parent_asset_id: {plan_data.parent_asset_id}, child_asset_id: {plan_data.child_asset_id}")
-        
-        # Optional: If the plan request includes a site_id, verify access
-        # This would be added when you want to tie PM plans to specific sites
-        # if hasattr(plan_data, 'site_id') and plan_data.site_id:
-        #     from auth import verify_site_access
-        #     await verify_site_access(plan_data.site_id, user)
-        
-        if not plan_data.name or not plan_data.category:
-            raise HTTPException(status_code=400, detail="Missing required fields: name and category")
-
-        # Extract file content if user manual is provided
-        user_manual_content = ""
-        if plan_data.userManual:
-            logger.info(f"📄 Processing user manual: {plan_data.userManual.fileName}")
-            user_manual_content = await file_processor.extract_text_from_file(
-                plan_data.userManual.filePath, 
-                plan_data.userManual.fileType
-            )
-            if user_manual_content:
-                # Log manual details for debugging
-                manual_lines = user_manual_content.split('\n')
-                first_10_lines = '\n'.join(manual_lines[:10])
-                
-                logger.info(f"📚 Manual Content Detected for Child Asset PM Plan!")
-                logger.info(f"📚 Manual filename: {plan_data.userManual.fileName}")
-                logger.info(f"📚 Manual length: {len(user_manual_content)} characters")
-                logger.info(f"📚 Manual has {len(manual_lines)} lines")
-                logger.info(f"📚 First 10 lines of manual:\n{first_10_lines}")
-            else:
-                logger.warning("⚠️ Failed to extract content from user manual")
-        else:
-            logger.info("📚 No manual content provided for this child asset PM plan")
+AI_PLAN_GENERATION_CONFIG = genai.types.GenerationConfig(
+    temperature=0.7,
+    max_output_tokens=8192,
+)
 
-        # Fetch parent asset manual if parent_asset_id is provided
-        parent_manual_content = ""
-        if plan_data.parent_asset_id:
-            logger.info(f"🔍 Looking for parent asset manual with parent_asset_id: {plan_data.parent_asset_id}")
-            try:
-                # Use service client - this bypasses RLS and should work
-                service_client = get_service_supabase_client()
-                
-                # Query loaded_manuals for parent asset manual  
-                parent_manual_response = service_client.table('loaded_manuals').select('file_path,file_type,original_name').eq('parent_asset_id', plan_data.parent_asset_id).limit(1).execute()
-                
-                logger.info(f"📚 Query response data: {parent_manual_response.data}")
-                logger.info(f"📚 Query response count: {len(parent_manual_response.data) if parent_manual_response.data else 0}")
-                
-                if parent_manual_response.data and len(parent_manual_response.data) > 0:
-                    parent_manual = parent_manual_response.data[0]
-                    logger.info(f"📚 Found parent asset manual: {parent_manual['original_name']}")
-                    
-                    logger.info(f"📚 Attempting to extract from file_path: {parent_manual['file_path']}")
-                    logger.info(f"📚 File type: {parent_manual['file_type']}")
-                    
-                    parent_manual_content = await file_processor.extract_text_from_file(
-                        parent_manual['file_path'],
-                        parent_manual['file_type']
-                    )
-                    
-                    if parent_manual_content:
-                        logger.info(f"📚 Successfully extracted parent manual content: {len(parent_manual_content)} characters")
-                else:
-                    logger.info(f"📚 No parent manual found in database for parent_asset_id: {plan_data.parent_asset_id}")
-            except Exception as e:
-                logger.error(f"⚠️ Error fetching parent manual: {e}")
+async def _load_parent_manual(parent_asset_id: Optional[str]) -> str:
+    """Text of the parent asset's manual, or "" if it has none (cached across sibling plans)"""
+    if not parent_asset_id:
+        logger.info("📚 No parent_asset_id provided, skipping parent manual fetch")
+        return ""
+    logger.info(f"🔍 Looking for parent asset manual with parent_asset_id: {parent_asset_id}")
+    try:
+        return await manual_context.get_parent_manual_text(parent_asset_id)
+    except Exception as e:
+        logger.error(f"⚠️ Error fetching parent manual: {e}")
+        return ""
+
+async def _prepare_ai_plan(plan_data: PlanData, parent_manual_content: Optional[str] = None) -> Tuple[str, str]:
+    """Fetch the manuals and build the Gemini prompt and AI response cache key for a plan request"""
+    # Extract file content if user manual is provided
+    user_manual_content = ""
+    if plan_data.userManual:
+        logger.info(f"📄 Processing user manual: {plan_data.userManual.fileName}")
+        user_manual_content = await file_processor.extract_text_from_file(
+            plan_data.userManual.filePath, 
+            plan_data.userManual.fileType
+        )
+        if user_manual_content:
+            # Log manual details for debugging
+            manual_lines = user_manual_content.split('\n')
+            first_10_lines = '\n'.join(manual_lines[:10])
+            
+            logger.info(f"📚 Manual Content Detected for Child Asset PM Plan!")
+            logger.info(f"📚 Manual filename: {plan_data.userManual.fileName}")
+            logger.info(f"📚 Manual length: {len(user_manual_content)} characters")
+            logger.info(f"📚 Manual has {len(manual_lines)} lines")
+            logger.info(f"📚 First 10 lines of manual:\n{first_10_lines}")
         else:
-            logger.info("📚 No parent_asset_id provided, skipping parent manual fetch")
-
-        prompt = f"""
+            logger.warning("⚠️ Failed to extract content from user manual")
+    else:
+        logger.info("📚 No manual content provided for this child asset PM plan")
+
+    # Fetch parent asset manual if parent_asset_id is provided (batches pass it in, fetched once)
+    if parent_manual_content is None:
+        parent_manual_content = await _load_parent_manual(plan_data.parent_asset_id)
+
+    # Only the most maintenance-relevant sections of long manuals go into the prompt
+    excerpts, manual_usage = await asyncio.to_thread(
+        manual_sections.fit_manuals,
+        {"child": user_manual_content, "parent": parent_manual_content},
+        [plan_data.name, plan_data.category, plan_data.model],
+    )
+    user_manual_content = excerpts.get("child", "")
+    parent_manual_content = excerpts.get("parent", "")
+
+    prompt = f"""
 Generate a detailed preventive maintenance (PM) plan for the following asset:
 
 - Asset Name: {plan_data.name}
@@ -408,54 +473,145 @@ For each PM task:
 - "consumables" (string, list of consumables and supplies needed for this task)
 """
 
+    full_prompt = "You are an expert in preventive maintenance planning. Always return pure JSON without any markdown formatting.\n\n" + prompt
+
+    cache_inputs = plan_data.dict(exclude={"userManual", "parent_asset_id", "child_asset_id"})
+    cache_inputs["date_of_plan_start"] = plan_data.date_of_plan_start or datetime.now().strftime('%Y-%m-%d')
+    cache_inputs["user_manual"] = ai_cache.content_hash(user_manual_content)
+    cache_inputs["parent_manual"] = ai_cache.content_hash(parent_manual_content)
+    cache_key = ai_cache.cache_key(
+        "generate-ai-plan",
+        cache_inputs,
+        model=AI_PLAN_MODEL,
+        generation_config=AI_PLAN_GENERATION_CONFIG,
+        template_version=AI_PLAN_PROMPT_VERSION,
+    )
+    manual_sections.record_usage("generate-ai-plan", manual_usage, full_prompt)
+    return full_prompt, cache_key
+
+def _finish_ai_plan(plan_data: PlanData, parsed_plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Add the request's asset metadata to each generated task"""
+    # Debug: Log the full first task to see what Gemini returned
+    if parsed_plan:
+        logger.info(f"🔍 FIRST TASK DEBUG: {json.dumps(parsed_plan[0], indent=2)}")
+
+    # Add asset metadata to each task
+    for task in parsed_plan:
+        task["asset_name"] = plan_data.name
+        task["asset_model"] = plan_data.model
+
+    logger.info(f"✅ Final plan parsed with {len(parsed_plan)} tasks")
+
+    # Log critical info for debugging
+    if parsed_plan:
+        first_task = parsed_plan[0]
+        has_time = 'time_to_complete' in first_task
+        has_tools = 'tools_needed' in first_task
+        has_techs = 'number_of_technicians' in first_task
+        logger.info(f"🔍 DEBUG: time_to_complete={has_time}, tools_needed={has_tools}, number_of_technicians={has_techs}")
+
+    return parsed_plan
+
+async def _generate_ai_plan_tasks(
+    plan_data: PlanData,
+    bypass_cache: bool = False,
+    parent_manual_content: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Generate (or fetch from the AI response cache) the tasks of one plan"""
+    full_prompt, cache_key = await _prepare_ai_plan(plan_data, parent_manual_content)
+
+    async def generate_plan() -> List[Dict[str, Any]]:
         try:
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            full_prompt = "You are an expert in preventive maintenance planning. Always return pure JSON without any markdown formatting.\n\n" + prompt
-            response = model.generate_content(
+            response = await llm_gateway.generate(
                 full_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=8192,
-                )
+                model=AI_PLAN_MODEL,
+                generation_config=AI_PLAN_GENERATION_CONFIG
             )
         except Exception as ge:
             logger.error(f"🧠 Gemini API error: {ge}")
             raise HTTPException(status_code=502, detail="Gemini API error")
 
-        raw_content = response.text
+        raw_content = response.text or ""
         logger.info("🧠 AI response received from Gemini")
 
-        # Clean the response
-        raw_content = raw_content.replace("```json", "").replace("```", "").strip()
-
-        try:
-            parsed_response = json.loads(raw_content)
-            parsed_plan = parsed_response.get("maintenance_plan", [])
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON decode error: {e}")
+        # Keep every intact task, even if the response was fenced, truncated or partly malformed
+        result = extract_tasks(raw_content, "maintenance_plan")
+        if result.repairs:
+            logger.info(f"🔧 Repaired AI response: {', '.join(result.repairs)}")
+        if result.dropped:
+            logger.warning(f"⚠️ Dropped {len(result.dropped)} malformed tasks: {[d.to_dict() for d in result.dropped]}")
+        if not result.tasks:
+            logger.error("❌ No valid tasks in AI response")
             logger.error(f"Raw content: {raw_content[:200]}...")
             raise HTTPException(status_code=500, detail="AI returned invalid JSON format")
+        return result.tasks
+
+    parsed_plan = await ai_cache.get_or_generate(cache_key, generate_plan, bypass=bypass_cache)
+    return _finish_ai_plan(plan_data, parsed_plan)
+
+async def _template_ai_plan(plan_request: GenerateAIPlanRequest, user: AuthenticatedUser) -> Optional[AIPlanResponse]:
+    """Plan from the PM template library (None if it has no templates for the category)"""
+    plan_data = plan_request.planData
+    tasks = pm_templates.template_plan(
+        plan_data.category, plan_data.name, plan_data.model, plan_data.environment, plan_data.hours,
+        plan_data.date_of_plan_start,
+    )
+    if tasks is None:
+        logger.info(f"📚 No PM templates for category '{plan_data.category}', generating with AI")
+        return None
+
+    job_id = None
+    if plan_request.enrich_with_ai:
+        payload = {"planData": plan_data.dict(), "prefetch_id": plan_request.prefetch_id}
+        try:
+            job_id = (await jobs.submit("ai-plan-enrich", payload, user))["id"]
+        except (jobs.JobQueueFullError, RuntimeError) as e:
+            logger.warning(f"⚠️ AI enrichment not queued for {plan_data.name}: {e}")
 
-        # Debug: Log the full first task to see what Gemini returned
-        if parsed_plan:
-            logger.info(f"🔍 FIRST TASK DEBUG: {json.dumps(parsed_plan[0], indent=2)}")
+    logger.info(f"📚 Serving {len(tasks)} template tasks for: {plan_data.name}")
+    return AIPlanResponse(
+        success=True, data=_finish_ai_plan(plan_data, tasks), source="template", enrichment_job_id=job_id
+    )
 
-        # Add asset metadata to each task
-        for task in parsed_plan:
-            task["asset_name"] = plan_data.name
-            task["asset_model"] = plan_data.model
+async def _run_ai_plan_enrichment(plan_request: GenerateAIPlanRequest, user: AuthenticatedUser) -> AIPlanResponse:
+    # Enrichment is never waited on, so it yields the gateway to interactive requests
+    with llm_gateway.background_priority():
+        return await generate_ai_plan(None, plan_request, user)
 
-        logger.info(f"✅ Final plan parsed with {len(parsed_plan)} tasks")
+# Main PM generation route with authentication and rate limiting
+@app.post("/api/generate-ai-plan", response_model=AIPlanResponse)
+async def generate_ai_plan(
+    request: Request, 
+    plan_request: GenerateAIPlanRequest,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    try:
+        plan_data = plan_request.planData
+        logger.info(f"🚀 User {user.email} requesting AI plan for: {plan_data.name}")
+        logger.info(f"📋 Plan data - parent_asset_id: {plan_data.parent_asset_id}, child_asset_id: {plan_data.child_asset_id}")
         
-        # Log critical info for debugging
-        if parsed_plan:
-            first_task = parsed_plan[0]
-            has_time = 'time_to_complete' in first_task
-            has_tools = 'tools_needed' in first_task  
-            has_techs = 'number_of_technicians' in first_task
-            logger.info(f"🔍 DEBUG: time_to_complete={has_time}, tools_needed={has_tools}, number_of_technicians={has_techs}")
+        # Optional: If the plan request includes a site_id, verify access
+        # This would be added when you want to tie PM plans to specific sites
+        # if hasattr(plan_data, 'site_id') and plan_data.site_id:
+        #     from auth import verify_site_access
+        #     await verify_site_access(plan_data.site_id, user)
+        
+        if not plan_data.name or not plan_data.category:
+            raise HTTPException(status_code=400, detail="Missing required fields: name and category")
 
-        return AIPlanResponse(success=True, data=parsed_plan)
+        if plan_request.use_template and not plan_request.bypass_cache:
+            templated = await _template_ai_plan(plan_request, user)
+            if templated is not None:
+                return templated
+
+        if plan_request.prefetch_id and not plan_request.bypass_cache:
+            prefetched = await plan_prefetch.claim(plan_request.prefetch_id, user.id, plan_data.dict())
+            if prefetched is not None:
+                logger.info(f"🔮 Using prefetched plan for: {plan_data.name}")
+                return AIPlanResponse(success=True, data=_finish_ai_plan(plan_data, prefetched))
+
+        tasks = await _generate_ai_plan_tasks(plan_data, plan_request.bypass_cache)
+        return AIPlanResponse(success=True, data=tasks)
 
     except HTTPException:
         raise
@@ -464,6 +620,130 @@ For each PM task:
         logger.error("❌ Error generating AI plan:\n%s", traceback.format_exc())
         raise HTTPException(status_code=500, detail="Internal error during plan generation")
 
+# Streaming variant of /api/generate-ai-plan: each task is sent as a Server-Sent Event
+# as soon as Gemini has written it, followed by a "done" event with the full response
+@app.post("/api/generate-ai-plan/stream")
+async def generate_ai_plan_stream(
+    request: Request,
+    plan_request: GenerateAIPlanRequest,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    plan_data = plan_request.planData
+    logger.info(f"🚀 User {user.email} streaming AI plan for: {plan_data.name}")
+
+    if not plan_data.name or not plan_data.category:
+        raise HTTPException(status_code=400, detail="Missing required fields: name and category")
+
+    full_prompt, cache_key = await _prepare_ai_plan(plan_data)
+
+    def add_asset_metadata(task: Dict[str, Any]) -> Dict[str, Any]:
+        task["asset_name"] = plan_data.name
+        task["asset_model"] = plan_data.model
+        return task
+
+    return plan_streaming.sse_response(plan_streaming.stream_plan_events(
+        name="generate-ai-plan",
+        prompt=full_prompt,
+        model=AI_PLAN_MODEL,
+        generation_config=AI_PLAN_GENERATION_CONFIG,
+        cache_key=cache_key,
+        bypass_cache=plan_request.bypass_cache,
+        to_cache_value=lambda result: result.tasks,
+        tasks_of=lambda plan: plan,
+        prepare_task=add_asset_metadata,
+        build_result=lambda plan: AIPlanResponse(success=True, data=_finish_ai_plan(plan_data, plan)).dict(),
+    ))
+
+async def _iter_ai_plan_batch(batch_request: BatchAIPlanRequest) -> AsyncIterator[Dict[str, Any]]:
+    """Generate the plans of a batch concurrently, yielding each result as it finishes"""
+    plans = batch_request.plans
+    parallelism = min(batch_request.max_parallel or AI_PLAN_BATCH_PARALLELISM, AI_PLAN_BATCH_PARALLELISM)
+
+    # Every plan in the batch shares the parent manual: fetch and extract it once
+    parent_asset_id = batch_request.parent_asset_id or next((p.parent_asset_id for p in plans if p.parent_asset_id), None)
+    parent_manual_content = await _load_parent_manual(parent_asset_id)
+
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def run(index: int, plan_data: PlanData) -> Dict[str, Any]:
+        item = {"index": index, "name": plan_data.name, "child_asset_id": plan_data.child_asset_id}
+        try:
+            async with semaphore:
+                tasks = await _generate_ai_plan_tasks(plan_data, batch_request.bypass_cache, parent_manual_content)
+            return {**item, "success": True, "data": tasks}
+        except HTTPException as e:
+            return {**item, "success": False, "status_code": e.status_code, "detail": e.detail}
+        except Exception as e:
+            logger.error(f"❌ Batch plan {index} ({plan_data.name}) failed: {e}")
+            return {**item, "success": False, "status_code": 500, "detail": "Internal error during plan generation"}
+
+    pending = [asyncio.create_task(run(index, plan_data)) for index, plan_data in enumerate(plans)]
+    try:
+        for finished in asyncio.as_completed(pending):
+            yield await finished
+    finally:
+        # Caller went away: stop the generations that haven't finished
+        for task in pending:
+            task.cancel()
+
+def _batch_summary(total: int, succeeded: int, started: float) -> Dict[str, Any]:
+    logger.info(f"✅ Batch of {total} AI plans done, {total - succeeded} failed")
+    return {
+        "total": total,
+        "succeeded": succeeded,
+        "failed": total - succeeded,
+        "total_ms": round((time.perf_counter() - started) * 1000),
+    }
+
+# Batch variant of /api/generate-ai-plan for the child assets of one parent: plans are
+# generated concurrently (up to AI_PLAN_BATCH_PARALLELISM) and each is sent as a
+# Server-Sent Event when it finishes; one failed plan doesn't fail the batch
+#   event: plan   {"index", "name", "child_asset_id", "success": true, "data": [tasks]}
+#                 {"index", "name", "child_asset_id", "success": false, "status_code", "detail"}
+#   event: done   {"total", "succeeded", "failed", "total_ms"}
+@app.post("/api/generate-ai-plan/batch")
+async def generate_ai_plan_batch(
+    request: Request,
+    batch_request: BatchAIPlanRequest,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    logger.info(f"🚀 User {user.email} requesting a batch of {len(batch_request.plans)} AI plans")
+
+    async def events():
+        started = time.perf_counter()
+        succeeded = 0
+        async for item in _iter_ai_plan_batch(batch_request):
+            succeeded += item["success"]
+            yield plan_streaming.sse_event("plan", item)
+        yield plan_streaming.sse_event("done", _batch_summary(len(batch_request.plans), succeeded, started))
+
+    return plan_streaming.sse_response(events())
+
+async def _run_ai_plan_batch_job(batch_request: BatchAIPlanRequest, user: AuthenticatedUser) -> Dict[str, Any]:
+    started = time.perf_counter()
+    results = [item async for item in _iter_ai_plan_batch(batch_request)]
+    results.sort(key=lambda item: item["index"])
+    summary = _batch_summary(len(results), sum(item["success"] for item in results), started)
+    return {**summary, "results": results}
+
+# Generators that can also run as background jobs through /api/jobs
+jobs.register("ai-plan", GenerateAIPlanRequest, lambda data, user: generate_ai_plan(None, data, user))
+jobs.register("parent-plan", ParentPlanInput, lambda data, user: generate_parent_plan(None, data, user))
+jobs.register("child-suggestions", ChildSuggestInput, lambda data, user: suggest_child_assets(None, data, user))
+jobs.register("ai-plan-batch", BatchAIPlanRequest, _run_ai_plan_batch_job)
+# AI plan behind a template plan already returned by /api/generate-ai-plan (use_template + enrich_with_ai)
+jobs.register("ai-plan-enrich", GenerateAIPlanRequest, _run_ai_plan_enrichment)
+
+def _prefetch_plan_key(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """The request fields a generated plan depends on (child_asset_id is only stored with it)"""
+    plan_data = PlanData(**plan)
+    key = plan_data.dict(exclude={"child_asset_id"})
+    key["date_of_plan_start"] = plan_data.date_of_plan_start or datetime.now().strftime('%Y-%m-%d')
+    return key
+
+# Speculative plans for suggested child assets (see plan_prefetch)
+plan_prefetch.register(lambda plan: _generate_ai_plan_tasks(PlanData(**plan)), key=_prefetch_plan_key)
+
 # PDF Export endpoint with authentication
 @app.post("/api/export-pdf")
 async def export_pdf(
@@ -549,9 +829,6 @@ async def lead_capture_endpoint(
         plan_data = lead_request.planData
         logger.info(f"🚀 Lead capture request for: {plan_data.name} from {lead_request.email}")
         
-        # Get service client for database operations
-        service_client = get_service_supabase_client()
-        
         # Step 1: Generate AI plan
         if not plan_data.name or not plan_data.category:
             raise HTTPException(status_code=400, detail="Missing required fields: name and category")
@@ -586,23 +863,21 @@ Create a comprehensive PM plan with exactly 12 tasks. For each task provide:
 Return the response as a JSON array with all fields populated.
 """
 
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        ai_response = model.generate_content(prompt)
+        ai_response = await llm_gateway.generate(prompt, model='gemini-1.5-flash')
         
-        # Parse AI response
-        response_text = ai_response.text.strip()
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        
-        tasks = json.loads(response_text)
-        if not isinstance(tasks, list):
-            tasks = [tasks]
+        # Parse AI response; keys like "Task name" come back as task_name
+        parsed = extract_tasks(ai_response.text or "", None)
+        if parsed.dropped:
+            logger.warning(f"⚠️ Dropped {len(parsed.dropped)} malformed tasks: {[d.to_dict() for d in parsed.dropped]}")
+        tasks = parsed.tasks
+        if not tasks:
+            logger.error(f"❌ Failed to parse AI response: {(ai_response.text or '')[:200]}...")
+            raise HTTPException(status_code=500, detail="Failed to parse AI response")
         
         logger.info(f"✅ Generated {len(tasks)} PM tasks")
         
-        # Step 2: Save lead to database
+        # Steps 2-5: Save lead, PM plan, tasks and (optionally) the access request
+        # in a single transactional RPC so a failure never leaves orphan rows
         # Using only columns that exist in the current schema
         from datetime import datetime
         lead_payload = {
@@ -611,19 +886,10 @@ Return the response as a JSON array with all fields populated.
             "submitted_at": datetime.now().isoformat()
         }
         
-        lead_result = service_client.table("pm_leads").insert(lead_payload).execute()
-        lead_data = lead_result.data[0] if lead_result.data else None
-        if not lead_data:
-            raise HTTPException(status_code=500, detail="Failed to save lead")
-        logger.info(f"✅ Saved lead with ID: {lead_data['id']}")
-        
-        # Step 3: Save PM plan
         # Use current date if plan_start_date is not provided
-        from datetime import datetime
         plan_start_date = plan_data.date_of_plan_start or datetime.now().strftime('%Y-%m-%d')
         
         plan_payload = {
-            "lead_id": lead_data['id'],
             "plan_start_date": plan_start_date,
             "asset_name": plan_data.name,
             "asset_model": plan_data.model,
@@ -636,68 +902,64 @@ Return the response as a JSON array with all fields populated.
             "version": 1
         }
         
-        plan_result = service_client.table("pm_plans").insert(plan_payload).execute()
-        plan_data_result = plan_result.data[0] if plan_result.data else None
-        if not plan_data_result:
-            raise HTTPException(status_code=500, detail="Failed to save PM plan")
-        logger.info(f"✅ Saved PM plan with ID: {plan_data_result['id']}")
+        def to_array(v):
+            if isinstance(v, list):
+                return v
+            if v is None:
+                return []
+            s = str(v).strip()
+            if not s:
+                return []
+            return s.split("\n") if "\n" in s else [s]
         
-        # Step 4: Save PM tasks
-        if tasks:
-            def to_array(v):
-                if isinstance(v, list):
-                    return v
-                if v is None:
-                    return []
-                s = str(v).strip()
-                if not s:
-                    return []
-                return s.split("\n") if "\n" in s else [s]
-            
-            tasks_payload = []
-            for t in tasks:
-                task_data = {
-                    "pm_plan_id": plan_data_result['id'],
-                    "task_name": t.get("Task name") or t.get("task_name") or "Task",
-                    "maintenance_interval": t.get("Maintenance interval") or t.get("maintenance_interval"),
-                    "instructions": to_array(t.get("Step-by-step instructions") or t.get("instructions")),
-                    "reason": t.get("Reason for the task") or t.get("reason"),
-                    "engineering_rationale": t.get("Engineering rationale") or t.get("engineering_rationale"),
-                    "safety_precautions": t.get("Safety precautions") or t.get("safety_precautions"),
-                    "common_failures_prevented": t.get("Common failures prevented") or t.get("common_failures_prevented"),
-                    "usage_insights": t.get("Usage insights") or t.get("usage_insights"),
-                    "est_minutes": t.get("Estimated time in minutes") or t.get("est_minutes"),
-                    "tools_needed": t.get("Tools needed") or t.get("tools_needed"),
-                    "no_techs_needed": int(t.get("Number of technicians needed", 1)) if t.get("Number of technicians needed") else 1,
-                    "consumables": t.get("Consumables required") or t.get("consumables"),
-                    "status": "draft",
-                    "criticality": t.get("Criticality") or t.get("criticality") or "Medium"
-                }
-                tasks_payload.append(task_data)
-            
-            tasks_result = service_client.table("pm_tasks").insert(tasks_payload).execute()
-            logger.info(f"✅ Saved {len(tasks_payload)} PM tasks")
+        def to_int(v, default):
+            try:
+                return int(v)
+            except (TypeError, ValueError):
+                return default
+        
+        tasks_payload = []
+        for t in tasks:
+            task_data = {
+                "task_name": t.get("task_name") or "Task",
+                "maintenance_interval": t.get("maintenance_interval"),
+                "instructions": to_array(t.get("instructions")),
+                "reason": t.get("reason"),
+                "engineering_rationale": t.get("engineering_rationale"),
+                "safety_precautions": t.get("safety_precautions"),
+                "common_failures_prevented": t.get("common_failures_prevented"),
+                "usage_insights": t.get("usage_insights"),
+                "est_minutes": t.get("est_minutes"),
+                "tools_needed": t.get("tools_needed"),
+                "no_techs_needed": to_int(t.get("no_techs_needed"), 1),
+                "consumables": t.get("consumables"),
+                "status": "draft",
+                "criticality": t.get("criticality") or "Medium"
+            }
+            tasks_payload.append(task_data)
         
-        # Step 5: Create access request if requested
+        access_request_payload = None
         if lead_request.requestAccess and lead_request.fullName:
-            try:
-                logger.info(f"📧 Processing access request for {lead_request.email}")
-                
-                # Check if email already has a pending request
-                existing_request = service_client.table("access_requests").select("*").eq("email", lead_request.email).eq("status", "pending").execute()
-                
-                if not existing_request.data:
-                    access_request_data = {
-                        "email": lead_request.email,
-                        "full_name": lead_request.fullName,
-                        "lead_id": lead_data['id'],
-                        "status": "pending"
-                    }
-                    
-                    access_result = service_client.table("access_requests").insert(access_request_data).execute()
-                    logger.info(f"✅ Created access request record for {lead_request.email}")
-                    
-                    # Send notification email to support
+            logger.info(f"📧 Processing access request for {lead_request.email}")
+            access_request_payload = {
+                "email": lead_request.email,
+                "full_name": lead_request.fullName
+            }
+        
+        captured = await PMLeadsRepository().capture_with_plan(
+            lead_payload, plan_payload, tasks_payload, access_request_payload
+        )
+        lead_data = captured.get("lead") if captured else None
+        plan_data_result = captured.get("plan") if captured else None
+        if not lead_data or not plan_data_result:
+            raise HTTPException(status_code=500, detail="Failed to save lead and PM plan")
+        logger.info(f"✅ Saved lead {lead_data['id']}, PM plan {plan_data_result['id']} and {captured.get('task_count', 0)} PM tasks")
+        
+        # Send notification email to support once the access request is committed
+        if access_request_payload:
+            if captured.get("access_request"):
+                logger.info(f"✅ Created access request record for {lead_request.email}")
+                try:
                     logger.info(f"📨 Attempting to send notification email to support@arctecfox.co")
                     await send_notification_email(
                         email=lead_request.email,
@@ -705,12 +967,11 @@ Return the response as a JSON array with all fields populated.
                         company_name=lead_request.company
                     )
                     logger.info(f"✅ Email notification process completed for {lead_request.email}")
-                else:
-                    logger.info(f"⚠️ Access request already exists for {lead_request.email}")
-            except Exception as e:
-                logger.error(f"❌ Failed to create access request or send email: {e}")
-                logger.error(f"Error details: {str(e)}")
-                # Don't fail the whole process if access request fails
+                except Exception as e:
+                    logger.error(f"❌ Failed to send access request email: {e}")
+                    # Don't fail the whole process if the email fails
+            else:
+                logger.info(f"⚠️ Access request already exists for {lead_request.email}")
         
         # Step 6: Generate PDF with PM plan details
         pdf_url = None
@@ -719,20 +980,20 @@ Return the response as a JSON array with all fields populated.
             formatted_tasks = []
             for task in tasks:
                 formatted_task = {
-                    'task_name': task.get("Task name") or task.get("task_name") or "Task",
+                    'task_name': task.get("task_name") or "Task",
                     'asset_name': plan_data.name,
-                    'maintenance_interval': task.get("Maintenance interval") or task.get("maintenance_interval"),
-                    'instructions': task.get("Step-by-step instructions") or task.get("instructions"),
-                    'reason': task.get("Reason for the task") or task.get("reason"),
-                    'engineering_rationale': task.get("Engineering rationale") or task.get("engineering_rationale"),
-                    'safety_precautions': task.get("Safety precautions") or task.get("safety_precautions"),
-                    'common_failures_prevented': task.get("Common failures prevented") or task.get("common_failures_prevented"),
-                    'usage_insights': task.get("Usage insights") or task.get("usage_insights"),
-                    'time_to_complete': f"{task.get('Estimated time in minutes') or task.get('est_minutes') or 'N/A'} minutes",
-                    'tools_needed': task.get("Tools needed") or task.get("tools_needed"),
-                    'no_techs_needed': task.get("Number of technicians needed") or task.get("no_techs_needed") or 1,
-                    'consumables': task.get("Consumables required") or task.get("consumables"),
-                    'criticality': task.get("Criticality") or task.get("criticality") or "Medium"
+                    'maintenance_interval': task.get("maintenance_interval"),
+                    'instructions': task.get("instructions"),
+                    'reason': task.get("reason"),
+                    'engineering_rationale': task.get("engineering_rationale"),
+                    'safety_precautions': task.get("safety_precautions"),
+                    'common_failures_prevented': task.get("common_failures_prevented"),
+                    'usage_insights': task.get("usage_insights"),
+                    'time_to_complete': f"{task.get('est_minutes') or 'N/A'} minutes",
+                    'tools_needed': task.get("tools_needed"),
+                    'no_techs_needed': task.get("no_techs_needed") or 1,
+                    'consumables': task.get("consumables"),
+                    'criticality': task.get("criticality") or "Medium"
                 }
                 formatted_tasks.append(formatted_task)
             
@@ -764,9 +1025,6 @@ Return the response as a JSON array with all fields populated.
             pdf_url=pdf_url
         )
         
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ Failed to parse AI response: {e}")
-        raise HTTPException(status_code=500, detail="Failed to parse AI response")
     except HTTPException:
         raise
     except Exception as e:
@@ -823,6 +1081,11 @@ async def generate_ai_plan_public(
                 plan_data.userManual.filePath, 
                 plan_data.userManual.fileType
             )
+            excerpts, manual_usage = await asyncio.to_thread(
+                manual_sections.fit_manuals,
+                {"manual": user_manual_content}, [plan_data.name, plan_data.category, plan_data.model]
+            )
+            user_manual_content = excerpts.get("manual", "")
 
         prompt = f"""
 Generate a detailed preventive maintenance (PM) plan for the following asset:
@@ -856,33 +1119,24 @@ Create a comprehensive PM plan with exactly 12 tasks. For each task provide:
 Return the response as a JSON array with all fields populated.
 """
 
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        ai_response = model.generate_content(prompt)
+        if user_manual_content:
+            manual_sections.record_usage("generate-ai-plan-public", manual_usage, prompt)
+
+        ai_response = await llm_gateway.generate(prompt, model='gemini-1.5-flash')
         
-        try:
-            # Clean up response text
-            response_text = ai_response.text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            tasks = json.loads(response_text)
-            
-            # Ensure tasks is a list
-            if not isinstance(tasks, list):
-                tasks = [tasks]
-            
-            logger.info(f"✅ Successfully generated {len(tasks)} PM tasks for public request")
-            return AIPlanResponse(success=True, data=tasks, message="PM plan generated successfully")
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Failed to parse AI response: {e}")
+        parsed = extract_tasks(ai_response.text or "", None)
+        if parsed.dropped:
+            logger.warning(f"⚠️ Dropped {len(parsed.dropped)} malformed tasks: {[d.to_dict() for d in parsed.dropped]}")
+        if not parsed.tasks:
+            logger.error("❌ Failed to parse AI response")
             return AIPlanResponse(
                 success=False, 
                 data=[], 
                 message="Failed to parse AI response"
             )
+        
+        logger.info(f"✅ Successfully generated {len(parsed.tasks)} PM tasks for public request")
+        return AIPlanResponse(success=True, data=parsed.tasks, message="PM plan generated successfully")
             
     except HTTPException:
         raise
@@ -915,12 +1169,35 @@ async def send_test_invitation_endpoint(
 @app.post("/api/add-existing-user", response_model=AddExistingUserResponse)
 async def add_existing_user_endpoint(
     request: AddExistingUserRequest,
-    admin_user: AuthenticatedUser = Depends(verify_supabase_token)
+    admin_user: AuthenticatedUser = Depends(verify_supabase_token_remote)
 ):
     """Add an existing authenticated user directly to a site - Track 2 of dual-track user management"""
     logger.info(f"Admin {admin_user.email} requesting to add existing user {request.email} to site {request.site_id}")
     return await add_existing_user_to_site(request, admin_user)
 
+@app.post("/api/memberships/refresh")
+async def refresh_memberships_endpoint(
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    """Drop the caller's cached site/company roles, e.g. right after accepting an invitation"""
+    invalidate_user_memberships(user.id)
+    return {"success": True}
+
+@app.get("/api/task-signoffs/pending")
+async def pending_task_signoffs_endpoint(
+    site_id: Optional[str] = None,
+    due_from: Optional[str] = None,
+    due_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = DB_PAGE_SIZE,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    """Page through the caller's pending task signoffs (soonest due first)"""
+    try:
+        return await get_pending_task_signoffs(user.id, site_id, due_from, due_to, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Example: Admin-only endpoint for system status
 @app.get("/api/admin/system-status")
 async def get_system_status(
@@ -940,15 +1217,74 @@ async def get_system_status(
             "gemini": bool(os.getenv("GEMINI_API_KEY")),
             "supabase": bool(os.getenv("SUPABASE_URL")),
             "resend": bool(os.getenv("RESEND_API_KEY"))
-        }
+        },
+        "caches": {
+            "auth_tokens": get_token_cache_stats(),
+            "memberships": get_membership_cache_stats(),
+            "reference_data": reference_data.get_reference_cache_stats(),
+            "ai_responses": ai_cache.get_ai_cache_stats(),
+            "parent_manuals": manual_context.get_manual_cache_stats()
+        },
+        "manual_budget": manual_sections.get_manual_budget_stats(),
+        "asset_extraction": asset_details.get_extraction_stats(),
+        "llm": llm_gateway.get_llm_gateway_stats(),
+        "jobs": jobs.get_job_stats(),
+        "plan_prefetch": plan_prefetch.get_prefetch_stats(),
+        "pm_templates": pm_templates.get_template_stats()
     }
 
+@app.post("/api/admin/reference-data/refresh")
+async def refresh_reference_data_endpoint(
+    table: Optional[str] = None,
+    user: AuthenticatedUser = Depends(require_admin_role)
+):
+    """Drop cached dim_assets / roles / sites / manufacturers after editing them (all tables if none given)"""
+    try:
+        reference_data.invalidate_reference_data(table)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"📚 Admin {user.email} refreshed reference data: {table or 'all tables'}")
+    return {"success": True}
+
+@app.post("/api/admin/pm-templates/refresh")
+async def refresh_pm_templates_endpoint(
+    user: AuthenticatedUser = Depends(require_admin_role)
+):
+    """Rebuild the PM template library from pm_tasks (e.g. after a batch of plans was reviewed)"""
+    try:
+        library = await pm_templates.rebuild()
+    except Exception as e:
+        logger.error(f"❌ Failed to rebuild PM templates: {e}")
+        raise HTTPException(status_code=500, detail="Failed to rebuild PM templates")
+    logger.info(f"📚 Admin {user.email} rebuilt PM templates from {library.source}")
+    return {"success": True, "categories": len(library.categories), "tasks": library.task_count}
+
+@app.post("/api/manuals/refresh")
+async def refresh_manuals_endpoint(
+    parent_asset_id: str,
+    user: AuthenticatedUser = Depends(verify_supabase_token)
+):
+    """Drop the cached manual lookup for a parent asset after uploading or replacing its manual"""
+    if not parent_asset_id.strip():
+        raise HTTPException(status_code=400, detail="parent_asset_id is required")
+    manual_context.invalidate_parent_manual(parent_asset_id)
+    logger.info(f"📚 User {user.email} refreshed parent manual cache: {parent_asset_id}")
+    return {"success": True}
+
+@app.post("/api/admin/manuals/refresh")
+async def refresh_all_manuals_endpoint(
+    user: AuthenticatedUser = Depends(require_admin_role)
+):
+    """Drop every cached parent manual lookup (e.g. after a bulk re-upload of manuals)"""
+    manual_context.invalidate_parent_manual()
+    logger.info(f"📚 Admin {user.email} refreshed parent manual cache: all parents")
+    return {"success": True}
+
 # Debug Gemini connection
 @app.get("/api/debug-gemini")
 async def debug_gemini():
     try:
-        models = genai.list_models()
-        model_names = [m.name for m in models][:5]  # Just first 5 for brevity
+        model_names = (await llm_gateway.list_models())[:5]  # Just first 5 for brevity
         return JSONResponse(status_code=200, content={
             "success": True, 
             "models_sample": model_names,
@@ -965,17 +1301,15 @@ async def debug_gemini():
 @app.get("/api/debug-notifications")
 async def debug_notifications(user: AuthenticatedUser = Depends(verify_supabase_token)):
     """Debug endpoint to check notification system status"""
-    service_client = get_service_supabase_client()
-    
     # Get count of pending access requests
-    pending_requests = service_client.table("access_requests").select("*").eq("status", "pending").execute()
+    pending_requests = await AccessRequestsRepository().list_by_status("pending")
     
     result = {
         "timestamp": datetime.now().isoformat(),
         "admin_user": user.email,
         "notification_system": {
             "method": "Database logging with admin dashboard",
-            "pending_access_requests": len(pending_requests.data) if pending_requests.data else 0,
+            "pending_access_requests": len(pending_requests),
             "admin_review_url": f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/admin/super-admins?tab=access-requests"
         }
     }
@@ -0,0 +1,99 @@
+"""
+Cached parent-asset manual text for PM plan prompts.
+
+Every child-asset plan includes its parent's manual. Without a cache each
+sibling plan repeats the loaded_manuals lookup, the storage download and
+the PDF parse. Two tiers keep that work to once per parent:
+
+- parent_asset_id -> manual file (path and type), for MANUAL_LOOKUP_CACHE_SECONDS;
+  short, because manuals are uploaded by the frontend straight to Supabase
+- manual file -> extracted, trimmed text, for MANUAL_TEXT_CACHE_SECONDS;
+  a new upload has a new storage path, so this can live longer
+
+Concurrent requests for the same parent share one load. After replacing a
+parent's manual, POST /api/manuals/refresh drops the cached lookup at once.
+"""
+import os
+import re
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from cache import TTLCache, SingleFlight
+from file_processor import file_processor
+from repositories import LoadedManualsRepository
+
+logger = logging.getLogger(__name__)
+
+MANUAL_LOOKUP_CACHE_SECONDS = float(os.getenv("MANUAL_LOOKUP_CACHE_SECONDS", "300"))
+MANUAL_TEXT_CACHE_SECONDS = float(os.getenv("MANUAL_TEXT_CACHE_SECONDS", "3600"))
+MANUAL_TEXT_CACHE_SIZE = int(os.getenv("MANUAL_TEXT_CACHE_SIZE", "32"))
+
+# Cached in place of a manual row for parents that have none
+_NO_MANUAL: Dict[str, Any] = {}
+
+_manual_lookups = TTLCache(maxsize=4096, ttl=MANUAL_LOOKUP_CACHE_SECONDS)
+_manual_texts = TTLCache(maxsize=MANUAL_TEXT_CACHE_SIZE, ttl=MANUAL_TEXT_CACHE_SECONDS)
+_manual_loads = SingleFlight()
+
+def trim_manual_text(text: Optional[str]) -> str:
+    """Drop trailing spaces and runs of blank lines left by PDF extraction"""
+    if not text:
+        return ""
+    lines = [line.rstrip() for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def _file_identity(manual: Dict[str, Any]) -> Tuple[str, str]:
+    return (manual["file_path"], manual.get("file_type") or "")
+
+async def _find_manual(parent_asset_id: str) -> Optional[Dict[str, Any]]:
+    manual = _manual_lookups.get(parent_asset_id)
+    if manual is None:
+        # Query loaded_manuals for parent asset manual (service client - bypasses RLS)
+        manual = await LoadedManualsRepository().first_for_parent_asset(parent_asset_id) or _NO_MANUAL
+        _manual_lookups.set(parent_asset_id, manual)
+    return manual or None
+
+async def _extract(manual: Dict[str, Any]) -> str:
+    identity = _file_identity(manual)
+    text = _manual_texts.get(identity)
+    if text is not None:
+        logger.info(f"📚 Parent manual text cache hit: {manual.get('original_name')}")
+        return text
+
+    logger.info(f"📚 Found parent asset manual: {manual.get('original_name')}")
+    logger.info(f"📚 Attempting to extract from file_path: {manual['file_path']}")
+    logger.info(f"📚 File type: {manual.get('file_type')}")
+    text = trim_manual_text(await file_processor.extract_text_from_file(*identity))
+    # Extraction failures come back empty; don't cache them so the next plan retries
+    if text:
+        _manual_texts.set(identity, text)
+        logger.info(f"📚 Successfully extracted parent manual content: {len(text)} characters")
+    return text
+
+async def get_parent_manual_text(parent_asset_id: Optional[str]) -> str:
+    """Extracted text of the parent asset's manual, or "" if it has none"""
+    if not parent_asset_id:
+        return ""
+
+    async def load() -> str:
+        manual = await _find_manual(parent_asset_id)
+        if manual is None:
+            logger.info(f"📚 No parent manual found in database for parent_asset_id: {parent_asset_id}")
+            return ""
+        return await _extract(manual)
+
+    return await _manual_loads.do(parent_asset_id, load)
+
+def invalidate_parent_manual(parent_asset_id: Optional[str] = None) -> None:
+    """Forget which manual a parent has (all parents if none given)"""
+    if parent_asset_id:
+        _manual_lookups.pop(parent_asset_id)
+    else:
+        _manual_lookups.clear()
+
+def get_manual_cache_stats() -> Dict[str, Any]:
+    return {
+        "lookups": _manual_lookups.stats(),
+        "texts": _manual_texts.stats(),
+        "single_flight": _manual_loads.stats(),
+    }
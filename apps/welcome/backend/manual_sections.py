@@ -0,0 +1,230 @@
+"""
+Token-budgeted manual excerpts for plan prompts.
+
+Extracted manuals can run to hundreds of pages, far more than a plan
+prompt needs (or than the model's context fits). fit_manuals() splits each
+manual into sections, ranks them with BM25 against maintenance vocabulary
+plus the asset's own name and category, and keeps the best sections until
+MANUAL_TOKEN_BUDGET is spent. Kept sections stay in document order, with
+"[...]" where something was left out. Manuals that fit the budget are
+passed through untouched.
+
+    excerpts, usage = fit_manuals({"child": child_text, "parent": parent_text}, asset_terms)
+
+Tokens are estimated at CHARS_PER_TOKEN characters each; no tokenizer call
+is made. Splitting and tokenizing a long manual is the expensive part, so
+it is cached per manual content hash: a batch of child plans under one
+parent indexes the parent manual once. fit_manuals() is CPU-bound; call it
+with asyncio.to_thread() from async code.
+"""
+import os
+import re
+import math
+import hashlib
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Tokens of manual text allowed in one prompt, across all of its manuals
+MANUAL_TOKEN_BUDGET = int(os.getenv("MANUAL_TOKEN_BUDGET", "12000"))
+MANUAL_SECTION_CHARS = int(os.getenv("MANUAL_SECTION_CHARS", "2400"))
+MIN_SECTION_CHARS = 400
+CHARS_PER_TOKEN = 4
+MANUAL_INDEX_CACHE_SIZE = int(os.getenv("MANUAL_INDEX_CACHE_SIZE", "32"))
+MANUAL_INDEX_CACHE_SECONDS = float(os.getenv("MANUAL_INDEX_CACHE_SECONDS", "3600"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Query vocabulary for maintenance relevance; stemmed like the manual text
+# (see query_terms), with both forms where their stems differ
+MAINTENANCE_TERMS = (
+    "maintenance", "maintain", "service", "lubricate", "lubrication", "grease", "oil", "interval",
+    "hour", "daily", "weekly", "monthly", "annual", "inspect", "check", "torque", "tighten", "replace",
+    "replacement", "filter", "bearing", "seal", "belt", "wear", "adjust", "adjustment", "calibrate",
+    "calibration", "clean", "drain", "level", "vibration", "temperature", "troubleshoot", "fault",
+    "alarm", "spare", "part", "schedule", "lockout", "safety", "specification", "capacity", "pressure",
+    "coupling", "alignment",
+)
+
+SECTION_GAP = "\n[...]\n"
+
+_WORD = re.compile(r"[a-z][a-z0-9]+")
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ions", "ion", "ers", "er", "ed", "es", "s", "e", "y")
+# Numbered ("4.2 Bearings"), all-caps ("LUBRICATION") or "Chapter 3" lines; only the last ignores case
+_HEADING = re.compile(r"^(?:\d+(?:\.\d+)*\.?\s+\S|[A-Z][A-Z0-9 ,&/\-]{3,}$|(?i:chapter|section)\s+\d)")
+
+@dataclass
+class Section:
+    source: str
+    position: int
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[: -len(suffix)]
+    return word
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(word) for word in _WORD.findall(text.lower())]
+
+def split_sections(text: str, source: str = "", max_chars: int = MANUAL_SECTION_CHARS) -> List[Section]:
+    """Split on headings and blank lines into sections of at most max_chars"""
+    blocks: List[str] = []
+    current: List[str] = []
+    for line in text.splitlines():
+        if (not line.strip() or _HEADING.match(line.strip())) and current:
+            blocks.append("\n".join(current).strip())
+            current = []
+        if line.strip():
+            current.append(line)
+    if current:
+        blocks.append("\n".join(current).strip())
+
+    sections: List[Section] = []
+    pending = ""
+    for block in blocks:
+        # Oversized blocks (e.g. PDF text with no blank lines) are cut at line, then character, limits
+        while len(block) > max_chars:
+            cut = block.rfind("\n", 0, max_chars)
+            cut = cut if cut > max_chars // 2 else max_chars
+            if pending:
+                sections.append(Section(source, len(sections), pending))
+                pending = ""
+            sections.append(Section(source, len(sections), block[:cut].strip()))
+            block = block[cut:].strip()
+        # Short blocks (headings, stray lines) are merged into the next one
+        if pending and (len(pending) >= MIN_SECTION_CHARS or len(pending) + len(block) + 2 > max_chars):
+            sections.append(Section(source, len(sections), pending))
+            pending = ""
+        pending = f"{pending}\n\n{block}" if pending else block
+    if pending:
+        sections.append(Section(source, len(sections), pending))
+    return sections
+
+def bm25_scores(sections: List[Section], query: Iterable[str], documents: Optional[List[Counter]] = None) -> List[float]:
+    """Okapi BM25 score of every section for the query stems (documents: their token counts, if known)"""
+    if documents is None:
+        documents = [Counter(tokenize(section.text)) for section in sections]
+    if not documents:
+        return []
+    lengths = [sum(doc.values()) for doc in documents]
+    average = sum(lengths) / len(lengths) or 1
+    query = set(query)
+    frequency = Counter(term for doc in documents for term in query if term in doc)
+    scores = []
+    for doc, length in zip(documents, lengths):
+        score = 0.0
+        for term in query:
+            tf = doc.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(documents) - frequency[term] + 0.5) / (frequency[term] + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+        scores.append(score)
+    return scores
+
+# (label, content hash) -> (sections, token counts of each section)
+_index_cache = TTLCache(maxsize=MANUAL_INDEX_CACHE_SIZE, ttl=MANUAL_INDEX_CACHE_SECONDS)
+
+def index_manual(text: str, label: str = "") -> Tuple[List[Section], List[Counter]]:
+    """Sections of a manual and their token counts, cached by content"""
+    key = (label, hashlib.sha256(text.encode("utf-8")).hexdigest())
+    index = _index_cache.get(key)
+    if index is None:
+        sections = split_sections(text, label)
+        index = (sections, [Counter(tokenize(section.text)) for section in sections])
+        _index_cache.set(key, index)
+    return index
+
+def query_terms(asset_terms: Iterable[Optional[str]] = ()) -> List[str]:
+    """Maintenance vocabulary plus the stems of the asset's name, category, model, ..."""
+    terms = tokenize(" ".join(MAINTENANCE_TERMS))
+    for value in asset_terms:
+        terms.extend(tokenize(value or ""))
+    return list(dict.fromkeys(terms))
+
+def fit_manuals(
+    manuals: Dict[str, Optional[str]],
+    asset_terms: Iterable[Optional[str]] = (),
+    budget: int = MANUAL_TOKEN_BUDGET,
+) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    Fit the manuals (label -> text) into budget tokens. Returns the excerpt
+    for each label and a usage report for logging.
+    """
+    manuals = {label: text for label, text in manuals.items() if text}
+    total = sum(estimate_tokens(text) for text in manuals.values())
+    usage: Dict[str, Any] = {"budget": budget, "manual_tokens": total, "tokens_used": total, "trimmed": False}
+    if total <= budget:
+        return dict(manuals), usage
+
+    # One index over every manual, so the budget goes to the best sections wherever they are
+    sections: List[Section] = []
+    documents: List[Counter] = []
+    for label, text in manuals.items():
+        indexed, counts = index_manual(text, label)
+        sections.extend(indexed)
+        documents.extend(counts)
+    scores = bm25_scores(sections, query_terms(asset_terms), documents)
+    ranked = sorted(range(len(sections)), key=lambda i: (-scores[i], i))
+
+    chosen: List[Section] = []
+    used = 0
+    for i in ranked:
+        cost = sections[i].tokens + estimate_tokens(SECTION_GAP)
+        if used + cost > budget:
+            continue
+        chosen.append(sections[i])
+        used += cost
+
+    excerpts: Dict[str, str] = {}
+    for label in manuals:
+        kept = sorted((s for s in chosen if s.source == label), key=lambda s: s.position)
+        parts: List[str] = []
+        for previous, section in zip([None] + kept[:-1], kept):
+            if previous is None and section.position > 0 or previous is not None and section.position != previous.position + 1:
+                parts.append(SECTION_GAP.strip())
+            parts.append(section.text)
+        excerpts[label] = "\n\n".join(parts)
+
+    usage.update({
+        "tokens_used": sum(estimate_tokens(text) for text in excerpts.values()),
+        "trimmed": True,
+        "sections_used": len(chosen),
+        "sections_total": len(sections),
+    })
+    return excerpts, usage
+
+_stats = {"prompts": 0, "trimmed": 0, "manual_tokens": 0, "tokens_used": 0}
+
+def record_usage(name: str, usage: Dict[str, Any], prompt: str) -> None:
+    """Log the manual and prompt token counts of one request and add them to the stats"""
+    _stats["prompts"] += 1
+    _stats["trimmed"] += bool(usage.get("trimmed"))
+    _stats["manual_tokens"] += usage.get("manual_tokens", 0)
+    _stats["tokens_used"] += usage.get("tokens_used", 0)
+    detail = (
+        f", {usage['sections_used']}/{usage['sections_total']} sections kept"
+        if usage.get("trimmed") else ""
+    )
+    logger.info(
+        f"📚 {name}: manual tokens {usage.get('tokens_used', 0)}/{usage.get('manual_tokens', 0)} "
+        f"(budget {usage.get('budget')}{detail}), prompt ≈ {estimate_tokens(prompt)} tokens"
+    )
+
+def get_manual_budget_stats() -> Dict[str, Any]:
+    return {"budget": MANUAL_TOKEN_BUDGET, **_stats, "index_cache": _index_cache.stats()}
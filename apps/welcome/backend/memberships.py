@@ -0,0 +1,108 @@
+"""
+Cached site and company membership resolution for permission checks.
+
+All of a user's site_users and company_users rows (with role names) are
+loaded in a single PostgREST query and kept for a short TTL. Anything that
+changes memberships must call invalidate_user_memberships() so permission
+changes take effect immediately on this worker.
+"""
+import os
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from cache import TTLCache, SingleFlight
+from database import execute_query, get_service_supabase_client
+
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_CACHE_SECONDS = float(os.getenv("MEMBERSHIP_CACHE_SECONDS", "60"))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "4096"))
+
+_membership_cache = TTLCache(maxsize=MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_SECONDS)
+_membership_loads = SingleFlight()
+# Bumped on invalidation so a load that raced with a change is not cached
+_membership_generations: Dict[str, int] = {}
+
+MEMBERSHIP_SELECT = (
+    "id, "
+    "site_users(site_id, role_id, can_edit, roles(name), sites(company_id)), "
+    "company_users(company_id, role_id, roles(name))"
+)
+
+def _role_name(row: Dict[str, Any]) -> Optional[str]:
+    roles = row.get("roles")
+    return roles.get("name") if roles else None
+
+class UserMemberships:
+    """A user's site and company roles"""
+    def __init__(self, user_id: str, site_rows: List[Dict[str, Any]], company_rows: List[Dict[str, Any]]):
+        self.user_id = user_id
+        # site_id -> {"role_id", "role", "can_edit", "company_id"}
+        self.sites: Dict[str, Dict[str, Any]] = {}
+        for row in site_rows:
+            self.sites[row["site_id"]] = {
+                "role_id": row.get("role_id"),
+                "role": _role_name(row),
+                "can_edit": row.get("can_edit"),
+                "company_id": (row.get("sites") or {}).get("company_id"),
+            }
+        # company_id -> {"role_id", "role"}
+        self.companies: Dict[str, Dict[str, Any]] = {}
+        for row in company_rows:
+            self.companies[row["company_id"]] = {
+                "role_id": row.get("role_id"),
+                "role": _role_name(row),
+            }
+
+    def has_site(self, site_id: str) -> bool:
+        return site_id in self.sites
+
+    def site_role(self, site_id: str) -> Optional[str]:
+        """Role name at a site (role_id when the role has no name), None without access"""
+        site = self.sites.get(site_id)
+        if site is None:
+            return None
+        return site["role"] or site["role_id"]
+
+    @property
+    def site_company_ids(self) -> Set[str]:
+        """Companies the user belongs to through their site memberships"""
+        return {site["company_id"] for site in self.sites.values() if site["company_id"]}
+
+    def has_site_role(self, *role_names: str) -> bool:
+        return any(site["role"] in role_names for site in self.sites.values())
+
+    @property
+    def is_super_admin(self) -> bool:
+        return any(company["role"] == "super_admin" for company in self.companies.values())
+
+async def _load_memberships(user_id: str) -> UserMemberships:
+    client = get_service_supabase_client()
+    result = await execute_query(client.table("users").select(MEMBERSHIP_SELECT).eq("id", user_id))
+    row = result.data[0] if result.data else {}
+    return UserMemberships(user_id, row.get("site_users") or [], row.get("company_users") or [])
+
+async def get_user_memberships(user_id: str) -> UserMemberships:
+    """Memberships for a user, served from cache when fresh"""
+    memberships = _membership_cache.get(user_id)
+    if memberships is not None:
+        return memberships
+
+    async def load() -> UserMemberships:
+        generation = _membership_generations.get(user_id, 0)
+        loaded = await _load_memberships(user_id)
+        if _membership_generations.get(user_id, 0) == generation:
+            _membership_cache.set(user_id, loaded)
+        logger.info(f"👥 Loaded memberships for user {user_id}: {len(loaded.sites)} site(s), {len(loaded.companies)} company role(s)")
+        return loaded
+
+    return await _membership_loads.do(user_id, load)
+
+def invalidate_user_memberships(user_id: Optional[str]) -> None:
+    """Drop a user's cached memberships after they change"""
+    if user_id:
+        _membership_generations[user_id] = _membership_generations.get(user_id, 0) + 1
+        _membership_cache.pop(user_id)
+
+def get_membership_cache_stats() -> Dict[str, Any]:
+    return _membership_cache.stats()
@@ -0,0 +1,224 @@
+"""
+Speculative PM plan generation for suggested child assets.
+
+When /api/suggest-child-assets is called with prefetch_plans, plans for the
+top suggestions are generated in the background while the user reviews the
+list. Each suggestion gets a prefetch_id; passing it to /api/generate-ai-plan
+returns the finished plan at once (or waits for the one still running), as
+long as the request asks for the same plan: the prefetch only knows the
+suggestion, so a request that adds a manual, operating hours, a start date
+etc. generates its own plan.
+DELETE /api/plan-prefetch/{prefetch_id} drops a rejected suggestion's plan.
+
+Speculative work must never slow down interactive requests:
+- at most PLAN_PREFETCH_CONCURRENCY generations run at a time
+- their Gemini calls run at background priority (see llm_gateway), so they
+  only take a slot when no interactive call is waiting
+- a claim for a plan still waiting for its prefetch slot generates the plan
+  itself; a claim that waits on a running one promotes its Gemini calls to
+  interactive priority
+- unclaimed results expire after PLAN_PREFETCH_SECONDS
+
+The generator is registered by main, which owns the plan prompt, with the
+function that says which fields of a plan its result depends on:
+
+    plan_prefetch.register(lambda plan: generate_plan_tasks(PlanData(**plan)), key=plan_key)
+    ids = plan_prefetch.submit(user.id, [plan, ...])
+    tasks = await plan_prefetch.claim(ids[0], user.id, requested_plan)
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+PLAN_PREFETCH_TOP_K = int(os.getenv("PLAN_PREFETCH_TOP_K", "3"))
+PLAN_PREFETCH_CONCURRENCY = int(os.getenv("PLAN_PREFETCH_CONCURRENCY", "2"))
+PLAN_PREFETCH_SECONDS = float(os.getenv("PLAN_PREFETCH_SECONDS", "900"))
+PLAN_PREFETCH_MAX_ENTRIES = int(os.getenv("PLAN_PREFETCH_MAX_ENTRIES", "200"))
+
+PlanGenerator = Callable[[Dict[str, Any]], Awaitable[List[Dict[str, Any]]]]
+PlanKey = Callable[[Dict[str, Any]], Any]
+
+@dataclass
+class _Prefetch:
+    id: str
+    user_id: str
+    name: str
+    plan: Dict[str, Any]
+    task: "asyncio.Task"
+    created_at: float = field(default_factory=time.monotonic)
+    # The generation's Gemini calls, once it has a prefetch slot
+    work: Optional[llm_gateway.BackgroundWork] = None
+
+    @property
+    def started(self) -> bool:
+        """True once the generation has held a Gemini slot"""
+        return self.work is not None and self.work.started
+
+class PlanPrefetcher:
+    def __init__(self, concurrency: int = PLAN_PREFETCH_CONCURRENCY, ttl: float = PLAN_PREFETCH_SECONDS,
+                 maxsize: int = PLAN_PREFETCH_MAX_ENTRIES):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._generator: Optional[PlanGenerator] = None
+        self._key: Optional[PlanKey] = None
+        self._entries: "OrderedDict[str, _Prefetch]" = OrderedDict()
+        self._stats = {"submitted": 0, "claimed": 0, "waited": 0, "misses": 0, "mismatched": 0,
+                       "cancelled": 0, "expired": 0, "failed": 0}
+
+    def register(self, generator: PlanGenerator, key: Optional[PlanKey] = None) -> None:
+        self._generator = generator
+        self._key = key
+
+    @property
+    def enabled(self) -> bool:
+        return self._generator is not None and self._concurrency > 0
+
+    def submit(self, user_id: str, plans: List[Dict[str, Any]]) -> List[str]:
+        """Start background generation of each plan; returns one prefetch id per plan"""
+        if not self.enabled:
+            return []
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        self._purge()
+        ids = []
+        for plan in plans:
+            prefetch_id = uuid.uuid4().hex
+            entry = _Prefetch(prefetch_id, user_id, plan.get("name") or "", dict(plan), task=None)
+            entry.task = asyncio.create_task(self._run(entry, plan))
+            self._entries[prefetch_id] = entry
+            ids.append(prefetch_id)
+        while len(self._entries) > self.maxsize:
+            _, oldest = self._entries.popitem(last=False)
+            self._drop(oldest, "expired")
+        self._stats["submitted"] += len(ids)
+        logger.info(f"🔮 Prefetching {len(ids)} child-asset plans for user {user_id}")
+        return ids
+
+    async def _run(self, entry: _Prefetch, plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+        async with self._semaphore:
+            start = time.perf_counter()
+            with llm_gateway.background_priority() as work:
+                entry.work = work
+                tasks = await self._generator(plan)
+            logger.info(f"🔮 Prefetched plan for {entry.name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+            return tasks
+
+    async def claim(self, prefetch_id: str, user_id: str,
+                    plan: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        The prefetched tasks, waiting for them if the generation is running.
+        None if there is nothing usable: unknown, expired, failed, still
+        waiting for a prefetch slot or prefetched for a different plan than
+        the one requested (the caller then generates the plan itself).
+        """
+        self._purge()
+        entry = self._entries.get(prefetch_id)
+        if entry is None or entry.user_id != user_id:
+            self._stats["misses"] += 1
+            return None
+        del self._entries[prefetch_id]
+
+        if plan is not None and self._key is not None and self._key(plan) != self._key(entry.plan):
+            logger.info(f"🔮 Request for {entry.name} differs from its prefetched plan, generating again")
+            self._drop(entry, "mismatched")
+            return None
+
+        if not entry.task.done():
+            if entry.work is None:
+                # Still waiting for a prefetch slot; an interactive call shouldn't queue behind it
+                entry.task.cancel()
+                self._stats["misses"] += 1
+                return None
+            # An interactive request waits on it now, so its Gemini calls stop yielding
+            entry.work.promote()
+            self._stats["waited"] += 1
+        try:
+            tasks = await asyncio.shield(entry.task)
+        except asyncio.CancelledError:
+            if not entry.task.cancelled():
+                raise
+            self._stats["misses"] += 1
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Prefetched plan for {entry.name} failed, generating again: {e}")
+            self._stats["failed"] += 1
+            return None
+        self._stats["claimed"] += 1
+        return tasks
+
+    def cancel(self, prefetch_id: str, user_id: str) -> bool:
+        """Drop a prefetch (e.g. the suggestion was rejected); False if unknown"""
+        entry = self._entries.get(prefetch_id)
+        if entry is None or entry.user_id != user_id:
+            return False
+        del self._entries[prefetch_id]
+        self._drop(entry, "cancelled")
+        return True
+
+    def _drop(self, entry: _Prefetch, reason: str) -> None:
+        if not entry.task.done():
+            entry.task.cancel()
+        elif not entry.task.cancelled() and entry.task.exception() is not None:
+            self._stats["failed"] += 1
+        self._stats[reason] += 1
+
+    def _purge(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry.created_at > cutoff:
+                break
+            self._entries.popitem(last=False)
+            self._drop(entry, "expired")
+
+    async def stop(self) -> None:
+        tasks = [entry.task for entry in self._entries.values() if not entry.task.done()]
+        self._entries.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        self._purge()
+        running = sum(1 for e in self._entries.values() if e.started and not e.task.done())
+        return {
+            "enabled": self.enabled,
+            "top_k": PLAN_PREFETCH_TOP_K,
+            "concurrency": self._concurrency,
+            "ttl_seconds": self.ttl,
+            "entries": len(self._entries),
+            "running": running,
+            "queued": sum(1 for e in self._entries.values() if not e.started and not e.task.done()),
+            **self._stats,
+        }
+
+prefetcher = PlanPrefetcher()
+
+def register(generator: PlanGenerator, key: Optional[PlanKey] = None) -> None:
+    prefetcher.register(generator, key)
+
+def submit(user_id: str, plans: List[Dict[str, Any]]) -> List[str]:
+    return prefetcher.submit(user_id, plans)
+
+async def claim(prefetch_id: str, user_id: str, plan: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+    return await prefetcher.claim(prefetch_id, user_id, plan)
+
+def cancel(prefetch_id: str, user_id: str) -> bool:
+    return prefetcher.cancel(prefetch_id, user_id)
+
+async def stop() -> None:
+    await prefetcher.stop()
+
+def get_prefetch_stats() -> Dict[str, Any]:
+    return prefetcher.stats()
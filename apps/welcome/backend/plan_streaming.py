@@ -0,0 +1,112 @@
+"""
+Server-Sent Events for streamed PM plan generation.
+
+The streaming endpoints emit:
+
+    event: task   one validated task object, as soon as Gemini has finished writing it
+    event: done   {"result": <body of the non-streaming endpoint>, "task_count",
+                   "dropped_tasks", "first_task_ms", "total_ms", "cached"}
+    event: error  {"detail": "..."} (the stream ends after it)
+
+Results go through the same AI response cache as the non-streaming
+endpoints, so a cached plan is replayed immediately.
+"""
+import json
+import time
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi.responses import StreamingResponse
+
+import ai_cache
+import llm_gateway
+from llm_json import IncrementalTaskParser, TaskParseResult, extract_tasks, task_problem
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # don't let nginx buffer the stream
+}
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def stream_plan_events(
+    *,
+    name: str,
+    prompt: str,
+    model: str,
+    cache_key: str,
+    to_cache_value: Callable[[TaskParseResult], Any],
+    tasks_of: Callable[[Any], List[Dict[str, Any]]],
+    build_result: Callable[[Any], Dict[str, Any]],
+    prepare_task: Callable[[Dict[str, Any]], Dict[str, Any]] = lambda task: task,
+    array_key: str = "maintenance_plan",
+    generation_config: Any = None,
+    system_instruction: Optional[str] = None,
+    bypass_cache: bool = False,
+) -> AsyncIterator[str]:
+    """
+    to_cache_value: salvaged model output -> value stored in the AI response cache
+    tasks_of:       cached value -> its task list (replayed as task events on a hit)
+    build_result:   cached value -> response body of the non-streaming endpoint
+    prepare_task:   per-request additions to each task before it is sent
+    """
+    started = time.perf_counter()
+    first_task_ms = None
+    sent = 0
+
+    def done(value: Any, cached: bool, dropped: Optional[List[Dict[str, Any]]] = None) -> str:
+        return sse_event("done", {
+            "result": build_result(value),
+            "task_count": len(tasks_of(value)),
+            "dropped_tasks": dropped or [],
+            "first_task_ms": first_task_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000),
+            "cached": cached,
+        })
+
+    try:
+        cached = None if bypass_cache else await ai_cache.get_cached(cache_key)
+        if cached is not None:
+            logger.info(f"🗃️ {name}: replaying cached plan")
+            first_task_ms = 0
+            for task in tasks_of(cached):
+                if task_problem(task) is None:
+                    yield sse_event("task", prepare_task(dict(task)))
+            yield done(cached, cached=True)
+            return
+
+        parser = IncrementalTaskParser(array_key)
+        async for chunk in llm_gateway.stream(
+            prompt, model=model, generation_config=generation_config, system_instruction=system_instruction
+        ):
+            for task in parser.feed(chunk):
+                if first_task_ms is None:
+                    first_task_ms = round((time.perf_counter() - started) * 1000)
+                    logger.info(f"🧠 {name}: first task after {first_task_ms} ms")
+                sent += 1
+                yield sse_event("task", prepare_task(task))
+
+        # The streamed tasks were already salvaged one by one; parse the whole
+        # response once more for the non-task parts of the result
+        result = extract_tasks(parser.text, array_key)
+        if not result.tasks and result.document is None:
+            logger.error(f"❌ {name}: nothing salvageable in the response")
+            logger.error(f"Raw content (first 600 chars): {parser.text[:600]}...")
+            yield sse_event("error", {"detail": "AI returned invalid JSON format"})
+            return
+        if result.dropped:
+            logger.warning(f"⚠️ {name}: dropped {len(result.dropped)} malformed tasks ({', '.join(d.reason for d in result.dropped)})")
+
+        value = to_cache_value(result)
+        await ai_cache.store(cache_key, value)
+        logger.info(f"✅ {name}: streamed {sent} tasks in {(time.perf_counter() - started) * 1000:.0f} ms")
+        yield done(value, cached=False, dropped=[d.to_dict() for d in result.dropped])
+    except Exception as e:
+        logger.error(f"🧠 {name}: Gemini streaming error: {e}")
+        yield sse_event("error", {"detail": "Gemini API error"})
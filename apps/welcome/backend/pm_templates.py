@@ -0,0 +1,419 @@
+"""
+Rule-based PM plan templates built from historical pm_tasks.
+
+Common equipment (motors, pumps, compressors, conveyors, ...) gets nearly
+the same tasks from Gemini every time. The library groups every historical
+task by its plan's category (matched to dim_assets where possible), merges
+tasks with the same name across plans, and keeps the most common ones as
+templates with the original asset's name and model replaced by
+placeholders. instantiate() turns a category's templates into a complete
+plan in milliseconds, adjusting intervals for harsh environments and
+high-hour assets, and schedules each task over the 12 months from the
+plan start date like the AI plan does.
+
+The library is built at startup (see main.lifespan) from the pm_tasks
+table, or from the database export in database_exports/ when the table
+can't be read, and again via POST /api/admin/pm-templates/refresh.
+"""
+import os
+import re
+import glob
+import json
+import time
+import asyncio
+import logging
+import calendar
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import manual_sections
+import reference_data
+from repositories import PMTasksRepository
+
+logger = logging.getLogger(__name__)
+
+PM_TEMPLATE_MIN_TASKS = int(os.getenv("PM_TEMPLATE_MIN_TASKS", "3"))
+PM_TEMPLATE_MAX_TASKS = int(os.getenv("PM_TEMPLATE_MAX_TASKS", "12"))
+# Cumulative operating hours above which wear tasks come round sooner
+PM_TEMPLATE_HIGH_HOURS = float(os.getenv("PM_TEMPLATE_HIGH_HOURS", "20000"))
+# Hour-based intervals are scheduled as if the asset ran this many hours a week
+PM_TEMPLATE_HOURS_PER_WEEK = float(os.getenv("PM_TEMPLATE_HOURS_PER_WEEK", "40"))
+PM_TEMPLATE_EXPORT_DIR = os.getenv(
+    "PM_TEMPLATE_EXPORT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "database_exports"),
+)
+
+TASK_COLUMNS = (
+    "id, task_name, maintenance_interval, instructions, reason, engineering_rationale, safety_precautions, "
+    "common_failures_prevented, tools_needed, est_minutes, no_techs_needed, consumables, "
+    "pm_plans!inner(id, eq_category, asset_name, asset_model)"
+)
+TEXT_FIELDS = (
+    "task_name", "reason", "engineering_rationale", "safety_precautions", "common_failures_prevented",
+    "tools_needed", "consumables",
+)
+IGNORED_CATEGORIES = {"", "other", "test", "none", "n/a"}
+NAME_STOPWORDS = {"and", "the", "of", "for", "if", "applicable", "a", "an", "to", "or"}
+
+# Calendar intervals, shortest first, in weeks
+INTERVALS: List[Tuple[str, float]] = [
+    ("Daily", 1 / 7), ("Weekly", 1), ("Bi-Weekly", 2), ("Monthly", 4.33),
+    ("Quarterly", 13), ("Semi-Annually", 26), ("Annually", 52),
+]
+INTERVAL_ALIASES = {
+    "daily": 1 / 7, "weekly": 1, "bi-weekly": 2, "biweekly": 2, "monthly": 4.33, "quarterly": 13,
+    "semi-annually": 26, "semi-annual": 26, "bi-annually": 26, "annually": 52, "annual": 52, "yearly": 52,
+}
+UNIT_WEEKS = {"day": 1 / 7, "week": 1, "month": 4.33, "year": 52}
+# The calendar or hour part of "1000 hours or 6 months, whichever comes first"
+CALENDAR_PART = re.compile(
+    r"\b(?:(\d+(?:\.\d+)?)\s*(day|week|month|year)s?|(" + "|".join(sorted(INTERVAL_ALIASES, key=len, reverse=True)) + r"))\b",
+    re.I,
+)
+HOURS_PART = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(?:operating\s+|run\s+)?hours?\b", re.I)
+
+HARSH_ENVIRONMENT = re.compile(
+    r"\b(?:dust\w*|dirt\w*|outdoor\w*|humid\w*|wet|moist\w*|corros\w*|marine|coastal|salt\w*|hot|heat|"
+    r"high[- ]temperature|washdown|chemical\w*|abrasive|mining|foundry)\b", re.I,
+)
+# Tasks whose interval depends on contamination and wear
+WEAR_TASK = re.compile(r"\b(?:inspect\w*|clean\w*|lubric\w*|greas\w*|filter\w*|belt\w*|bearing\w*|oil\w*)\b", re.I)
+
+@dataclass
+class TaskTemplate:
+    fields: Dict[str, Any]
+    interval: str
+    support: int  # number of historical plans with this task
+
+@dataclass
+class TemplateLibrary:
+    categories: Dict[str, List[TaskTemplate]]
+    names: Dict[str, str]  # normalized category -> display name
+    source: str
+    built_at: float
+    task_count: int
+
+def normalize_category(category: Optional[str]) -> str:
+    key = " ".join((category or "").lower().split())
+    return key[:-1] if key.endswith("s") and not key.endswith("ss") else key
+
+def interval_weeks(interval: Optional[str]) -> Optional[float]:
+    """Calendar interval in weeks; None for hour-based or unrecognised intervals"""
+    text = (interval or "").strip().lower()
+    if not text or "hour" in text or "cycle" in text:
+        return None
+    if text in INTERVAL_ALIASES:
+        return INTERVAL_ALIASES[text]
+    match = re.fullmatch(r"(?:every\s+)?(\d+(?:\.\d+)?)?\s*(day|week|month|year)s?", text)
+    if match:
+        return float(match.group(1) or 1) * UNIT_WEEKS[match.group(2)]
+    return None
+
+def interval_label(weeks: float) -> str:
+    for label, length in INTERVALS:
+        if abs(length - weeks) < 0.05:
+            return label
+    months = weeks / 4.33
+    return f"Every {months:.0f} months" if months >= 1 and abs(months - round(months)) < 0.05 else f"Every {weeks:.0f} weeks"
+
+def shorten_interval(interval: str, steps: int) -> str:
+    """Move a calendar interval steps rungs down the Daily..Annually ladder (0 just normalises the label)"""
+    weeks = interval_weeks(interval)
+    if weeks is None:
+        return interval
+    for _ in range(steps):
+        shorter = [length for _, length in INTERVALS if length < weeks - 0.05]
+        if not shorter:
+            break
+        weeks = shorter[-1]
+    return interval_label(weeks)
+
+def schedule_weeks(interval: Optional[str]) -> Optional[float]:
+    """
+    Weeks between occurrences for scheduling: the calendar interval, or the
+    sooner of its calendar and hour parts ("1000 hours or 6 months"), with
+    hours run at PM_TEMPLATE_HOURS_PER_WEEK. None for one-off tasks
+    ("Upon Installation").
+    """
+    weeks = interval_weeks(interval)
+    if weeks is not None:
+        return weeks
+    text = interval or ""
+    candidates = []
+    match = CALENDAR_PART.search(text)
+    if match and match.group(3):
+        candidates.append(INTERVAL_ALIASES[match.group(3).lower()])
+    elif match:
+        candidates.append(float(match.group(1)) * UNIT_WEEKS[match.group(2).lower()])
+    match = HOURS_PART.search(text)
+    if match:
+        candidates.append(max(1 / 7, float(match.group(1).replace(",", "")) / PM_TEMPLATE_HOURS_PER_WEEK))
+    return min(candidates) if candidates else None
+
+def _add_months(start: date, months: int) -> date:
+    month = start.month - 1 + months
+    year = start.year + month // 12
+    month = month % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+def scheduled_dates(interval: Optional[str], start: date) -> List[str]:
+    """YYYY-MM-DD dates of the task in the 12 months from start (monthly and longer on the calendar)"""
+    end = _add_months(start, 12)
+    weeks = schedule_weeks(interval)
+    if weeks is None:
+        return [start.isoformat()]
+    months = weeks / 4.33
+    if months >= 0.95 and abs(months - round(months)) < 0.05:
+        dates = [_add_months(start, k * round(months)) for k in range(12 // round(months) + 1)]
+    else:
+        step = max(1, round(weeks * 7))
+        dates = [start + timedelta(days=k * step) for k in range((end - start).days // step + 1)]
+    return [day.isoformat() for day in dates if day < end]
+
+def _plan_start(value: Optional[str]) -> date:
+    try:
+        return date.fromisoformat((value or "")[:10])
+    except ValueError:
+        return date.today()
+
+def duration_label(value: Any) -> Optional[str]:
+    """Historical est_minutes as the AI plan writes time_to_complete ("45 minutes", "2 hours")"""
+    if value is None or str(value).strip() == "":
+        return None
+    text = str(value).strip()
+    try:
+        minutes = round(float(text))
+    except ValueError:
+        return text  # already "1.5 hours", "30 minutes", ...
+    hours, rest = divmod(minutes, 60)
+    if not hours:
+        return f"{minutes} minutes"
+    label = f"{hours} hour{'s' if hours != 1 else ''}"
+    return f"{label} {rest} minutes" if rest else label
+
+def _name_key(task_name: str, asset_name: Optional[str]) -> Tuple[str, ...]:
+    """Task name as a set of stems, without the asset's own name ("Chiller 3 – Oil Change")"""
+    if asset_name and asset_name.strip():
+        task_name = re.sub(re.escape(asset_name.strip()), " ", task_name, flags=re.I)
+    return tuple(sorted({
+        word for word in manual_sections.tokenize(task_name)
+        if word not in NAME_STOPWORDS and not word.isdigit()
+    }))
+
+def _parameterize(value: Any, asset_name: Optional[str], asset_model: Optional[str]) -> Any:
+    """Replace the historical asset's name and model with placeholders"""
+    if isinstance(value, list):
+        return [_parameterize(item, asset_name, asset_model) for item in value]
+    if not isinstance(value, str):
+        return value
+    for placeholder, original in (("{asset_name}", asset_name), ("{asset_model}", asset_model)):
+        if original and len(original.strip()) >= 3:
+            value = re.sub(re.escape(original.strip()), placeholder, value, flags=re.I)
+    return value
+
+def build_library(rows: Iterable[Dict[str, Any]], categories: Optional[Dict[str, str]] = None, source: str = "") -> TemplateLibrary:
+    """
+    rows are pm_tasks rows with their plan under "pm_plans" (eq_category,
+    asset_name, asset_model). categories (lower-cased name -> name, from
+    dim_assets) canonicalises category names when given.
+    """
+    known = {normalize_category(key): name for key, name in (categories or {}).items()}
+    grouped: Dict[str, Dict[Tuple[str, ...], List[Dict[str, Any]]]] = defaultdict(lambda: defaultdict(list))
+    names: Dict[str, Counter] = defaultdict(Counter)
+    task_count = 0
+    for row in rows:
+        plan = row.get("pm_plans") or {}
+        raw_category = (plan.get("eq_category") or "").strip()
+        key = normalize_category(raw_category)
+        if key in IGNORED_CATEGORIES or not row.get("task_name"):
+            continue
+        grouped[key][_name_key(row["task_name"], plan.get("asset_name"))].append(row)
+        names[key][known.get(key, raw_category)] += 1
+        task_count += 1
+
+    library: Dict[str, List[TaskTemplate]] = {}
+    for key, clusters in grouped.items():
+        templates = []
+        for cluster in clusters.values():
+            # The most detailed version of the task stands for the cluster
+            best = max(cluster, key=lambda r: (len(r.get("instructions") or []), len(r.get("reason") or "")))
+            plan = best.get("pm_plans") or {}
+            intervals = Counter(r.get("maintenance_interval") for r in cluster if r.get("maintenance_interval"))
+            fields = {
+                name: _parameterize(best.get(name), plan.get("asset_name"), plan.get("asset_model"))
+                for name in TEXT_FIELDS + ("instructions",)
+            }
+            durations = [best.get("est_minutes")] + [r.get("est_minutes") for r in cluster]
+            fields["time_to_complete"] = next(
+                (label for label in map(duration_label, durations) if label), "Not specified"
+            )
+            fields["number_of_technicians"] = int(best.get("no_techs_needed") or 1)
+            templates.append(TaskTemplate(
+                fields=fields,
+                interval=intervals.most_common(1)[0][0] if intervals else "Annually",
+                support=len({r["pm_plans"].get("id") for r in cluster}),
+            ))
+        templates.sort(key=lambda t: (-t.support, interval_weeks(t.interval) or 0))
+        if len(templates) >= PM_TEMPLATE_MIN_TASKS:
+            library[key] = templates[:PM_TEMPLATE_MAX_TASKS]
+    return TemplateLibrary(
+        categories=library,
+        names={key: names[key].most_common(1)[0][0] for key in library},
+        source=source,
+        built_at=time.time(),
+        task_count=task_count,
+    )
+
+def _fill(value: Any, asset_name: str, asset_model: str) -> Any:
+    if isinstance(value, list):
+        return [_fill(item, asset_name, asset_model) for item in value]
+    if isinstance(value, str):
+        return value.replace("{asset_name}", asset_name).replace("{asset_model}", asset_model)
+    return value
+
+def _hours(value: Optional[str]) -> float:
+    try:
+        return float(str(value or "0").replace(",", ""))
+    except ValueError:
+        return 0.0
+
+def instantiate(
+    library: Optional[TemplateLibrary],
+    category: str,
+    asset_name: str,
+    asset_model: Optional[str] = None,
+    environment: Optional[str] = None,
+    hours: Optional[str] = None,
+    date_of_plan_start: Optional[str] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """A full task list for the category, or None if there is no template for it"""
+    if library is None:
+        return None
+    key = normalize_category(category)
+    templates = library.categories.get(key)
+    if not templates:
+        return None
+
+    harsh = bool(environment and HARSH_ENVIRONMENT.search(environment))
+    high_hours = _hours(hours) >= PM_TEMPLATE_HIGH_HOURS
+    model = asset_model or asset_name
+    start = _plan_start(date_of_plan_start)
+    tasks = []
+    for template in templates:
+        task = {name: _fill(value, asset_name, model) for name, value in template.fields.items()}
+        wear = bool(WEAR_TASK.search(f"{task.get('task_name')} {' '.join(task.get('instructions') or [])}"))
+        reasons = []
+        if wear and harsh:
+            reasons.append(f"the {environment.strip()} environment")
+        if wear and high_hours:
+            reasons.append(f"a high-hour asset ({_hours(hours):,.0f} h)")
+        interval = shorten_interval(template.interval, len(reasons))
+        task["maintenance_interval"] = interval
+        task["scheduled_dates"] = scheduled_dates(interval, start)
+        insight = f"Standard {library.names[key]} task, used in {template.support} earlier plan{'s' if template.support != 1 else ''}"
+        if reasons and interval != shorten_interval(template.interval, 0):
+            insight += f"; interval shortened for {' and '.join(reasons)}"
+        task["usage_insights"] = insight + "."
+        tasks.append(task)
+    return tasks
+
+_library: Optional[TemplateLibrary] = None
+_build_task: Optional[asyncio.Task] = None
+_stats = {"served": 0, "misses": 0}
+
+def _latest_export(kind: str) -> Optional[str]:
+    files = sorted(glob.glob(os.path.join(PM_TEMPLATE_EXPORT_DIR, f"{kind}_data_*.json")))
+    return files[-1] if files else None
+
+def load_export_rows() -> List[Dict[str, Any]]:
+    """pm_tasks rows from the newest database export, with their plans embedded"""
+    tasks_path, plans_path = _latest_export("pm_tasks"), _latest_export("pm_plans")
+    if not tasks_path or not plans_path:
+        return []
+    with open(plans_path) as f:
+        plans = {plan["id"]: plan for plan in json.load(f)}
+    with open(tasks_path) as f:
+        rows = json.load(f)
+    return [{**row, "pm_plans": plans.get(row.get("pm_plan_id"))} for row in rows]
+
+async def _load_table_rows() -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    async for page in PMTasksRepository().iter_pages(TASK_COLUMNS):
+        rows.extend(page)
+    return rows
+
+async def rebuild() -> TemplateLibrary:
+    """Build the library from pm_tasks, or the export if the table can't be read"""
+    global _library
+    try:
+        categories = await reference_data.get_asset_categories()
+    except Exception as e:
+        logger.warning(f"⚠️ dim_assets unavailable for PM templates: {e}")
+        categories = {}
+
+    rows, source = [], "pm_tasks"
+    if os.getenv("SUPABASE_URL"):
+        try:
+            rows = await _load_table_rows()
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to read pm_tasks for PM templates: {e}")
+    if not rows:
+        rows, source = await asyncio.to_thread(load_export_rows), "export"
+
+    library = await asyncio.to_thread(build_library, rows, categories, source)
+    _library = library
+    logger.info(
+        f"📚 PM template library built from {source}: {len(library.categories)} categories, "
+        f"{library.task_count} historical tasks"
+    )
+    return library
+
+def get_library() -> Optional[TemplateLibrary]:
+    return _library
+
+def template_plan(
+    category: str,
+    asset_name: str,
+    asset_model: Optional[str] = None,
+    environment: Optional[str] = None,
+    hours: Optional[str] = None,
+    date_of_plan_start: Optional[str] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """instantiate() against the current library, counted in the stats"""
+    tasks = instantiate(_library, category, asset_name, asset_model, environment, hours, date_of_plan_start)
+    _stats["served" if tasks is not None else "misses"] += 1
+    return tasks
+
+async def _build_in_background() -> None:
+    try:
+        await rebuild()
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to build PM template library: {e}")
+
+def start() -> None:
+    """Build the library in the background (called from the app lifespan)"""
+    global _build_task
+    if _build_task is None:
+        _build_task = asyncio.create_task(_build_in_background())
+
+async def stop() -> None:
+    global _build_task
+    if _build_task is not None:
+        _build_task.cancel()
+        try:
+            await _build_task
+        except asyncio.CancelledError:
+            pass
+        _build_task = None
+
+def get_template_stats() -> Dict[str, Any]:
+    library = _library
+    return {
+        "categories": sorted(library.names.values()) if library else [],
+        "source": library.source if library else None,
+        "built_at": library.built_at if library else None,
+        "historical_tasks": library.task_count if library else 0,
+        **_stats,
+    }
@@ -0,0 +1,137 @@
+"""
+Read-through cache for reference tables that almost never change:
+dim_assets (asset categories), roles, sites with their company, and the
+manufacturer names recorded on parent_assets and child_assets.
+
+Entries are keyed by a per-table version, so invalidate_reference_data()
+drops a whole table at once by bumping its version. The cache is warmed in
+the background at startup (see main.lifespan), after which hot paths need
+no database round trips for this data.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from cache import TTLCache, SingleFlight
+from repositories import (
+    ChildAssetsRepository, DimAssetsRepository, ParentAssetsRepository, RolesRepository, SitesRepository
+)
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_CACHE_SECONDS = float(os.getenv("REFERENCE_CACHE_SECONDS", "600"))
+REFERENCE_CACHE_SIZE = int(os.getenv("REFERENCE_CACHE_SIZE", "4096"))
+
+TABLES = ("dim_assets", "roles", "sites", "manufacturers")
+SITE_COLUMNS = "*, companies(*)"
+
+_reference_cache = TTLCache(maxsize=REFERENCE_CACHE_SIZE, ttl=REFERENCE_CACHE_SECONDS)
+_reference_loads = SingleFlight()
+_versions: Dict[str, int] = {table: 0 for table in TABLES}
+_warmup_task: Optional[asyncio.Task] = None
+
+async def _read_through(table: str, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+    version = _versions[table]
+    value = _reference_cache.get((table, version, key))
+    if value is not None:
+        return value
+
+    async def load() -> Any:
+        loaded = await loader()
+        # Skip caching if the table was invalidated while we were loading
+        if loaded is not None and _versions[table] == version:
+            _reference_cache.set((table, version, key), loaded)
+        return loaded
+
+    return await _reference_loads.do((table, version, key), load)
+
+async def _load_asset_categories() -> Dict[str, str]:
+    rows = await DimAssetsRepository().list_asset_names()
+    return {row["asset_name"].lower(): row["asset_name"] for row in rows if row.get("asset_name")}
+
+async def _load_roles() -> Dict[str, Dict[str, Any]]:
+    rows = await RolesRepository().select("id, name")
+    return {row["name"]: row for row in rows}
+
+async def _load_manufacturers() -> Dict[str, str]:
+    # Most common spelling wins when a make is entered with different casing
+    counts: Dict[str, Dict[str, int]] = {}
+    for repository in (ParentAssetsRepository(), ChildAssetsRepository()):
+        async for page in repository.iter_pages("id, make", where=lambda query: query.neq("make", "")):
+            for row in page:
+                make = (row.get("make") or "").strip()
+                if make:
+                    spellings = counts.setdefault(make.lower(), {})
+                    spellings[make] = spellings.get(make, 0) + 1
+    return {key: max(spellings, key=spellings.get) for key, spellings in counts.items()}
+
+async def get_asset_categories() -> Dict[str, str]:
+    """Asset categories from dim_assets, lower-cased name -> name"""
+    return await _read_through("dim_assets", "all", _load_asset_categories)
+
+async def get_role(name: str) -> Optional[Dict[str, Any]]:
+    """Role row ({"id", "name"}) by name"""
+    roles = await _read_through("roles", "all", _load_roles)
+    return roles.get(name)
+
+async def get_site(site_id: str) -> Optional[Dict[str, Any]]:
+    """Site row with its company embedded under "companies"; None if it doesn't exist"""
+    return await _read_through(
+        "sites", site_id, lambda: SitesRepository().get(site_id, SITE_COLUMNS)
+    )
+
+async def get_manufacturers() -> Dict[str, str]:
+    """Makes entered on parent and child assets, lower-cased name -> name"""
+    return await _read_through("manufacturers", "all", _load_manufacturers)
+
+def invalidate_reference_data(table: Optional[str] = None) -> None:
+    """Drop cached reference data for one table (or all of them) after it changes"""
+    for name in ([table] if table else TABLES):
+        if name not in _versions:
+            raise ValueError(f"Unknown reference table: {name}")
+        _versions[name] += 1
+    logger.info(f"📚 Reference data invalidated: {table or 'all tables'}")
+
+async def warm_reference_data() -> None:
+    """Load every reference table so the first requests hit the cache"""
+    try:
+        categories = await get_asset_categories()
+        roles = await _read_through("roles", "all", _load_roles)
+        manufacturers = await get_manufacturers()
+
+        version = _versions["sites"]
+        site_count = 0
+        async for page in SitesRepository().iter_pages(SITE_COLUMNS):
+            if _versions["sites"] != version:
+                break
+            for site in page:
+                _reference_cache.set(("sites", version, site["id"]), site)
+            site_count += len(page)
+
+        logger.info(
+            f"📚 Reference data warmed: {len(categories)} asset categories, {len(roles)} roles, "
+            f"{len(manufacturers)} manufacturers, {site_count} sites"
+        )
+    except Exception as e:
+        # Reads fall through to the database until the cache fills
+        logger.warning(f"⚠️ Failed to warm reference data: {e}")
+
+def start() -> None:
+    """Warm the cache in the background (called from the app lifespan)"""
+    global _warmup_task
+    if _warmup_task is None and os.getenv("SUPABASE_URL"):
+        _warmup_task = asyncio.create_task(warm_reference_data())
+
+async def stop() -> None:
+    global _warmup_task
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+        try:
+            await _warmup_task
+        except asyncio.CancelledError:
+            pass
+        _warmup_task = None
+
+def get_reference_cache_stats() -> Dict[str, Any]:
+    return {**_reference_cache.stats(), "versions": dict(_versions)}
@@ -0,0 +1,414 @@
+"""
+Async repositories for the Supabase tables the API reads and writes.
+
+Each repository builds its PostgREST query with the (synchronous)
+supabase-py client and awaits it on the database executor, so handlers
+never block the event loop on a round trip. Repositories default to the
+shared service-role client; pass a user-scoped client from
+get_user_supabase_client() where RLS must apply.
+
+Multi-table writes go through Postgres functions (see
+apps/welcome/supabase/migrations) so they commit or roll back together in
+a single round trip.
+
+Large reads are keyset-paginated: page() returns one page plus an opaque
+cursor for the next one, and iter_pages() streams pages as an async
+generator so callers never hold a whole table in memory.
+"""
+import os
+import re
+import json
+import uuid
+import base64
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from database import execute_query, get_service_supabase_client
+
+Row = Dict[str, Any]
+Page = Tuple[List[Row], Optional[str]]
+
+DB_PAGE_SIZE = int(os.getenv("DB_PAGE_SIZE", "200"))
+DB_MAX_PAGE_SIZE = int(os.getenv("DB_MAX_PAGE_SIZE", "1000"))
+
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[T ][\d:.]+(?:Z|[+-]\d{2}:?\d{2})?)?$")
+
+def encode_cursor(position: Row) -> str:
+    """Opaque cursor for the keyset position after a row"""
+    return base64.urlsafe_b64encode(json.dumps(position, default=str).encode()).decode()
+
+def _cursor_id(value: Any) -> Any:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return str(uuid.UUID(value))
+
+def _cursor_value(value: Any) -> Any:
+    """Keyset values are NULL, numbers or ISO dates/timestamps"""
+    if value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)):
+        return value
+    if isinstance(value, str) and ISO_DATE.match(value):
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return value
+    raise ValueError
+
+def decode_cursor(cursor: str) -> Row:
+    """
+    Cursor values end up in a PostgREST filter string, so anything that
+    isn't an id or a plain keyset value is rejected (ValueError).
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(position, dict) or "id" not in position:
+            raise ValueError
+        return {
+            key: _cursor_id(value) if key == "id" else _cursor_value(value)
+            for key, value in position.items()
+        }
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Invalid pagination cursor")
+
+def _keyset_filter(order_by: str, position: Row) -> str:
+    """
+    PostgREST or= filter selecting rows after position in (order_by, id)
+    ascending order. NULLs sort last, so they come after every value.
+    """
+    last_id = position["id"]
+    value = position.get(order_by)
+    if value is None:
+        return f"and({order_by}.is.null,id.gt.{last_id})"
+    return f"{order_by}.gt.{value},{order_by}.is.null,and({order_by}.eq.{value},id.gt.{last_id})"
+
+class Repository:
+    """Base repository for a single table"""
+    table: str = ""
+
+    def __init__(self, client: Any = None):
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        return self._client if self._client is not None else get_service_supabase_client()
+
+    def query(self):
+        return self.client.table(self.table)
+
+    async def select(self, columns: str = "*", **filters: Any) -> List[Row]:
+        """Rows matching equality filters"""
+        query = self.query().select(columns)
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        result = await execute_query(query)
+        return result.data or []
+
+    async def first(self, columns: str = "*", **filters: Any) -> Optional[Row]:
+        """First row matching equality filters, or None"""
+        query = self.query().select(columns)
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        result = await execute_query(query.limit(1))
+        return result.data[0] if result.data else None
+
+    async def insert(self, rows: Any) -> List[Row]:
+        """Insert one row (dict) or many (list) and return what PostgREST sends back"""
+        result = await execute_query(self.query().insert(rows))
+        return result.data or []
+
+    async def insert_one(self, row: Row) -> Optional[Row]:
+        rows = await self.insert(row)
+        return rows[0] if rows else None
+
+    async def update(self, values: Row, **filters: Any) -> List[Row]:
+        """Update rows matching equality filters and return the updated rows"""
+        query = self.query().update(values)
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        result = await execute_query(query)
+        return result.data or []
+
+    async def rpc(self, fn: str, params: Row) -> Any:
+        """Call a Postgres function and return its result"""
+        result = await execute_query(self.client.rpc(fn, params))
+        return result.data
+
+    async def page(
+        self,
+        columns: str,
+        *,
+        order_by: str = "id",
+        after: Optional[str] = None,
+        limit: int = DB_PAGE_SIZE,
+        where: Optional[Callable[[Any], Any]] = None
+    ) -> Page:
+        """
+        One keyset page ordered by (order_by, id). where() applies filters to
+        the query. Returns (rows, next_cursor); next_cursor is None on the
+        last page. columns must include id and order_by.
+        """
+        limit = max(1, min(limit, DB_MAX_PAGE_SIZE))
+        query = self.query().select(columns)
+        if where is not None:
+            query = where(query)
+        if after:
+            position = decode_cursor(after)
+            if order_by == "id":
+                query = query.gt("id", position["id"])
+            else:
+                query = query.or_(_keyset_filter(order_by, position))
+        if order_by != "id":
+            query = query.order(order_by, nullsfirst=False)
+        query = query.order("id").limit(limit)
+
+        result = await execute_query(query)
+        rows = result.data or []
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = encode_cursor({order_by: last.get(order_by), "id": last["id"]})
+        return rows, next_cursor
+
+    async def iter_pages(
+        self,
+        columns: str,
+        *,
+        order_by: str = "id",
+        page_size: int = DB_PAGE_SIZE,
+        where: Optional[Callable[[Any], Any]] = None
+    ) -> AsyncIterator[List[Row]]:
+        """Stream every matching row, one keyset page at a time"""
+        cursor = None
+        while True:
+            rows, cursor = await self.page(
+                columns, order_by=order_by, after=cursor, limit=page_size, where=where
+            )
+            if rows:
+                yield rows
+            if not cursor:
+                return
+
+class UsersRepository(Repository):
+    table = "users"
+
+    async def find_by_email(self, email: str, columns: str = "*") -> Optional[Row]:
+        return await self.first(columns, email=email)
+
+class SitesRepository(Repository):
+    table = "sites"
+
+    async def get(self, site_id: str, columns: str = "*") -> Optional[Row]:
+        return await self.first(columns, id=site_id)
+
+class RolesRepository(Repository):
+    table = "roles"
+
+    async def find_by_name(self, name: str, columns: str = "id") -> Optional[Row]:
+        return await self.first(columns, name=name)
+
+class SiteUsersRepository(Repository):
+    table = "site_users"
+
+    async def find_membership(self, user_id: str, site_id: str, columns: str = "id") -> Optional[Row]:
+        return await self.first(columns, user_id=user_id, site_id=site_id)
+
+class CompanyUsersRepository(Repository):
+    table = "company_users"
+
+class PMLeadsRepository(Repository):
+    table = "pm_leads"
+
+    async def capture_with_plan(
+        self,
+        lead: Row,
+        plan: Row,
+        tasks: List[Row],
+        access_request: Optional[Row] = None
+    ) -> Row:
+        """
+        Insert a lead, its PM plan and tasks, and optionally a pending access
+        request, in one transaction (capture_lead_with_plan). lead_id and
+        pm_plan_id are filled in by the function. Returns {"lead", "plan",
+        "task_count", "access_request"}; access_request is None when not
+        requested or one is already pending for the email.
+        """
+        return await self.rpc("capture_lead_with_plan", {
+            "p_lead": lead,
+            "p_plan": plan,
+            "p_tasks": tasks,
+            "p_access_request": access_request,
+        })
+
+class PMPlansRepository(Repository):
+    table = "pm_plans"
+
+    async def get_with_plan_start(self, plan_id: str) -> Optional[Row]:
+        """Plan joined with its child asset's plan_start_date"""
+        return await self.first("*, child_assets!inner(plan_start_date)", id=plan_id)
+
+class PMTasksRepository(Repository):
+    table = "pm_tasks"
+
+    async def list_for_plan(self, plan_id: str, columns: str = "*") -> List[Row]:
+        return await self.select(columns, pm_plan_id=plan_id)
+
+    async def get_with_plan_start(self, task_id: str) -> Optional[Row]:
+        """Task joined with its plan's child asset plan_start_date"""
+        return await self.first("*, pm_plans!inner(child_assets!inner(plan_start_date))", id=task_id)
+
+class TaskSignoffRepository(Repository):
+    table = "task_signoff"
+
+    # Only what the task view shows, not every column of four joined tables
+    PENDING_COLUMNS = (
+        "id, task_id, due_date, scheduled_date, status, "
+        "pm_tasks!inner(id, task_name, maintenance_interval, criticality, "
+        "pm_plans!inner(id, asset_name, asset_model, "
+        "child_assets!inner(id, name, plan_start_date, "
+        "parent_assets!inner(id, name, site_id))))"
+    )
+    SITE_COLUMN = "pm_tasks.pm_plans.child_assets.parent_assets.site_id"
+
+    async def pending_for_task(self, task_id: str) -> List[Row]:
+        return await self.select("*", task_id=task_id, status="pending")
+
+    async def update_pending(self, task_id: str, values: Row) -> List[Row]:
+        return await self.update(values, task_id=task_id, status="pending")
+
+    def _pending_filter(
+        self,
+        site_ids: Optional[Iterable[str]],
+        due_from: Optional[str],
+        due_to: Optional[str]
+    ) -> Callable[[Any], Any]:
+        def where(query):
+            query = query.eq("status", "pending")
+            if site_ids is not None:
+                query = query.in_(self.SITE_COLUMN, list(site_ids))
+            if due_from:
+                query = query.gte("due_date", due_from)
+            if due_to:
+                query = query.lte("due_date", due_to)
+            return query
+        return where
+
+    async def pending_page(
+        self,
+        site_ids: Optional[Iterable[str]] = None,
+        due_from: Optional[str] = None,
+        due_to: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = DB_PAGE_SIZE
+    ) -> Page:
+        """
+        One page of pending signoffs (with task, plan, child and parent asset),
+        soonest due first, optionally limited to sites and a due-date window
+        """
+        return await self.page(
+            self.PENDING_COLUMNS,
+            order_by="due_date",
+            after=after,
+            limit=limit,
+            where=self._pending_filter(site_ids, due_from, due_to)
+        )
+
+    def iter_pending(
+        self,
+        site_ids: Optional[Iterable[str]] = None,
+        due_from: Optional[str] = None,
+        due_to: Optional[str] = None,
+        page_size: int = DB_PAGE_SIZE
+    ) -> AsyncIterator[List[Row]]:
+        """Stream pending signoffs page by page"""
+        return self.iter_pages(
+            self.PENDING_COLUMNS,
+            order_by="due_date",
+            page_size=page_size,
+            where=self._pending_filter(site_ids, due_from, due_to)
+        )
+
+class AccessRequestsRepository(Repository):
+    table = "access_requests"
+
+    async def find_pending_by_email(self, email: str) -> List[Row]:
+        return await self.select("*", email=email, status="pending")
+
+    async def get_pending(self, request_id: str) -> Optional[Row]:
+        return await self.first("*", id=request_id, status="pending")
+
+    async def approve(
+        self,
+        request_id: str,
+        user_id: str,
+        company_id: str,
+        role_id: str,
+        approved_by: str,
+        notes: Optional[str] = None
+    ) -> Row:
+        """
+        Create the users and company_users rows for an approved request and
+        mark it approved, in one transaction (approve_access_request).
+        Raises if the request is no longer pending.
+        """
+        return await self.rpc("approve_access_request", {
+            "p_request_id": request_id,
+            "p_user_id": user_id,
+            "p_company_id": company_id,
+            "p_role_id": role_id,
+            "p_approved_by": approved_by,
+            "p_notes": notes,
+        })
+
+    async def list_by_status(self, status: Optional[str] = None) -> List[Row]:
+        """Requests, newest first, optionally filtered by status"""
+        query = self.query().select("*").order("requested_at", desc=True)
+        if status:
+            query = query.eq("status", status)
+        result = await execute_query(query)
+        return result.data or []
+
+class AssetsRepository(Repository):
+    table = "assets"
+
+    def iter_assets(
+        self,
+        columns: str,
+        site_id: Optional[str] = None,
+        page_size: int = DB_PAGE_SIZE
+    ) -> AsyncIterator[List[Row]]:
+        """Stream assets page by page, optionally for one site (columns must include id)"""
+        where = (lambda query: query.eq("site_id", site_id)) if site_id else None
+        return self.iter_pages(columns, page_size=page_size, where=where)
+
+class LoadedManualsRepository(Repository):
+    table = "loaded_manuals"
+
+    async def first_for_parent_asset(self, parent_asset_id: str) -> Optional[Row]:
+        return await self.first("file_path,file_type,original_name", parent_asset_id=parent_asset_id)
+
+class ParentAssetsRepository(Repository):
+    table = "parent_assets"
+
+    async def existing_serials(self, site_id: str, serials: Iterable[str]) -> List[Row]:
+        """Parent assets at a site whose serial_number is one of serials"""
+        query = self.query().select("serial_number").eq("site_id", site_id).in_("serial_number", list(serials))
+        result = await execute_query(query)
+        return result.data or []
+
+class ChildAssetsRepository(Repository):
+    table = "child_assets"
+
+class DimAssetsRepository(Repository):
+    table = "dim_assets"
+
+    async def list_asset_names(self) -> List[Row]:
+        return await self.select("asset_name")
+
+class InvitationsRepository(Repository):
+    table = "invitations"
+
+    async def for_email_and_site(self, email: str, site_id: str) -> List[Row]:
+        return await self.select("*", email=email, site_id=site_id)
+
+    async def accepted_for_email(self, email: str, columns: str = "*") -> List[Row]:
+        """Invitations to email that have been accepted"""
+        query = self.query().select(columns).eq("email", email).not_.is_("accepted_at", "null")
+        result = await execute_query(query)
+        return result.data or []
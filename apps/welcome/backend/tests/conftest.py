@@ -0,0 +1,77 @@
+"""
+Shared setup for the backend tests.
+
+Tests call the app through httpx's ASGI transport with authentication
+overridden and Gemini served by llm_gateway's FakeGeminiBackend, so nothing
+leaves the process. The AI response cache and the job store are
+memory-only. Each test runs its scenario with asyncio.run(), so gateway,
+cache and prefetch state is replaced per test rather than shared across
+event loops.
+
+Run from apps/welcome/backend:
+    python -m pytest -q
+"""
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon-key")
+os.environ["AI_CACHE_PATH"] = ""
+os.environ["JOB_STORE_PATH"] = ""
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import main  # noqa: E402
+import ai_cache  # noqa: E402
+import llm_gateway  # noqa: E402
+import plan_prefetch  # noqa: E402
+from auth import verify_supabase_token  # noqa: E402
+
+class FakeUser:
+    id = "test-user"
+    email = "test@example.com"
+
+def plan_json(tasks: int = 3) -> str:
+    return json.dumps({"maintenance_plan": [
+        {
+            "task_name": f"Task {i}",
+            "maintenance_interval": "Monthly",
+            "instructions": [f"Step {step}" for step in range(3)],
+            "reason": "Prevent wear",
+        }
+        for i in range(tasks)
+    ]})
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """A new gateway (on the fake backend), AI cache and prefetcher for every test"""
+    monkeypatch.setattr(llm_gateway, "gateway", llm_gateway.LLMGateway(llm_gateway.FakeGeminiBackend(latency=0)))
+    monkeypatch.setattr(ai_cache, "ai_cache", ai_cache.AIResponseCache(path=""))
+    prefetcher = plan_prefetch.PlanPrefetcher()
+    prefetcher.register(plan_prefetch.prefetcher._generator, plan_prefetch.prefetcher._key)
+    monkeypatch.setattr(plan_prefetch, "prefetcher", prefetcher)
+
+@pytest.fixture
+def app():
+    main.app.dependency_overrides[verify_supabase_token] = lambda: FakeUser()
+    yield main.app
+    main.app.dependency_overrides.pop(verify_supabase_token, None)
+
+@pytest.fixture
+def gemini():
+    """Install a fake Gemini backend: gemini(latency=..., response_text=...) or gemini(backend)"""
+    def install(backend=None, **options):
+        backend = backend or llm_gateway.FakeGeminiBackend(**{"capacity": 64, **options})
+        llm_gateway.gateway._backend = backend
+        return backend
+    return install
+
+@pytest.fixture
+def client(app):
+    """Factory for an async client on the app: `async with client() as c: ...`"""
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=30)
@@ -0,0 +1,81 @@
+"""
+Local make/model/serial/category extraction (asset_details) in front of
+Gemini on /api/extract-asset-details.
+"""
+import json
+import asyncio
+
+import pytest
+
+import asset_details
+import reference_data
+
+MAKES = ["Honda", "Caterpillar", "Trane", "Grundfos", "Atlas Copco", "Cummins", "Various", "Standard"]
+CATEGORIES = ["Generator", "Excavator", "Chiller", "Pump", "Air Compressor", "Diesel Engine"]
+BODY = "Read all safety instructions before operating. Lubricate the bearings every 500 hours. " * 40
+PROSE = "Welcome\n\nThis guide covers the product family. Contact your dealer for service.\n\n" + BODY
+EMPTY_ANSWER = json.dumps({
+    "extracted": {"make": None, "model": None, "serial_number": None, "category": None},
+    "confidence": {"make": 0, "model": 0, "serial_number": 0, "category": 0},
+})
+
+def names(values):
+    return {value.lower(): value for value in values}
+
+def cover(make, category, model, serial):
+    return (f"{make.upper()} {category.upper()}\n{category} Operator's Manual\n\n"
+            f"Manufacturer: {make}\nModel: {model}\nSerial No.: {serial}\n\n") + BODY
+
+@pytest.fixture
+def reference(monkeypatch):
+    async def get_manufacturers():
+        return names(MAKES)
+
+    async def get_asset_categories():
+        return names(CATEGORIES)
+
+    monkeypatch.setattr(reference_data, "get_manufacturers", get_manufacturers)
+    monkeypatch.setattr(reference_data, "get_asset_categories", get_asset_categories)
+    monkeypatch.setattr(asset_details, "_stats", dict.fromkeys(asset_details._stats, 0))
+
+@pytest.mark.parametrize("make, category, model, serial", [
+    ("Honda", "Generator", "EU2200i", "EAMT-1234567"),
+    ("Atlas Copco", "Air Compressor", "GA 37 VSD", "API123456"),
+    ("Grundfos", "Pump", "CR 10-5", "SN000042A"),
+])
+def test_labelled_cover_is_read_locally(make, category, model, serial):
+    local = asset_details.extract_local(cover(make, category, model, serial), names(MAKES), names(CATEGORIES))
+
+    assert local.values == {"make": make, "model": model, "serial_number": serial, "category": category}
+    assert local.fields_needing_llm() == []
+
+def test_prose_only_manual_needs_the_model():
+    local = asset_details.extract_local(PROSE, names(MAKES), names(CATEGORIES))
+
+    assert set(local.fields_needing_llm()) >= {"make", "model"}
+
+def test_generic_words_are_not_taken_as_makes():
+    text = "Standard Pump Manual\n\nUse standard tools only. Various models are covered.\n\n" + BODY
+    local = asset_details.extract_local(text, names(MAKES), names(CATEGORIES))
+
+    assert local.values["make"] not in ("Standard", "Various")
+
+def test_endpoint_skips_gemini_for_labelled_covers(reference, gemini, client):
+    backend = gemini(latency=0, response_text=EMPTY_ANSWER)
+
+    async def scenario():
+        async with client() as c:
+            responses = []
+            for text in (cover("Trane", "Chiller", "CVHF-1000", "L12345678"), PROSE):
+                response = await c.post("/api/extract-asset-details", json={"manual_content": text, "bypass_cache": True})
+                assert response.status_code == 200
+                responses.append(response.json())
+            return responses
+
+    labelled, prose = asyncio.run(scenario())
+
+    assert labelled["extracted"] == {"make": "Trane", "model": "CVHF-1000", "serial_number": "L12345678", "category": "Chiller"}
+    assert min(labelled["confidence"].values()) >= asset_details.LOCAL_EXTRACTION_THRESHOLD
+    assert prose["extracted"]["make"] is None
+    assert backend.calls == 1
+    assert asset_details.get_extraction_stats()["llm_calls"] == 1
@@ -0,0 +1,140 @@
+"""
+Local Supabase JWT verification (auth.authenticate_token).
+"""
+import os
+import json
+import time
+import asyncio
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+import auth
+from cache import TTLCache, SingleFlight
+
+SECRET = "test-jwt-secret-with-at-least-32-bytes"
+KID = "project-key-1"
+
+def rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+PROJECT_KEY = rsa_key()
+
+def claims(**overrides):
+    """Supabase-style claims; an override of None drops the claim"""
+    now = int(time.time())
+    values = {
+        "sub": "user-1", "email": "user@example.com", "role": "authenticated",
+        "aud": "authenticated", "iss": f"{os.environ['SUPABASE_URL']}/auth/v1",
+        "iat": now, "exp": now + 3600, **overrides,
+    }
+    return {name: value for name, value in values.items() if value is not None}
+
+def hs256(secret=SECRET, **overrides):
+    return jwt.encode(claims(**overrides), secret, algorithm="HS256")
+
+def rs256(key=PROJECT_KEY, kid=KID, **overrides):
+    return jwt.encode(claims(**overrides), key, algorithm="RS256", headers={"kid": kid})
+
+@pytest.fixture(autouse=True)
+def local_auth(monkeypatch):
+    """Local mode with SECRET and PROJECT_KEY; returns the tokens sent to the remote check"""
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(PROJECT_KEY.public_key()))
+    jwks = auth.JWKSCache()
+    jwks.keys = {KID: jwt.PyJWK({**jwk, "kid": KID, "alg": "RS256"})}
+    jwks.fetched_at = time.monotonic()
+    remote = []
+
+    async def no_refresh():
+        pass
+
+    async def verify_remote(token):
+        remote.append(token)
+        return auth.AuthenticatedUser({"id": "remote-user", "email": "remote@example.com"}, token)
+
+    monkeypatch.setattr(jwks, "refresh", no_refresh)
+    monkeypatch.setattr(auth, "jwks_cache", jwks)
+    monkeypatch.setattr(auth, "AUTH_VERIFY_MODE", "local")
+    monkeypatch.setattr(auth, "AUTH_REMOTE_FALLBACK", True)
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(auth, "_verify_token_remote", verify_remote)
+    monkeypatch.setattr(auth, "_token_cache", TTLCache())
+    monkeypatch.setattr(auth, "_negative_token_cache", TTLCache(ttl=10))
+    monkeypatch.setattr(auth, "_token_verifications", SingleFlight())
+    return remote
+
+def authenticate(token):
+    return asyncio.run(auth.authenticate_token(token))
+
+def rejection(token):
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    return error.value.status_code
+
+@pytest.mark.parametrize("token", [hs256(), rs256()], ids=["HS256", "RS256"])
+def test_valid_token_is_verified_locally(local_auth, token):
+    user = authenticate(token)
+
+    assert user.id == "user-1" and user.email == "user@example.com"
+    assert local_auth == []
+
+def test_bad_signature_is_rejected(local_auth):
+    assert rejection(hs256(secret="another-secret-with-at-least-32-bytes")) == 401
+    assert rejection(rs256(key=rsa_key())) == 401
+    assert local_auth == []
+
+def test_unsigned_token_is_rejected(local_auth):
+    token = jwt.encode(claims(), None, algorithm="none")
+
+    assert rejection(token) == 401
+    assert local_auth == []
+
+def test_hs256_token_signed_with_the_public_key_is_rejected(local_auth):
+    # Algorithm confusion: the public key used as an HMAC secret
+    public_pem = PROJECT_KEY.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    header = {"alg": "HS256", "typ": "JWT", "kid": KID}
+    signing_input = b".".join(
+        jwt.utils.base64url_encode(json.dumps(part, separators=(",", ":")).encode()) for part in (header, claims())
+    )
+    signature = jwt.algorithms.HMACAlgorithm(jwt.algorithms.HMACAlgorithm.SHA256).sign(signing_input, public_pem)
+    token = (signing_input + b"." + jwt.utils.base64url_encode(signature)).decode()
+
+    assert rejection(token) == 401
+    assert local_auth == []
+
+@pytest.mark.parametrize("overrides", [
+    {"exp": int(time.time()) - 3600},
+    {"aud": "anon-service"},
+    {"iss": "https://attacker.example.com/auth/v1"},
+    {"sub": None},
+], ids=["expired", "audience", "issuer", "no-subject"])
+def test_bad_claims_are_rejected(local_auth, overrides):
+    assert rejection(hs256(**overrides)) == 401
+    assert local_auth == []
+
+def test_unknown_kid_falls_back_to_supabase_auth(local_auth):
+    token = rs256(key=rsa_key(), kid="rotated-key")
+
+    user = authenticate(token)
+
+    assert user.id == "remote-user"
+    assert local_auth == [token]
+
+def test_unknown_kid_without_fallback_is_unavailable(local_auth, monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_REMOTE_FALLBACK", False)
+
+    assert rejection(rs256(kid="rotated-key")) == 503
+    assert local_auth == []
+
+def test_rejected_token_is_not_verified_again(local_auth, monkeypatch):
+    token = hs256(secret="another-secret-with-at-least-32-bytes")
+    assert rejection(token) == 401
+
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", "another-secret-with-at-least-32-bytes")
+
+    assert rejection(token) == 401
@@ -0,0 +1,40 @@
+"""
+AI endpoints await Gemini without blocking the event loop.
+"""
+import time
+import asyncio
+
+from conftest import plan_json
+
+DELAY = 0.3
+REQUESTS = 6
+
+def test_concurrent_plan_requests_overlap(gemini, client):
+    backend = gemini(latency=DELAY, response_text=plan_json())
+
+    async def scenario():
+        async with client() as c:
+            async def plan(i):
+                response = await c.post("/api/generate-ai-plan", json={
+                    "planData": {"name": f"Pump {i}", "category": "Pumps"}, "bypass_cache": True,
+                })
+                assert response.status_code == 200
+                return response.json()
+
+            async def health():
+                await asyncio.sleep(DELAY / 4)  # while the plans wait on "Gemini"
+                start = time.perf_counter()
+                response = await c.get("/api/health")
+                assert response.status_code == 200
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            health_seconds, *plans = await asyncio.gather(health(), *(plan(i) for i in range(REQUESTS)))
+            return time.perf_counter() - start, health_seconds, plans
+
+    wall, health_seconds, plans = asyncio.run(scenario())
+
+    assert all(len(body["data"]) == 3 for body in plans)
+    assert backend.peak_in_flight == REQUESTS
+    assert wall < REQUESTS * DELAY / 2
+    assert health_seconds < DELAY / 2
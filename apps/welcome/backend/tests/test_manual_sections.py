@@ -0,0 +1,97 @@
+"""
+Token-budgeted manual excerpts (manual_sections).
+"""
+import time
+import asyncio
+
+import pytest
+
+import manual_sections
+from cache import TTLCache
+from conftest import plan_json
+
+FILLER = (
+    "The touchscreen supports several display languages and colour themes. Warranty claims must "
+    "be registered online within thirty days of purchase. The packaging is recyclable. "
+)
+
+def manual(pages=120, every=20):
+    parts = []
+    for number in range(1, pages + 1):
+        body = f"{number}.1 GENERAL INFORMATION\n"
+        if number % every == 0:
+            body = (
+                f"{number}.1 LUBRICATION AND INSPECTION\n"
+                f"Grease the drive-end bearing every {500 + number} operating hours. "
+                f"Torque the coupling bolts to 45 Nm and replace the filter monthly.\n\n"
+            )
+        parts.append(body + FILLER * 15)
+    return "\n\n".join(parts)
+
+@pytest.fixture(autouse=True)
+def empty_index_cache(monkeypatch):
+    monkeypatch.setattr(manual_sections, "_index_cache", TTLCache())
+
+@pytest.mark.parametrize("word", [
+    "torque", "maintenance", "service", "grease", "daily", "weekly", "monthly", "replace", "filters",
+    "bearings", "spares", "safety", "capacity", "coupling", "lubrication", "lubricate", "calibration",
+])
+def test_maintenance_vocabulary_matches_manual_words(word):
+    assert set(manual_sections.tokenize(word)) <= set(manual_sections.query_terms())
+
+def test_ordinary_short_lines_stay_in_one_section():
+    lines = ["Check oil level", "Do not overfill", "the pump runs hot", "Wipe up any spills"] * 20
+    paragraph = "\n".join(lines)
+
+    assert [section.text for section in manual_sections.split_sections(paragraph)] == [paragraph]
+
+def test_short_manuals_pass_through():
+    excerpts, usage = manual_sections.fit_manuals({"manual": "Grease monthly."}, ["Pump"], budget=100)
+    assert excerpts == {"manual": "Grease monthly."}
+    assert not usage["trimmed"]
+
+def test_long_manual_keeps_maintenance_sections_within_budget():
+    text = manual()
+    planted = [f"every {500 + n} operating hours" for n in range(20, 121, 20)]
+
+    excerpts, usage = manual_sections.fit_manuals({"manual": text}, ["Centrifugal pump", "Pumps"], budget=3000)
+
+    assert usage["trimmed"] and usage["tokens_used"] <= 3000
+    assert all(marker in excerpts["manual"] for marker in planted)
+
+def test_manual_index_is_reused_across_assets():
+    text = manual()
+    manual_sections.fit_manuals({"parent": text}, ["Pump"], budget=3000)
+    first = manual_sections._index_cache.stats()
+
+    manual_sections.fit_manuals({"parent": text}, ["Motor"], budget=3000)
+    second = manual_sections._index_cache.stats()
+
+    assert first["size"] == second["size"] == 1
+    assert second["hits"] == first["hits"] + 1
+
+def test_plan_request_fits_manuals_off_the_event_loop(monkeypatch, gemini, client):
+    gemini(latency=0, response_text=plan_json())
+    fit_manuals = manual_sections.fit_manuals
+
+    def slow_fit_manuals(*args, **kwargs):
+        time.sleep(0.3)  # a long manual being scored
+        return fit_manuals(*args, **kwargs)
+
+    monkeypatch.setattr(manual_sections, "fit_manuals", slow_fit_manuals)
+
+    async def scenario():
+        async with client() as c:
+            plan = asyncio.create_task(c.post("/api/generate-ai-plan", json={
+                "planData": {"name": "Pump", "category": "Pumps"}, "bypass_cache": True,
+            }))
+            start = time.perf_counter()
+            await asyncio.sleep(0.05)
+            health = await c.get("/api/health")
+            health_seconds = time.perf_counter() - start - 0.05
+            return (await plan).status_code, health.status_code, health_seconds
+
+    plan_status, health_status, health_seconds = asyncio.run(scenario())
+
+    assert plan_status == health_status == 200
+    assert health_seconds < 0.15
@@ -0,0 +1,92 @@
+"""
+/api/generate-parent-plan: one call vs sections generated concurrently.
+"""
+import json
+import time
+import asyncio
+
+import pytest
+
+import llm_gateway
+
+SECONDS_PER_ITEM = 0.05
+TASKS = 8
+SPARES = 8
+SUBSYSTEMS = ["Compressor", "Condenser", "Controls"]
+BASE = {"parent_asset_name": "Chiller", "parent_asset_category": "HVAC", "bypass_cache": True}
+SPARES_ONLY = 'ONLY the "critical_spares" section'
+
+class SectionBackend(llm_gateway.FakeGeminiBackend):
+    """Writes only the sections a prompt asks for, at SECONDS_PER_ITEM per item"""
+    def __init__(self):
+        super().__init__(capacity=16)
+        self.fail_spares = False
+
+    async def generate(self, prompt, model, generation_config, system_instruction):
+        await self._admit()
+        try:
+            if self.fail_spares and SPARES_ONLY in prompt:
+                raise RuntimeError("spares call failed")
+            body = {}
+            if SPARES_ONLY not in prompt:
+                subsystem = next((s for s in SUBSYSTEMS if f"the {s} subsystem ONLY" in prompt), None)
+                owners = [subsystem] if subsystem else ["System"]
+                if subsystem is None and "generated separately" not in prompt:
+                    owners += SUBSYSTEMS
+                body["maintenance_plan"] = [
+                    {"task_name": f"Chiller – Check {i} – {owner}", "maintenance_interval": 4, "instructions": ["Step 1"]}
+                    for owner in owners for i in range(TASKS // (len(SUBSYSTEMS) + 1))
+                ]
+            if 'ONLY the "maintenance_plan" section' not in prompt:
+                body["critical_spares"] = [
+                    {"part_name": f"Spare {i}", "part_number": "Not applicable", "criticality": "High"}
+                    for i in range(SPARES)
+                ]
+            await asyncio.sleep(SECONDS_PER_ITEM * sum(len(items) for items in body.values()))
+            return llm_gateway.FakeResponse(json.dumps(body))
+        finally:
+            self.in_flight -= 1
+
+def task_names(body):
+    return sorted(task["task_name"] for task in body["plan"]["maintenance_plan"])
+
+@pytest.mark.parametrize("options, items", [
+    ({"fan_out": True}, max(TASKS, SPARES)),
+    ({"fan_out": True, "subsystems": SUBSYSTEMS}, max(TASKS // (len(SUBSYSTEMS) + 1), SPARES)),
+])
+def test_fan_out_matches_single_call_in_less_time(gemini, client, options, items):
+    gemini(SectionBackend())
+
+    async def scenario():
+        async with client() as c:
+            single = await c.post("/api/generate-parent-plan", json={**BASE, "fan_out": False})
+            start = time.perf_counter()
+            fanned = await c.post("/api/generate-parent-plan", json={**BASE, **options})
+            return single.json(), fanned.json(), time.perf_counter() - start
+
+    single, fanned, elapsed = asyncio.run(scenario())
+
+    assert set(fanned) == set(single)
+    assert task_names(fanned) == task_names(single)
+    assert fanned["plan"]["critical_spares"] == single["plan"]["critical_spares"]
+    assert elapsed < items * SECONDS_PER_ITEM * 1.3
+
+def test_failed_section_is_reported_and_not_cached(gemini, client):
+    backend = gemini(SectionBackend())
+    payload = {**BASE, "bypass_cache": False, "fan_out": True}
+
+    async def scenario():
+        async with client() as c:
+            backend.fail_spares = True
+            partial = await c.post("/api/generate-parent-plan", json=payload)
+            backend.fail_spares = False
+            complete = await c.post("/api/generate-parent-plan", json=payload)
+            return partial.json(), complete.json()
+
+    partial, complete = asyncio.run(scenario())
+
+    assert partial["failed_sections"] == ["spares"]
+    assert not partial["plan"]["critical_spares"]
+    assert len(partial["plan"]["maintenance_plan"]) == TASKS
+    assert "failed_sections" not in complete
+    assert len(complete["plan"]["critical_spares"]) == SPARES
@@ -0,0 +1,132 @@
+"""
+/api/generate-ai-plan/batch: child plans of one parent, generated
+concurrently with the parent manual extracted once.
+"""
+import time
+import asyncio
+
+import pytest
+
+import main
+import llm_gateway
+import manual_context
+from cache import TTLCache
+from conftest import plan_json
+from test_plan_streaming import stream_events
+
+DELAY = 0.2
+
+@pytest.fixture
+def parent_manual(monkeypatch):
+    """Stand-in parent manual; returns the list of extractions made"""
+    extractions = []
+
+    class ManualsRepository:
+        async def first_for_parent_asset(self, parent_asset_id):
+            return {"file_path": f"{parent_asset_id}/manual.pdf", "file_type": "application/pdf", "original_name": "manual.pdf"}
+
+    async def extract_text_from_file(file_path, file_type):
+        extractions.append(file_path)
+        await asyncio.sleep(0.05)
+        return "Grease the bearings every 4 weeks. " * 50
+
+    monkeypatch.setattr(manual_context, "LoadedManualsRepository", ManualsRepository)
+    monkeypatch.setattr(manual_context.file_processor, "extract_text_from_file", extract_text_from_file)
+    monkeypatch.setattr(manual_context, "_manual_lookups", TTLCache())
+    monkeypatch.setattr(manual_context, "_manual_texts", TTLCache())
+    return extractions
+
+class FailingChildBackend(llm_gateway.FakeGeminiBackend):
+    """Fails the prompt for one child with a non-retryable error"""
+    async def generate(self, prompt, model, generation_config, system_instruction):
+        if "Child 1\n" in str(prompt):
+            raise ValueError("bad request")
+        return await super().generate(prompt, model, generation_config, system_instruction)
+
+def child_plans(count):
+    return [{"name": f"Child {i}", "category": "Pumps", "parent_asset_id": "parent-1", "child_asset_id": f"child-{i}"}
+            for i in range(count)]
+
+def test_batch_generates_concurrently_and_extracts_manual_once(app, gemini, parent_manual):
+    children = main.AI_PLAN_BATCH_PARALLELISM
+    backend = gemini(latency=DELAY, response_text=plan_json())
+
+    async def scenario():
+        start = time.perf_counter()
+        events = await stream_events(app, "/api/generate-ai-plan/batch", {
+            "parent_asset_id": "parent-1", "plans": child_plans(children), "bypass_cache": True,
+        })
+        return time.perf_counter() - start, events
+
+    elapsed, events = asyncio.run(scenario())
+
+    items = [data for _, name, data in events if name == "plan"]
+    assert sorted(item["index"] for item in items) == list(range(children))
+    assert all(item["success"] and len(item["data"]) == 3 for item in items)
+    assert events[-1][1] == "done" and events[-1][2]["succeeded"] == children
+    assert parent_manual == ["parent-1/manual.pdf"]
+    assert backend.peak_in_flight == children
+    assert elapsed < children * DELAY / 2
+
+def test_failed_plan_does_not_fail_the_batch(app, gemini, parent_manual):
+    gemini(FailingChildBackend(latency=0, capacity=64, response_text=plan_json()))
+
+    events = asyncio.run(stream_events(app, "/api/generate-ai-plan/batch", {
+        "parent_asset_id": "parent-1", "plans": child_plans(3), "bypass_cache": True,
+    }))
+
+    items = {data["index"]: data for _, name, data in events if name == "plan"}
+    assert [items[i]["success"] for i in range(3)] == [True, False, True]
+    assert items[1]["status_code"] >= 500
+    assert events[-1][2]["failed"] == 1
+
+@pytest.mark.parametrize("batch_parent, plan_parents", [
+    ("parent-1", ["parent-1", "parent-2"]),
+    (None, ["parent-1", None, "parent-2"]),
+])
+def test_batch_rejects_plans_of_another_parent(client, batch_parent, plan_parents):
+    plans = [{"name": f"Child {i}", "category": "Pumps", "parent_asset_id": parent} for i, parent in enumerate(plan_parents)]
+
+    async def scenario():
+        async with client() as c:
+            return await c.post("/api/generate-ai-plan/batch", json={"parent_asset_id": batch_parent, "plans": plans})
+
+    response = asyncio.run(scenario())
+
+    assert response.status_code == 422
+    assert "parent_asset_id" in response.text
+
+def test_abandoned_batch_cancels_pending_generations(gemini, parent_manual):
+    backend = gemini(latency=DELAY, response_text=plan_json())
+    request = main.BatchAIPlanRequest(parent_asset_id="parent-1", plans=child_plans(3), max_parallel=1)
+
+    async def scenario():
+        batch = main._iter_ai_plan_batch(request)
+        first = await batch.__anext__()
+        await asyncio.sleep(DELAY / 4)  # the second plan is now at "Gemini"
+        assert backend.in_flight == 1
+        await batch.aclose()
+        await asyncio.sleep(0.05)
+        # Checked before asyncio.run() cancels whatever is left over
+        return first, backend.in_flight
+
+    first, in_flight = asyncio.run(scenario())
+
+    assert first["success"]
+    assert in_flight == 0
+    assert backend.calls == 2
+
+def test_manual_refresh_is_per_parent_for_users(client, parent_manual):
+    manual_context._manual_lookups.set("parent-1", {"file_path": "parent-1/manual.pdf"})
+    manual_context._manual_lookups.set("parent-2", {"file_path": "parent-2/manual.pdf"})
+
+    async def scenario():
+        async with client() as c:
+            missing = await c.post("/api/manuals/refresh")
+            blank = await c.post("/api/manuals/refresh", params={"parent_asset_id": " "})
+            one = await c.post("/api/manuals/refresh", params={"parent_asset_id": "parent-1"})
+            return missing.status_code, blank.status_code, one.status_code
+
+    assert asyncio.run(scenario()) == (422, 400, 200)
+    assert manual_context._manual_lookups.get("parent-1") is None
+    assert manual_context._manual_lookups.get("parent-2") is not None
@@ -0,0 +1,160 @@
+"""
+Speculative plans for suggested child assets (plan_prefetch).
+"""
+import json
+import time
+import asyncio
+import contextlib
+
+import main
+import llm_gateway
+import plan_prefetch
+from conftest import FakeUser, plan_json
+
+DELAY = 0.3
+
+class SuggestionAwareBackend(llm_gateway.FakeGeminiBackend):
+    """Answers child-asset prompts with suggestions and everything else with a plan"""
+    async def generate(self, prompt, model, generation_config, system_instruction):
+        response = await super().generate(prompt, model, generation_config, system_instruction)
+        if "child assets" in str(prompt):
+            response.text = json.dumps({"child_assets": [
+                {"name": f"Component {i}", "model": "Standard", "category": "Pumps", "criticality_level": "High"}
+                for i in range(3)
+            ]})
+        return response
+
+async def suggest(c):
+    response = await c.post("/api/suggest-child-assets", json={
+        "parent_asset_name": "Cooling skid", "parent_asset_category": "Pumps",
+        "prefetch_plans": True, "bypass_cache": True,
+    })
+    assert response.status_code == 200
+    return response.json()["suggestions"]["child_assets"]
+
+async def accept(c, child, **details):
+    start = time.perf_counter()
+    response = await c.post("/api/generate-ai-plan", json={
+        "planData": {"name": child["name"], "category": child["category"], "model": child["model"], **details},
+        "prefetch_id": child["prefetch_id"],
+    })
+    assert response.status_code == 200
+    return time.perf_counter() - start, response.json()
+
+def test_accepted_suggestion_is_served_from_its_prefetch(gemini, client):
+    gemini(SuggestionAwareBackend(latency=DELAY, capacity=64, response_text=plan_json()))
+
+    async def scenario():
+        async with client() as c:
+            children = await suggest(c)
+            await asyncio.sleep(DELAY * 1.5)  # the user reviews the list
+            return await accept(c, children[0])
+
+    elapsed, body = asyncio.run(scenario())
+
+    assert elapsed < DELAY / 2
+    assert len(body["data"]) == 3 and body["data"][0]["asset_name"] == "Component 0"
+    assert plan_prefetch.get_prefetch_stats()["claimed"] == 1
+
+def test_request_with_new_details_is_not_served_the_prefetch(gemini, client):
+    gemini(SuggestionAwareBackend(latency=DELAY, capacity=64, response_text=plan_json()))
+
+    async def scenario():
+        async with client() as c:
+            children = await suggest(c)
+            await asyncio.sleep(DELAY * 1.5)
+            return await accept(c, children[0], hours="12000", date_of_plan_start="2026-03-01")
+
+    elapsed, _ = asyncio.run(scenario())
+
+    assert elapsed >= DELAY
+    stats = plan_prefetch.get_prefetch_stats()
+    assert stats["mismatched"] == 1 and stats["claimed"] == 0
+
+def test_cancelled_prefetches_release_their_gateway_slots(gemini):
+    gemini(latency=2, response_text=plan_json())
+    limit = plan_prefetch.PLAN_PREFETCH_CONCURRENCY
+
+    async def scenario():
+        plans = [{"name": f"Pump {i}", "category": "Pumps"} for i in range(2 * limit)]
+        first = plan_prefetch.submit(FakeUser.id, plans[:limit])
+        await asyncio.sleep(0.1)
+        for prefetch_id in first:
+            assert plan_prefetch.cancel(prefetch_id, FakeUser.id)
+        plan_prefetch.submit(FakeUser.id, plans[limit:])
+        await asyncio.sleep(0.1)
+        stats = llm_gateway.gateway.limiter(main.AI_PLAN_MODEL).stats()
+        await plan_prefetch.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+
+    assert stats["background_in_flight"] == limit
+
+@contextlib.asynccontextmanager
+async def interactive_traffic(workers):
+    """Keep `workers` interactive Gemini calls running or queued until the block ends"""
+    stop = asyncio.Event()
+
+    async def worker(i):
+        n = 0
+        while not stop.is_set():
+            n += 1
+            await llm_gateway.generate(f"interactive {i}/{n}", model=main.AI_PLAN_MODEL)
+
+    tasks = [asyncio.create_task(worker(i)) for i in range(workers)]
+    await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def test_claiming_a_prefetch_queued_for_gemini_does_not_stall(gemini, client):
+    gemini(latency=DELAY, response_text=plan_json())
+    workers = 2 * llm_gateway.LLM_MAX_CONCURRENCY  # a full gateway and a full queue behind it
+
+    async def scenario():
+        async with interactive_traffic(workers):
+            [prefetch_id] = plan_prefetch.submit(FakeUser.id, [{"name": "Pump", "category": "Pumps"}])
+            await asyncio.sleep(DELAY / 2)
+            queued = plan_prefetch.get_prefetch_stats()["queued"]
+            async with client() as c:
+                start = time.perf_counter()
+                response = await asyncio.wait_for(c.post("/api/generate-ai-plan", json={
+                    "planData": {"name": "Pump", "category": "Pumps"}, "prefetch_id": prefetch_id,
+                }), timeout=10 * DELAY)
+                return queued, time.perf_counter() - start, response.status_code
+
+    queued, elapsed, status = asyncio.run(scenario())
+
+    assert queued == 1  # holding a prefetch slot, waiting for Gemini
+    assert status == 200
+    # One turn of the interactive queue ahead of it, then its own call
+    assert elapsed < 4 * DELAY
+    assert plan_prefetch.get_prefetch_stats()["claimed"] == 1
+
+def test_interactive_caller_joining_a_background_call_promotes_it(gemini):
+    gemini(latency=DELAY, response_text=plan_json())
+    workers = 2 * llm_gateway.LLM_MAX_CONCURRENCY
+
+    async def background():
+        with llm_gateway.background_priority():
+            return await llm_gateway.generate("shared prompt", model=main.AI_PLAN_MODEL)
+
+    async def scenario():
+        async with interactive_traffic(workers):
+            speculative = asyncio.create_task(background())
+            await asyncio.sleep(DELAY / 2)
+            start = time.perf_counter()
+            await asyncio.wait_for(llm_gateway.generate("shared prompt", model=main.AI_PLAN_MODEL), timeout=10 * DELAY)
+            elapsed = time.perf_counter() - start
+            await speculative
+            return elapsed, llm_gateway.gateway.limiter(main.AI_PLAN_MODEL).stats()
+
+    elapsed, stats = asyncio.run(scenario())
+
+    assert elapsed < 4 * DELAY
+    assert stats["promoted"] == 1
@@ -0,0 +1,87 @@
+"""
+/api/generate-ai-plan/stream: tasks as Server-Sent Events, then the
+non-streaming body in the "done" event.
+"""
+import json
+import time
+import asyncio
+
+from conftest import plan_json
+
+DELAY = 0.4
+TASKS = 8
+PAYLOAD = {"planData": {"name": "Pump", "category": "Pumps"}, "bypass_cache": True}
+
+async def stream_events(app, path, payload):
+    """
+    POST to the ASGI app directly and timestamp each event as its chunk is
+    sent (httpx's ASGITransport buffers the whole response).
+    """
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"host", b"test")],
+        "client": ("127.0.0.1", 1234), "server": ("test", 80),
+    }
+    received = False
+    events, pending = [], ""
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # no disconnect
+
+    async def send(message):
+        nonlocal pending
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+        if message["type"] == "http.response.body":
+            pending += message.get("body", b"").decode()
+            while "\n\n" in pending:
+                block, pending = pending.split("\n\n", 1)
+                fields = dict(line.split(": ", 1) for line in block.splitlines())
+                events.append((time.perf_counter(), fields["event"], json.loads(fields["data"])))
+
+    await app(scope, receive, send)
+    return events
+
+def test_stream_sends_tasks_early_and_done_matches_plain_response(app, gemini, client):
+    gemini(latency=DELAY, response_text=plan_json(TASKS))
+
+    async def scenario():
+        async with client() as c:
+            response = await c.post("/api/generate-ai-plan", json=PAYLOAD)
+            assert response.status_code == 200
+        start = time.perf_counter()
+        events = await stream_events(app, "/api/generate-ai-plan/stream", PAYLOAD)
+        return response.json(), start, events
+
+    body, start, events = asyncio.run(scenario())
+
+    names = [name for _, name, _ in events]
+    assert names == ["task"] * TASKS + ["done"]
+    first_task_at = events[0][0] - start
+    assert first_task_at < DELAY / 2
+    done = events[-1][2]
+    assert done["result"] == body
+    assert [data for _, name, data in events if name == "task"] == body["data"]
+
+def test_stream_replays_cached_plan(app, gemini, client):
+    gemini(latency=DELAY, response_text=plan_json(TASKS))
+    payload = {**PAYLOAD, "bypass_cache": False}
+
+    async def scenario():
+        async with client() as c:
+            assert (await c.post("/api/generate-ai-plan", json=payload)).status_code == 200
+        start = time.perf_counter()
+        events = await stream_events(app, "/api/generate-ai-plan/stream", payload)
+        return time.perf_counter() - start, events
+
+    elapsed, events = asyncio.run(scenario())
+
+    assert elapsed < DELAY / 2
+    assert events[-1][1] == "done" and events[-1][2]["cached"]
+    assert len(events) == TASKS + 1
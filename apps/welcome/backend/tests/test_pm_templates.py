@@ -0,0 +1,110 @@
+"""
+PM plans from the template library (pm_templates) on /api/generate-ai-plan.
+"""
+import asyncio
+from datetime import date
+
+import pytest
+
+import pm_templates
+from conftest import plan_json
+
+TASKS = [
+    ("Oil Change", "Quarterly", 90),
+    ("Inspect drive belts", "Monthly", 45),
+    ("Replace air filter", "Semi-Annually", "30"),
+    ("Check controller alarms", "Annually", None),
+]
+
+def rows(plans=3):
+    for plan in range(plans):
+        asset = f"GA37 Unit {plan}"
+        for name, interval, minutes in TASKS:
+            yield {
+                "task_name": f"{asset} – {name}", "maintenance_interval": interval, "est_minutes": minutes,
+                "no_techs_needed": "2", "reason": f"Keeps the {asset} running",
+                "instructions": [f"Isolate the {asset}", f"{name}"] + ["Record the result"] * plan,
+                "pm_plans": {"id": plan, "eq_category": "Compressors", "asset_name": asset, "asset_model": "GA37"},
+            }
+
+@pytest.fixture
+def library(monkeypatch):
+    library = pm_templates.build_library(rows(), source="test")
+    monkeypatch.setattr(pm_templates, "_library", library)
+    return library
+
+def test_library_clusters_tasks_across_plans(library):
+    templates = library.categories["compressor"]
+
+    assert library.names == {"compressor": "Compressors"}
+    assert len(templates) == len(TASKS)
+    assert all(template.support == 3 for template in templates)
+    assert all("GA37 Unit" not in template.fields["task_name"] for template in templates)
+
+def test_instantiated_tasks_look_like_ai_tasks(library):
+    tasks = pm_templates.instantiate(library, "Compressor", "Pump Room Compressor", "ZR90", date_of_plan_start="2026-03-01")
+    by_interval = {task["maintenance_interval"]: task for task in tasks}
+
+    assert all(task["task_name"].startswith("Pump Room Compressor") for task in tasks)
+    assert by_interval["Monthly"]["scheduled_dates"][:3] == ["2026-03-01", "2026-04-01", "2026-05-01"]
+    assert len(by_interval["Monthly"]["scheduled_dates"]) == 12
+    assert by_interval["Quarterly"]["scheduled_dates"] == ["2026-03-01", "2026-06-01", "2026-09-01", "2026-12-01"]
+    assert by_interval["Quarterly"]["time_to_complete"] == "1 hour 30 minutes"
+    assert by_interval["Semi-Annually"]["time_to_complete"] == "30 minutes"
+    assert by_interval["Annually"]["time_to_complete"] == "Not specified"
+    assert all(task["number_of_technicians"] == 2 for task in tasks)
+
+def test_harsh_high_hour_asset_gets_shorter_wear_intervals(library):
+    mild = pm_templates.instantiate(library, "Compressors", "C1", environment="Clean indoor room", hours="100")
+    harsh = pm_templates.instantiate(library, "Compressors", "C1", environment="Dusty outdoor yard", hours="30000")
+    weeks = lambda tasks: {t["task_name"]: pm_templates.interval_weeks(t["maintenance_interval"]) for t in tasks}
+
+    mild_weeks, harsh_weeks = weeks(mild), weeks(harsh)
+    assert harsh_weeks["C1 – Inspect drive belts"] < mild_weeks["C1 – Inspect drive belts"]
+    assert harsh_weeks["C1 – Check controller alarms"] == mild_weeks["C1 – Check controller alarms"]
+
+@pytest.mark.parametrize("interval, weeks", [
+    ("Monthly", 4.33),
+    ("Every 2 weeks", 2),
+    ("500 hours", 12.5),
+    ("1000 hours or 6 months, whichever comes first", 25),
+    ("10,000 hours or annually", 52),
+    ("Upon Installation", None),
+])
+def test_schedule_weeks(interval, weeks):
+    expected = pytest.approx(weeks) if weeks is not None else None
+    assert pm_templates.schedule_weeks(interval) == expected
+
+def test_one_off_task_is_scheduled_on_the_start_date():
+    assert pm_templates.scheduled_dates("Upon Installation", date(2026, 1, 31)) == ["2026-01-31"]
+    assert pm_templates.scheduled_dates("Monthly", date(2026, 1, 31))[:2] == ["2026-01-31", "2026-02-28"]
+
+@pytest.mark.parametrize("value, label", [
+    (45, "45 minutes"), ("60", "1 hour"), (150, "2 hours 30 minutes"),
+    ("1.5 hours", "1.5 hours"), (None, None), ("", None),
+])
+def test_duration_label(value, label):
+    assert pm_templates.duration_label(value) == label
+
+def test_endpoint_serves_templates_and_falls_back_to_ai(library, gemini, client):
+    backend = gemini(latency=0, response_text=plan_json())
+
+    async def scenario():
+        async with client() as c:
+            responses = []
+            for category in ("Compressors", "Particle Accelerators"):
+                response = await c.post("/api/generate-ai-plan", json={
+                    "planData": {"name": "Atlas GA37", "model": "GA37", "category": category, "date_of_plan_start": "2026-03-01"},
+                    "use_template": True,
+                })
+                assert response.status_code == 200
+                responses.append(response.json())
+            return responses
+
+    templated, fallback = asyncio.run(scenario())
+
+    assert templated["source"] == "template"
+    assert len(templated["data"]) == len(TASKS)
+    assert all(task["scheduled_dates"][0] == "2026-03-01" for task in templated["data"])
+    assert fallback["source"] == "ai"
+    assert backend.calls == 1
@@ -0,0 +1,59 @@
+"""
+Per-request step timing for endpoints that fan out independent queries
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, List
+
+class StepTimer:
+    """
+    Runs the steps of one request, concurrently where they don't depend on
+    each other, and records how long each took.
+
+        timer = StepTimer("send_invitation")
+        site_task = timer.start("site", sites.get(site_id))
+        user = await timer.run("user", users.find_by_email(email))
+        site = await site_task
+        ...
+        finally:
+            timer.close()
+            logger.info(timer.summary())
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.steps: Dict[str, float] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._started = time.perf_counter()
+
+    async def _timed(self, step: str, awaitable: Awaitable[Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.steps[step] = (time.perf_counter() - start) * 1000
+
+    def start(self, step: str, awaitable: Awaitable[Any]) -> "asyncio.Task[Any]":
+        """Start a step in the background; await the returned task when its result is needed"""
+        task = asyncio.ensure_future(self._timed(step, awaitable))
+        self._tasks.append(task)
+        return task
+
+    async def run(self, step: str, awaitable: Awaitable[Any]) -> Any:
+        """Run a step inline"""
+        return await self._timed(step, awaitable)
+
+    def close(self) -> None:
+        """Cancel steps nobody awaited (e.g. after an early 4xx)"""
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # mark retrieved
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def summary(self) -> str:
+        steps = ", ".join(f"{step} {ms:.0f} ms" for step, ms in self.steps.items())
+        return f"⏱️ {self.name}: {self.total_ms:.0f} ms total ({steps or 'no steps'})"
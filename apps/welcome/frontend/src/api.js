@@ -1730,7 +1730,20 @@ export const acceptInvitation = async (token) => {
       .eq('token', token);
     
     if (updateError) throw updateError;
-    
+
+    // Let the backend drop its cached site roles for this user so the new site is usable right away
+    try {
+      const { data: { session } } = await supabase.auth.getSession();
+      if (session) {
+        await fetch(`${BACKEND_URL}/api/memberships/refresh`, {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${session.access_token}` }
+        });
+      }
+    } catch (refreshError) {
+      console.warn('⚠️ Could not refresh cached memberships:', refreshError);
+    }
+
     console.log('✅ Invitation accepted successfully');
     return invitation;
   } catch (error) {
@@ -0,0 +1,124 @@
+-- Transactional RPCs for the backend's multi-table write paths.
+--
+-- capture_lead_with_plan: pm_leads -> pm_plans -> pm_tasks (-> access_requests)
+--   used by POST /api/lead-capture
+-- approve_access_request: users + company_users + access_requests status
+--   used by POST /api/approve-access (after the auth user is created)
+--
+-- Each function runs in a single transaction, so a failure at any step rolls
+-- back every row it wrote. Only the service role may call them.
+
+create or replace function public.capture_lead_with_plan(
+    p_lead jsonb,
+    p_plan jsonb,
+    p_tasks jsonb default '[]'::jsonb,
+    p_access_request jsonb default null
+)
+returns jsonb
+language plpgsql
+set search_path = public
+as $$
+declare
+    v_lead pm_leads;
+    v_plan pm_plans;
+    v_access access_requests;
+    v_task_count integer := 0;
+begin
+    insert into pm_leads (email, notes, submitted_at)
+    select email, notes, coalesce(submitted_at, now())
+    from jsonb_populate_record(null::pm_leads, p_lead)
+    returning * into v_lead;
+
+    insert into pm_plans (
+        lead_id, plan_start_date, asset_name, asset_model, serial_no, eq_category,
+        op_hours, env_desc, additional_context, status, version
+    )
+    select
+        v_lead.id, plan_start_date, asset_name, asset_model, serial_no, eq_category,
+        op_hours, env_desc, additional_context, coalesce(status, 'draft'), coalesce(version, 1)
+    from jsonb_populate_record(null::pm_plans, p_plan)
+    returning * into v_plan;
+
+    insert into pm_tasks (
+        pm_plan_id, task_name, maintenance_interval, instructions, reason,
+        engineering_rationale, safety_precautions, common_failures_prevented,
+        usage_insights, est_minutes, tools_needed, no_techs_needed, consumables,
+        status, criticality
+    )
+    select
+        v_plan.id, task_name, maintenance_interval, instructions, reason,
+        engineering_rationale, safety_precautions, common_failures_prevented,
+        usage_insights, est_minutes, tools_needed, no_techs_needed, consumables,
+        coalesce(status, 'draft'), criticality
+    from jsonb_populate_recordset(null::pm_tasks, coalesce(p_tasks, '[]'::jsonb));
+    get diagnostics v_task_count = row_count;
+
+    -- One pending access request per email
+    if p_access_request is not null and not exists (
+        select 1 from access_requests
+        where email = p_access_request->>'email' and status = 'pending'
+    ) then
+        insert into access_requests (email, full_name, lead_id, status)
+        values (p_access_request->>'email', p_access_request->>'full_name', v_lead.id, 'pending')
+        returning * into v_access;
+    end if;
+
+    return jsonb_build_object(
+        'lead', to_jsonb(v_lead),
+        'plan', to_jsonb(v_plan),
+        'task_count', v_task_count,
+        'access_request', case when v_access.id is null then null else to_jsonb(v_access) end
+    );
+end;
+$$;
+
+create or replace function public.approve_access_request(
+    p_request_id uuid,
+    p_user_id uuid,
+    p_company_id uuid,
+    p_role_id uuid,
+    p_approved_by uuid,
+    p_notes text default null
+)
+returns jsonb
+language plpgsql
+set search_path = public
+as $$
+declare
+    v_request access_requests;
+begin
+    -- Lock the request so two approvals cannot both go through
+    select * into v_request
+    from access_requests
+    where id = p_request_id and status = 'pending'
+    for update;
+
+    if not found then
+        raise exception 'Access request % not found or already processed', p_request_id
+            using errcode = 'P0002';
+    end if;
+
+    insert into users (id, email, full_name)
+    values (p_user_id, v_request.email, v_request.full_name);
+
+    insert into company_users (user_id, company_id, role_id)
+    values (p_user_id, p_company_id, p_role_id);
+
+    update access_requests
+    set status = 'approved',
+        approved_at = now(),
+        approved_by = p_approved_by,
+        assigned_company_id = p_company_id,
+        assigned_role_id = p_role_id,
+        notes = p_notes
+    where id = p_request_id
+    returning * into v_request;
+
+    return to_jsonb(v_request);
+end;
+$$;
+
+revoke all on function public.capture_lead_with_plan(jsonb, jsonb, jsonb, jsonb) from public, anon, authenticated;
+revoke all on function public.approve_access_request(uuid, uuid, uuid, uuid, uuid, text) from public, anon, authenticated;
+grant execute on function public.capture_lead_with_plan(jsonb, jsonb, jsonb, jsonb) to service_role;
+grant execute on function public.approve_access_request(uuid, uuid, uuid, uuid, uuid, text) to service_role;